@@ -1,25 +1,143 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+import pytz
+from collections import defaultdict
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from ...database import get_db
-from ... import models, schemas
+from ...database import get_db, get_read_db
+from ... import models
+from ...config import settings
+from ...utils import rollups
+from ...utils.access import require_staff
+from ...utils.analytics_engine import DIMENSIONS, analytics_engine
+from ...utils.instrumentation import InstrumentedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute, dependencies=[Depends(require_staff)])
 
+DEFAULT_RANGE_DAYS = 30
+
+
+def _localize(moment: Optional[datetime]) -> Optional[datetime]:
+    # Dates without an offset are restaurant time, like the rollup buckets
+    if moment is None or moment.tzinfo is not None:
+        return moment
+    return pytz.timezone(settings.RESTAURANT_TIMEZONE).localize(moment)
+
+
+def _date_range(date_from: Optional[datetime], date_to: Optional[datetime]):
+    date_to = _localize(date_to) or datetime.now(pytz.utc)
+    date_from = _localize(date_from) or date_to - timedelta(days=DEFAULT_RANGE_DAYS)
+    if date_from >= date_to:
+        raise HTTPException(status_code=400, detail="date_from must be before date_to")
+    return date_from, date_to
+
+
+# All analytics endpoints read the pre-aggregated rollups only, so their cost
+# depends on the number of buckets in the range, not on the size of history.
 
 @router.get("/analytics/orders/", response_model=dict)
-async def get_orders_analytics(db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
+async def get_orders_analytics(
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    date_from, date_to = _date_range(date_from, date_to)
+    rows = await rollups.read_buckets(db, models.OrderRollup, granularity, date_from, date_to)
+
+    buckets = defaultdict(dict)
+    totals = defaultdict(int)
+    for row in rows:
+        buckets[row.bucket_start][row.status.value] = row.order_count
+        totals[row.status.value] += row.order_count
+    return {
+        "granularity": granularity,
+        "date_from": date_from,
+        "date_to": date_to,
+        "totals": {**totals, "all": sum(totals.values())},
+        "buckets": [
+            {"bucket_start": bucket_start, "orders": counts, "total": sum(counts.values())}
+            for bucket_start, counts in buckets.items()
+        ],
+    }
 
 
 @router.get("/analytics/users/", response_model=dict)
-async def get_users_analytics(db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
+async def get_users_analytics(
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    date_from, date_to = _date_range(date_from, date_to)
+    rows = await rollups.read_buckets(db, models.UserRollup, granularity, date_from, date_to)
+
+    buckets = [
+        {"bucket_start": row.bucket_start, **{name: getattr(row, name) for name in rollups.USER_MEASURES}}
+        for row in rows
+    ]
+    return {
+        "granularity": granularity,
+        "date_from": date_from,
+        "date_to": date_to,
+        "totals": {name: sum(bucket[name] for bucket in buckets) for name in rollups.USER_MEASURES},
+        "buckets": buckets,
+    }
 
 
 @router.get("/analytics/revenue/", response_model=dict)
-async def get_revenue_analytics(db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
\ No newline at end of file
+async def get_revenue_analytics(
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    date_from, date_to = _date_range(date_from, date_to)
+    rows = await rollups.read_buckets(db, models.OrderRollup, granularity, date_from, date_to)
+
+    measures = ("order_count",) + rollups.ORDER_MEASURES
+    buckets = defaultdict(lambda: {"order_count": 0, **dict.fromkeys(rollups.ORDER_MEASURES, 0.0)})
+    for row in rows:
+        if row.status in rollups.NON_REVENUE_STATUSES:
+            continue
+        bucket = buckets[row.bucket_start]
+        bucket["order_count"] += row.order_count
+        for name in rollups.ORDER_MEASURES:
+            bucket[name] += float(getattr(row, name))
+    return {
+        "granularity": granularity,
+        "date_from": date_from,
+        "date_to": date_to,
+        "totals": {name: round(sum(bucket[name] for bucket in buckets.values()), 2) for name in measures},
+        "buckets": [{"bucket_start": bucket_start, **bucket} for bucket_start, bucket in buckets.items()],
+    }
+
+
+@router.get("/analytics/slice/", response_model=dict)
+async def get_revenue_slice(
+    dimensions: str = Query("", description="Comma separated, e.g. hour,weekday,category_id"),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    order_type: Optional[List[str]] = Query(None),
+    payment_method: Optional[List[str]] = Query(None),
+    category_id: Optional[List[int]] = Query(None),
+    include_cancelled: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    # Ad-hoc slicing runs on the in-memory columnar engine, not on SQL
+    names = [name.strip() for name in dimensions.split(",") if name.strip()]
+    unknown = set(names) - set(DIMENSIONS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown dimensions: {', '.join(sorted(unknown))}")
+
+    await analytics_engine.sync(db)
+    rows = analytics_engine.group_by(
+        names,
+        date_from=_localize(date_from),
+        date_to=_localize(date_to),
+        include_cancelled=include_cancelled,
+        order_type=order_type,
+        payment_method=payment_method,
+        category_id=category_id,
+    )
+    return {"dimensions": names, "rows": rows}
@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ...database import get_db
+from ... import models, schemas
+from ...utils.access import require_staff
+from ...utils.bonus_rules import ORDER_PROGRAM_TYPES, bonus_rules
+from ...utils.instrumentation import InstrumentedRoute
+
+router = APIRouter(route_class=InstrumentedRoute)
+
+PROGRAM_TYPES = (*ORDER_PROGRAM_TYPES, "registration", "referral")
+
+
+@router.get("/bonus/programs/", response_model=List[schemas.BonusProgram])
+async def get_bonus_programs(db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(models.BonusProgram).order_by(models.BonusProgram.id))
+    return result.scalars().all()
+
+
+@router.post("/bonus/programs/", response_model=schemas.BonusProgram, dependencies=[Depends(require_staff)])
+async def create_bonus_program(program: schemas.BonusProgramCreate, db: AsyncSession = Depends(get_db)):
+    if program.type not in PROGRAM_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown bonus program type: {program.type}")
+    db_program = models.BonusProgram(**program.model_dump())
+    db.add(db_program)
+    await db.commit()
+    await db.refresh(db_program)
+    bonus_rules.invalidate()
+    return db_program
+
+
+@router.put("/bonus/programs/{program_id}", response_model=schemas.BonusProgram, dependencies=[Depends(require_staff)])
+async def update_bonus_program(program_id: int, program: schemas.BonusProgramUpdate, db: AsyncSession = Depends(get_db)):
+    db_program = await db.get(models.BonusProgram, program_id)
+    if db_program is None:
+        raise HTTPException(status_code=404, detail="Bonus program not found")
+    for field, value in program.model_dump(exclude_unset=True).items():
+        setattr(db_program, field, value)
+    await db.commit()
+    await db.refresh(db_program)
+    bonus_rules.invalidate()
+    return db_program
+
+
+@router.get("/bonus/evaluate/", response_model=List[schemas.BonusEvaluation])
+async def evaluate_bonus(amount: float = Query(..., ge=0), db: AsyncSession = Depends(get_db)):
+    # What an order of this amount would earn, e.g. for the checkout screen
+    rules = (await bonus_rules.get(db)).data
+    return [
+        schemas.BonusEvaluation(program_id=program_id, amount=bonus)
+        for program_id, bonus in rules.evaluate(amount)
+    ]
@@ -1,16 +1,62 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from dataclasses import asdict
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from typing import List
 from sqlalchemy.ext.asyncio import AsyncSession
 from ...database import get_db
 from ... import models, schemas
+from ...schemas.delivery import check_zone_bounds
+from ...utils.access import require_staff
+from ...utils.delivery_zones import delivery_zone_cache
+from ...utils.etag import json_response
+from ...utils.instrumentation import InstrumentedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
 
 
 @router.get("/delivery/zones/", response_model=List[schemas.DeliveryZone])
-async def get_delivery_zones(db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
+async def get_delivery_zones(request: Request, db: AsyncSession = Depends(get_db)):
+    snapshot = await delivery_zone_cache.get(db)
+    return json_response(request, snapshot.data.zones_json, snapshot.data.zones_etag)
+
+
+@router.post("/delivery/zones/", response_model=schemas.DeliveryZone, dependencies=[Depends(require_staff)])
+async def create_delivery_zone(zone: schemas.DeliveryZoneCreate, db: AsyncSession = Depends(get_db)):
+    db_zone = models.DeliveryZone(**zone.model_dump())
+    db.add(db_zone)
+    await db.commit()
+    await db.refresh(db_zone)
+    delivery_zone_cache.invalidate()
+    return db_zone
+
+
+@router.put("/delivery/zones/{zone_id}", response_model=schemas.DeliveryZone, dependencies=[Depends(require_staff)])
+async def update_delivery_zone(zone_id: int, zone: schemas.DeliveryZoneUpdate, db: AsyncSession = Depends(get_db)):
+    db_zone = await db.get(models.DeliveryZone, zone_id)
+    if db_zone is None:
+        raise HTTPException(status_code=404, detail="Delivery zone not found")
+    for field, value in zone.model_dump(exclude_unset=True).items():
+        setattr(db_zone, field, value)
+    try:
+        check_zone_bounds(db_zone)  # A single bound sent must still fit the stored other one
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await db.commit()
+    await db.refresh(db_zone)
+    delivery_zone_cache.invalidate()
+    return db_zone
+
+
+@router.post("/delivery/zones/{zone_id}/costs/", response_model=schemas.DeliveryCost, dependencies=[Depends(require_staff)])
+async def create_delivery_cost(zone_id: int, cost: schemas.DeliveryCostCreate, db: AsyncSession = Depends(get_db)):
+    if await db.get(models.DeliveryZone, zone_id) is None:
+        raise HTTPException(status_code=404, detail="Delivery zone not found")
+    db_cost = models.DeliveryCost(zone_id=zone_id, **cost.model_dump())
+    db.add(db_cost)
+    await db.commit()
+    await db.refresh(db_cost)
+    delivery_zone_cache.invalidate()
+    return db_cost
 
 
 @router.get("/delivery/calculate/", response_model=dict)
@@ -20,5 +66,24 @@ async def calculate_delivery_cost(
     order_amount: float = 0,
     db: AsyncSession = Depends(get_db)
 ):
-    # Implementation will go here
-    pass
\ No newline at end of file
+    snapshot = await delivery_zone_cache.get(db)
+    return asdict(snapshot.data.index.quote(lat, lon, order_amount))
+
+
+@router.post("/delivery/calculate/batch/", response_model=dict)
+async def calculate_delivery_cost_batch(batch: schemas.DeliveryQuoteBatchRequest, db: AsyncSession = Depends(get_db)):
+    order_amount = batch.order_amount if batch.order_amount is not None else [0.0] * len(batch.lat)
+    if not len(batch.lat) == len(batch.lon) == len(order_amount):
+        raise HTTPException(status_code=400, detail="lat, lon and order_amount must have the same length")
+
+    snapshot = await delivery_zone_cache.get(db)
+    quotes = snapshot.data.index.quote_many(batch.lat, batch.lon, order_amount)
+    # Columnar response encoded directly; NaN / -1 markers become nulls
+    body = {
+        "is_available": quotes.is_available.tolist(),
+        "zone_id": [None if zone_id < 0 else zone_id for zone_id in quotes.zone_id.tolist()],
+        "distance_km": quotes.distance_km.tolist(),
+        "delivery_cost": [None if cost != cost else cost for cost in quotes.delivery_cost.tolist()],
+        "min_order_amount": [None if amount != amount else amount for amount in quotes.min_order_amount.tolist()],
+    }
+    return Response(content=json.dumps(body, separators=(",", ":")), media_type="application/json")
@@ -1,31 +1,76 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from typing import List
 from sqlalchemy.ext.asyncio import AsyncSession
 from ...database import get_db
 from ... import models, schemas
+from ...utils.access import require_staff
+from ...utils.etag import json_response
+from ...utils.instrumentation import InstrumentedRoute
+from ...utils.menu_cache import menu_cache
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
+
+
+@router.get("/menu/", response_model=List[schemas.MenuCategory])
+async def get_menu(request: Request, db: AsyncSession = Depends(get_db)):
+    snapshot = await menu_cache.get(db)
+    return json_response(request, snapshot.data.menu_json, snapshot.data.menu_etag)
 
 
 @router.get("/categories/", response_model=List[schemas.Category])
-async def get_categories(db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
+async def get_categories(request: Request, db: AsyncSession = Depends(get_db)):
+    snapshot = await menu_cache.get(db)
+    return json_response(request, snapshot.data.categories_json, snapshot.data.categories_etag)
 
 
-@router.post("/categories/", response_model=schemas.Category)
+@router.post("/categories/", response_model=schemas.Category, dependencies=[Depends(require_staff)])
 async def create_category(category: schemas.CategoryCreate, db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
+    db_category = models.Category(**category.model_dump())
+    db.add(db_category)
+    await db.commit()
+    await db.refresh(db_category)
+    menu_cache.invalidate()
+    return db_category
+
+
+@router.put("/categories/{category_id}", response_model=schemas.Category, dependencies=[Depends(require_staff)])
+async def update_category(category_id: int, category: schemas.CategoryUpdate, db: AsyncSession = Depends(get_db)):
+    db_category = await db.get(models.Category, category_id)
+    if db_category is None:
+        raise HTTPException(status_code=404, detail="Category not found")
+    for field, value in category.model_dump(exclude_unset=True).items():
+        setattr(db_category, field, value)
+    await db.commit()
+    await db.refresh(db_category)
+    menu_cache.invalidate()
+    return db_category
 
 
 @router.get("/products/", response_model=List[schemas.Product])
-async def get_products(db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
+async def get_products(request: Request, db: AsyncSession = Depends(get_db)):
+    snapshot = await menu_cache.get(db)
+    return json_response(request, snapshot.data.products_json, snapshot.data.products_etag)
 
 
-@router.post("/products/", response_model=schemas.Product)
+@router.post("/products/", response_model=schemas.Product, dependencies=[Depends(require_staff)])
 async def create_product(product: schemas.ProductCreate, db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
\ No newline at end of file
+    db_product = models.Product(**product.model_dump())
+    db.add(db_product)
+    await db.commit()
+    await db.refresh(db_product)
+    menu_cache.invalidate()
+    return db_product
+
+
+@router.put("/products/{product_id}", response_model=schemas.Product, dependencies=[Depends(require_staff)])
+async def update_product(product_id: int, product: schemas.ProductUpdate, db: AsyncSession = Depends(get_db)):
+    # Also used to put products on / take them off the stop list
+    db_product = await db.get(models.Product, product_id)
+    if db_product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    for field, value in product.model_dump(exclude_unset=True).items():
+        setattr(db_product, field, value)
+    await db.commit()
+    await db.refresh(db_product)
+    menu_cache.invalidate()
+    return db_product
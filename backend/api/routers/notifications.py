@@ -1,13 +1,169 @@
 from fastapi import APIRouter, Depends, HTTPException
 from typing import List
+from sqlalchemy import insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from ...database import get_db
 from ... import models, schemas
+from ...utils.access import require_staff
+from ...utils.broadcast import broadcasts, delivery_stats
+from ...utils.instrumentation import InstrumentedRoute
+from ...utils.notifications import CHANNEL, notification_dispatcher
+from ...utils.order_notifications import order_templates
+from ...utils.templates import (
+    ORDER_PLACEHOLDERS, RECIPIENT_PLACEHOLDERS, TemplateError, compile_template, template_cache, validate_template,
+)
 
-router = APIRouter()
+# Templates, direct sends and broadcasts are all back office tools
+router = APIRouter(route_class=InstrumentedRoute, dependencies=[Depends(require_staff)])
+
+
+def _validate_template(template):
+    try:
+        validate_template(template.type, template.title, template.message)
+    except TemplateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _get_sendable_template(db, template_id: int):
+    template = await db.get(models.NotificationTemplate, template_id)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Notification template not found")
+    # Nothing delivers other channels yet: their rows would stay pending forever
+    if template.channel != CHANNEL:
+        raise HTTPException(status_code=400, detail=f"Only {CHANNEL} templates can be sent, not {template.channel}")
+    return template
+
+
+@router.get("/notifications/templates/", response_model=List[schemas.NotificationTemplate])
+async def get_templates(db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(models.NotificationTemplate).order_by(models.NotificationTemplate.id))
+    return result.scalars().all()
+
+
+@router.post("/notifications/templates/", response_model=schemas.NotificationTemplate)
+async def create_template(template: schemas.NotificationTemplateCreate, db: AsyncSession = Depends(get_db)):
+    # Placeholders are checked here so a typo fails on save, not on every send
+    _validate_template(template)
+    db_template = models.NotificationTemplate(**template.model_dump())
+    db.add(db_template)
+    await db.commit()
+    await db.refresh(db_template)
+    order_templates.invalidate()
+    return db_template
+
+
+@router.put("/notifications/templates/{template_id}", response_model=schemas.NotificationTemplate)
+async def update_template(template_id: int, template: schemas.NotificationTemplateCreate, db: AsyncSession = Depends(get_db)):
+    db_template = await db.get(models.NotificationTemplate, template_id)
+    if db_template is None:
+        raise HTTPException(status_code=404, detail="Notification template not found")
+    _validate_template(template)
+    for field, value in template.model_dump().items():
+        setattr(db_template, field, value)
+    # The new updated_at gives the template a fresh render cache entry
+    await db.commit()
+    await db.refresh(db_template)
+    order_templates.invalidate()
+    return db_template
 
 
 @router.post("/notifications/send/", response_model=dict)
-async def send_notification():
-    # Implementation will go here
-    pass
\ No newline at end of file
+async def send_notification(notification: schemas.NotificationSend, db: AsyncSession = Depends(get_db)):
+    # Only queues the messages; the dispatcher delivers them in the background
+    template = await _get_sendable_template(db, notification.template_id)
+    if not notification.user_ids:
+        return {"queued": 0}
+
+    # Render once per recipient; order fields are shared by the whole batch
+    order_context = {}
+    if notification.order_id is not None:
+        order = (await db.execute(
+            select(*[getattr(models.Order, name) for name in sorted(ORDER_PLACEHOLDERS)])
+            .where(models.Order.id == notification.order_id)
+        )).first()
+        if order is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        order_context = dict(order._mapping, status=getattr(order.status, "value", order.status))
+    recipients = (await db.execute(
+        select(models.User.id, *[getattr(models.User, name) for name in sorted(RECIPIENT_PLACEHOLDERS)])
+        .where(models.User.id.in_(notification.user_ids))
+    )).all()
+    if not recipients:
+        return {"queued": 0}
+    contexts = [{**order_context, **recipient._mapping} for recipient in recipients]
+
+    title, message = template_cache.get(template)
+    try:
+        if notification.title is not None:
+            title = compile_template(notification.title)
+        if notification.message is not None:
+            message = compile_template(notification.message)
+    except TemplateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    titles = title.render_many(contexts) if title.text else [None] * len(contexts)
+    messages = message.render_many(contexts)
+
+    await db.execute(insert(models.Notification).values([
+        {
+            "user_id": recipient.id,
+            "template_id": template.id,
+            "order_id": notification.order_id,
+            "title": recipient_title,
+            "message": recipient_message,
+            "channel": template.channel,
+            "status": "pending",
+        }
+        for recipient, recipient_title, recipient_message in zip(recipients, titles, messages)
+    ]))
+    await db.commit()
+    notification_dispatcher.wake()
+    return {"queued": len(recipients)}
+
+
+async def _broadcast_response(db, broadcast):
+    result = schemas.Broadcast.model_validate(broadcast)
+    result.delivery = await delivery_stats(db, broadcast.id)
+    return result
+
+
+async def _get_broadcast(db, broadcast_id: int):
+    broadcast = await db.get(models.Broadcast, broadcast_id)
+    if broadcast is None:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return broadcast
+
+
+@router.post("/notifications/broadcasts/", response_model=schemas.Broadcast)
+async def create_broadcast(broadcast: schemas.BroadcastCreate, db: AsyncSession = Depends(get_db)):
+    await _get_sendable_template(db, broadcast.template_id)
+    db_broadcast = models.Broadcast(**broadcast.model_dump(), status="running", queued_count=0, last_user_id=0)
+    db.add(db_broadcast)
+    await db.commit()
+    await db.refresh(db_broadcast)
+    broadcasts.start(db_broadcast.id)
+    return await _broadcast_response(db, db_broadcast)
+
+
+@router.get("/notifications/broadcasts/{broadcast_id}", response_model=schemas.Broadcast)
+async def get_broadcast(broadcast_id: int, db: AsyncSession = Depends(get_db)):
+    return await _broadcast_response(db, await _get_broadcast(db, broadcast_id))
+
+
+@router.post("/notifications/broadcasts/{broadcast_id}/pause/", response_model=schemas.Broadcast)
+async def pause_broadcast(broadcast_id: int, db: AsyncSession = Depends(get_db)):
+    broadcast = await _get_broadcast(db, broadcast_id)
+    if broadcast.status != "running" or not await broadcasts.pause(db, broadcast):
+        await db.refresh(broadcast)
+        raise HTTPException(status_code=400, detail=f"Broadcast is {broadcast.status}")
+    await db.refresh(broadcast)
+    return await _broadcast_response(db, broadcast)
+
+
+@router.post("/notifications/broadcasts/{broadcast_id}/resume/", response_model=schemas.Broadcast)
+async def resume_broadcast(broadcast_id: int, db: AsyncSession = Depends(get_db)):
+    # Also restarts a broadcast whose runner died (e.g. after a deploy)
+    broadcast = await _get_broadcast(db, broadcast_id)
+    if broadcast.status not in ("paused", "running", "failed"):
+        raise HTTPException(status_code=400, detail=f"Broadcast is {broadcast.status}")
+    await broadcasts.resume(db, broadcast)
+    return await _broadcast_response(db, broadcast)
@@ -1,31 +1,182 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from ...database import get_db
+from ...database import AsyncSessionLocal, get_db, get_read_db, stick_to_primary
 from ... import models, schemas
+from ...utils import export, order_pipeline, order_status
+from ...utils.access import Caller, check_access, current_caller, require_staff, stream_caller
+from ...utils.events import order_event
+from ...utils.instrumentation import InstrumentedRoute
+from ...utils.live_feed import format_event, order_feed
+from ...utils.pagination import MAX_PAGE_SIZE, keyset_page, split_page
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
 
 
 @router.get("/orders/", response_model=List[schemas.Order])
-async def get_orders(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
+async def get_orders(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    status: Optional[schemas.OrderStatus] = None,
+    payment_status: Optional[str] = None,
+    user_id: Optional[int] = None,
+    caller: Caller = Depends(current_caller),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if not caller.is_staff:
+        # Mini App users only list their own orders
+        check_access(caller, user_id if user_id is not None else caller.user_id)
+        user_id = caller.user_id
+    query = select(models.Order)
+    if status is not None:
+        query = query.where(models.Order.status == status)
+    if payment_status is not None:
+        query = query.where(models.Order.payment_status == payment_status)
+    if user_id is not None:
+        query = query.where(models.Order.user_id == user_id)
+    try:
+        query = keyset_page(query, models.Order, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    orders, next_cursor = split_page((await db.execute(query)).scalars(), limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return orders
 
 
 @router.post("/orders/", response_model=schemas.Order)
-async def create_order(order: schemas.OrderCreate, db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
+async def create_order(
+    order: schemas.OrderCreate,
+    response: Response,
+    caller: Caller = Depends(current_caller),
+    db: AsyncSession = Depends(get_db)
+):
+    check_access(caller, order.user_id)
+    try:
+        db_order = await order_pipeline.create_order(db, order)
+    except order_pipeline.OrderValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # The app shows the new order and the order history next: read them from the primary
+    stick_to_primary(response)
+    return db_order
+
+
+@router.get("/orders/export/", dependencies=[Depends(require_staff)])
+async def export_orders(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    if format == "csv":
+        rows = export.export_orders_csv(db, created_from, created_to)
+    else:
+        rows = export.export_orders_ndjson(db, created_from, created_to)
+    return StreamingResponse(
+        rows,
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="orders.{format}"'},
+    )
+
+
+# Live feeds (Server-Sent Events). They don't hold a database session while
+# streaming: events come from the process-wide LISTEN connection. EventSource
+# can't set headers, so clients may pass the Authorization value as ?auth=.
+FEED_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def feed_response(connection, initial=None):
+    return StreamingResponse(connection.stream(initial), media_type="text/event-stream", headers=FEED_HEADERS)
+
+
+@router.get("/orders/feed/")
+async def kitchen_feed(caller: Caller = Depends(stream_caller)):
+    if not caller.is_staff:
+        raise HTTPException(status_code=403, detail="Staff only")
+    return feed_response(order_feed.subscribe())
+
+
+@router.get("/orders/{order_id}/feed/")
+async def order_feed_stream(order_id: int, caller: Caller = Depends(stream_caller)):
+    # Subscribe before reading the snapshot so no change falls in between
+    connection = order_feed.subscribe(order_id=order_id)
+    try:
+        async with AsyncSessionLocal() as db:
+            db_order = await db.get(models.Order, order_id)
+        if db_order is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        check_access(caller, db_order.user_id)
+        snapshot = order_event("snapshot", db_order, changed_at=db_order.updated_at or db_order.created_at)
+    except BaseException:
+        # Not streamed, so nothing else unsubscribes it
+        order_feed.unsubscribe(connection)
+        raise
+    return feed_response(connection, format_event(snapshot.type, snapshot.to_dict()))
+
+
+@router.get("/users/{user_id}/orders/feed/")
+async def user_order_feed(user_id: int, caller: Caller = Depends(stream_caller)):
+    check_access(caller, user_id)
+    return feed_response(order_feed.subscribe(user_id=user_id))
 
 
 @router.get("/orders/{order_id}", response_model=schemas.Order)
-async def get_order(order_id: int, db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
+async def get_order(order_id: int, caller: Caller = Depends(current_caller), db: AsyncSession = Depends(get_read_db)):
+    db_order = await db.get(models.Order, order_id)
+    if db_order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    check_access(caller, db_order.user_id)
+    return db_order
+
+
+@router.put("/orders/{order_id}", response_model=schemas.Order, dependencies=[Depends(require_staff)])
+async def update_order(
+    order_id: int,
+    order_update: schemas.OrderUpdate,
+    response: Response,
+    db: AsyncSession = Depends(get_db)
+):
+    db_order = await db.get(models.Order, order_id)
+    if db_order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    values = order_update.model_dump(exclude_unset=True)
+    new_status = values.pop("status", None)
+    for field, value in values.items():
+        setattr(db_order, field, value)
+    events = []
+    if new_status is not None and new_status != db_order.status:
+        try:
+            events = await order_status.apply_changes(db, [order_status.StatusChange(db_order.id, new_status)])
+        except order_status.InvalidTransition as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    await db.commit()
+    order_status.publish(events)
+    stick_to_primary(response)
+    await db.refresh(db_order)
+    return db_order
 
 
-@router.put("/orders/{order_id}", response_model=schemas.Order)
-async def update_order(order_id: int, order_update: schemas.OrderUpdate, db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
\ No newline at end of file
+@router.post("/orders/status/", response_model=List[dict], dependencies=[Depends(require_staff)])
+async def change_order_statuses(
+    changes: List[schemas.OrderStatusChange],
+    response: Response,
+    db: AsyncSession = Depends(get_db)
+):
+    # Kitchen and courier screens move many orders at once: one transaction,
+    # one history INSERT and one rollup upsert for the whole batch
+    try:
+        events = await order_status.change_statuses(db, [
+            order_status.StatusChange(change.order_id, change.status, change.comment) for change in changes
+        ])
+    except order_status.InvalidTransition as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # The screen reloads its order list next: read it from the primary
+    stick_to_primary(response)
+    return [event.to_dict() for event in events]
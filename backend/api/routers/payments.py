@@ -1,25 +1,160 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+import json
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from typing import Optional
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from ...database import get_db
+from ...database import get_db, stick_to_primary
 from ... import models, schemas
+from ...config import settings
+from ...models.payment import PaymentMethod, PaymentStatus
+from ...utils.access import Caller, check_access, current_caller
+from ...utils.instrumentation import InstrumentedRoute
+from ...utils.payment_events import (
+    EVENT_TRANSITIONS, PAYMENT_PROVIDER, WebhookError, event_record, is_allowed_sender, parse_notification,
+    payment_events,
+)
+from ...utils.yookassa import STATUS_EVENTS, CircuitOpenError, YooKassaError, yookassa_client
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
+
+# Statuses the provider won't change any more (refunds arrive by webhook)
+FINAL_STATUSES = (PaymentStatus.SUCCEEDED, PaymentStatus.CANCELLED, PaymentStatus.FAILED, PaymentStatus.REFUNDED)
+
+
+def _payment_response(payment, provider_payment: Optional[dict] = None):
+    result = schemas.Payment.model_validate(payment)
+    if provider_payment is not None:
+        result.confirmation_url = (provider_payment.get("confirmation") or {}).get("confirmation_url")
+    return result
+
+
+async def _provider_status_response(payment, provider_payment: dict):
+    result = _payment_response(payment, provider_payment)
+    event = STATUS_EVENTS.get(provider_payment.get("status"))
+    if event is not None:
+        # Applied by the same idempotent worker as the webhook, in case it's late
+        await payment_events.enqueue(event_record(event, provider_payment, verified=True))
+        result.status = EVENT_TRANSITIONS[event][0]
+    return result
 
 
 @router.post("/payments/create/", response_model=schemas.Payment)
-async def create_payment(payment: schemas.PaymentCreate, db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
+async def create_payment(
+    payment: schemas.PaymentCreate,
+    response: Response,
+    caller: Caller = Depends(current_caller),
+    db: AsyncSession = Depends(get_db)
+):
+    # Locked so that concurrent calls for one order find each other's payment
+    order = (await db.execute(
+        select(models.Order).where(models.Order.id == payment.order_id).with_for_update()
+    )).scalar_one_or_none()
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    check_access(caller, order.user_id)
+    stick_to_primary(response)
+    if order.payment_status == "paid":
+        raise HTTPException(status_code=400, detail="Order is already paid")
+
+    # A retried call continues the order's open payment instead of starting another one
+    db_payment = (await db.execute(
+        select(models.Payment)
+        .where(
+            models.Payment.order_id == order.id,
+            models.Payment.payment_method == PaymentMethod(payment.payment_method.value),
+            models.Payment.status == PaymentStatus.PENDING,
+            models.Payment.amount == order.final_amount,
+        )
+        .order_by(models.Payment.id.desc())
+        .limit(1)
+    )).scalar_one_or_none()
+    if db_payment is None:
+        db_payment = models.Payment(
+            order_id=order.id,
+            user_id=order.user_id,
+            payment_method=PaymentMethod(payment.payment_method.value),
+            amount=order.final_amount,
+            status=PaymentStatus.PENDING,
+            description=payment.description or f"Order {order.order_number}",
+        )
+        if payment.payment_method == PaymentMethod.YOOKASSA:
+            db_payment.payment_provider = PAYMENT_PROVIDER
+        db.add(db_payment)
+        await db.commit()
+        await db.refresh(db_payment)
+    else:
+        await db.commit()  # Releases the order lock
+    if db_payment.payment_provider != PAYMENT_PROVIDER:
+        return _payment_response(db_payment)
+
+    if db_payment.provider_payment_id:
+        try:
+            provider_payment = await yookassa_client.get_payment(db_payment.provider_payment_id)
+        except YooKassaError as e:
+            status_code = 503 if isinstance(e, CircuitOpenError) else 502
+            raise HTTPException(status_code=status_code, detail=f"Payment provider error: {e}")
+        return await _provider_status_response(db_payment, provider_payment)
+
+    try:
+        # Keyed by our payment id, which retries reuse (see above): YooKassa
+        # answers a repeated key with the payment it already created
+        provider_payment = await yookassa_client.create_payment(
+            db_payment.amount,
+            idempotence_key=f"payment-{db_payment.id}",
+            return_url=payment.return_url or settings.YOOKASSA_RETURN_URL,
+            description=db_payment.description,
+            metadata={"order_id": order.id, "payment_id": db_payment.id},
+        )
+    except YooKassaError as e:
+        rejected = e.status_code is not None and e.status_code < 500 and e.status_code != 409
+        if isinstance(e, CircuitOpenError) or rejected:
+            # Never sent, or rejected: a retry starts a new payment. After a
+            # timeout, a 5xx or a 409 (same key still in progress) the payment
+            # may exist, so it stays open for the retry to pick up by its key.
+            db_payment.status = PaymentStatus.FAILED
+            db_payment.provider_response = str(e)
+            await db.commit()
+        status_code = 503 if isinstance(e, CircuitOpenError) else 502
+        raise HTTPException(status_code=status_code, detail=f"Payment provider error: {e}")
+
+    db_payment.provider_payment_id = provider_payment["id"]
+    db_payment.provider_response = json.dumps(provider_payment)
+    await db.commit()
+    await db.refresh(db_payment)
+    return _payment_response(db_payment, provider_payment)
 
 
 @router.get("/payments/{payment_id}", response_model=schemas.Payment)
-async def get_payment(payment_id: int, db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
+async def get_payment(payment_id: int, caller: Caller = Depends(current_caller), db: AsyncSession = Depends(get_db)):
+    db_payment = await db.get(models.Payment, payment_id)
+    if db_payment is None:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    check_access(caller, db_payment.user_id)
+    if (
+        db_payment.payment_provider != PAYMENT_PROVIDER
+        or not db_payment.provider_payment_id
+        or db_payment.status in FINAL_STATUSES
+    ):
+        return _payment_response(db_payment)
+
+    try:
+        provider_payment = await yookassa_client.get_payment(db_payment.provider_payment_id)
+    except YooKassaError:
+        # Serve what we know; the webhook brings the status in eventually
+        return _payment_response(db_payment)
+    return await _provider_status_response(db_payment, provider_payment)
 
 
 @router.post("/payments/yookassa/webhook/")
-async def yookassa_webhook():
-    # Handle Yookassa webhook
-    pass
\ No newline at end of file
+async def yookassa_webhook(request: Request):
+    # Acknowledged as soon as the event is durably spooled; payments and
+    # orders are updated by the background worker (utils/payment_events.py),
+    # which re-reads every payment from YooKassa before applying anything
+    if not is_allowed_sender(request.client.host if request.client else None):
+        raise HTTPException(status_code=403, detail="Unknown notification sender")
+    try:
+        record = parse_notification(await request.body())
+    except WebhookError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await payment_events.enqueue(record)
+    return {"status": "ok"}
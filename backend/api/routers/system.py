@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from ...database import engine, replica_engines
+from ...utils.access import require_staff
+from ...utils.db_metrics import pool_metrics, pool_status, query_metrics
+from ...utils.instrumentation import InstrumentedRoute, render_prometheus
+
+# Query texts and pool internals: staff (and Prometheus with the staff token) only
+router = APIRouter(route_class=InstrumentedRoute, dependencies=[Depends(require_staff)])
+
+
+@router.get("/system/db/")
+async def get_db_metrics():
+    # Per worker process: compare checkout times and in-use counts across
+    # workers to size DB_POOL_SIZE / DB_MAX_OVERFLOW
+    return {
+        "pool": {
+            **pool_status(engine),
+            "checkout_time": pool_metrics.checkout_time.snapshot(),
+            "checkout_timeouts": pool_metrics.checkout_timeouts,
+            "connections_created": pool_metrics.connections_created,
+            "connections_invalidated": pool_metrics.connections_invalidated,
+        },
+        "replica_pools": [pool_status(replica) for replica in replica_engines],
+        "queries": {
+            "duration": query_metrics.duration.snapshot(),
+            "slow_threshold_ms": query_metrics.slow_threshold * 1000,
+            "slow_count": query_metrics.slow_count,
+            "slow": list(query_metrics.slow_queries),
+        },
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text format; scrape every worker (each reports its own process)
+    engines = {"primary": engine, **{f"replica{index}": replica for index, replica in enumerate(replica_engines)}}
+    return PlainTextResponse(render_prometheus(engines), media_type="text/plain; version=0.0.4")
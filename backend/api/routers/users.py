@@ -1,31 +1,145 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from ...database import get_db
+from ...database import get_db, get_read_db, stick_to_primary
 from ... import models, schemas
+from ...utils import bonus_rules, export, referrals, rollups
+from ...utils.access import Caller, check_access, current_caller, require_staff
+from ...utils.instrumentation import InstrumentedRoute
+from ...utils.telegram_auth import current_user_id
+from ...utils.user_cache import user_cache
+from ...utils.pagination import MAX_PAGE_SIZE, keyset_page, split_page
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
+
+
+@router.get("/users/export/", dependencies=[Depends(require_staff)])
+async def export_users(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    rows = export.export_users_csv(db) if format == "csv" else export.export_users_ndjson(db)
+    return StreamingResponse(
+        rows,
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="customers.{format}"'},
+    )
+
+
+@router.get("/users/me", response_model=schemas.User)
+async def get_current_user(user_id: int = Depends(current_user_id), db: AsyncSession = Depends(get_db)):
+    # Signed in with Telegram initData (Authorization: tma <initData>); created on first visit
+    profile = await user_cache.get(db, user_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return profile
+
+
+@router.get("/users/telegram/{telegram_id}", response_model=schemas.User)
+async def get_user_by_telegram_id(
+    telegram_id: str,
+    caller: Caller = Depends(current_caller),
+    db: AsyncSession = Depends(get_db)
+):
+    if caller.is_staff:
+        profile = await user_cache.get_by_telegram_id(db, telegram_id)
+    else:
+        # Users can only look themselves up, and learn nothing about other ids:
+        # someone else's id gets the same 404 as one nobody has
+        profile = await user_cache.get(db, caller.user_id)
+        if profile is not None and profile.telegram_id != telegram_id:
+            profile = None
+    if profile is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return profile
 
 
 @router.get("/users/{user_id}", response_model=schemas.User)
-async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
+async def get_user(user_id: int, caller: Caller = Depends(current_caller), db: AsyncSession = Depends(get_db)):
+    check_access(caller, user_id)
+    # Served from memory; writers invalidate the profile when they commit
+    profile = await user_cache.get(db, user_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return profile
+
 
+@router.get("/users/{user_id}/referrals/", response_model=schemas.ReferralStats)
+async def get_user_referrals(
+    user_id: int,
+    caller: Caller = Depends(current_caller),
+    db: AsyncSession = Depends(get_read_db)
+):
+    check_access(caller, user_id)
+    # Served from the incrementally maintained referral index, no tree walk
+    stats = await db.get(models.ReferralStats, user_id)
+    if stats is not None:
+        return stats
+    if await db.get(models.User, user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return schemas.ReferralStats(user_id=user_id)
 
-@router.post("/users/", response_model=schemas.User)
-async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
+
+@router.post("/users/", response_model=schemas.User, dependencies=[Depends(require_staff)])
+async def create_user(user: schemas.UserCreate, response: Response, db: AsyncSession = Depends(get_db)):
+    try:
+        db_user = (await db.execute(
+            insert(models.User).values(**user.model_dump()).returning(models.User)
+        )).scalar_one()
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="User already exists")
+    await rollups.record_user_created(db, db_user)
+    await referrals.record_user_created(db, db_user)
+    await bonus_rules.accrue_for_new_user(db, db_user)
+    await db.commit()
+    stick_to_primary(response)
+    await db.refresh(db_user)
+    return db_user
 
 
 @router.put("/users/{user_id}", response_model=schemas.User)
-async def update_user(user_id: int, user: schemas.UserUpdate, db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
+async def update_user(
+    user_id: int,
+    user: schemas.UserUpdate,
+    response: Response,
+    caller: Caller = Depends(current_caller),
+    db: AsyncSession = Depends(get_db)
+):
+    check_access(caller, user_id)
+    values = user.model_dump(exclude_unset=True)
+    if "is_blocked" in values and not caller.is_staff:
+        raise HTTPException(status_code=403, detail="Only staff can block users")
+    db_user = await db.get(models.User, user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    for field, value in values.items():
+        setattr(db_user, field, value)
+    user_cache.mark_dirty(db, user_id)
+    try:
+        await db.commit()
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Username already taken")
+    stick_to_primary(response)
+    await db.refresh(db_user)
+    return db_user
+
 
+@router.get("/users/", response_model=List[schemas.User], dependencies=[Depends(require_staff)])
+async def get_users(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db)
+):
+    try:
+        query = keyset_page(select(models.User), models.User, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/users/", response_model=List[schemas.User])
-async def get_users(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    # Implementation will go here
-    pass
\ No newline at end of file
+    users, next_cursor = split_page((await db.execute(query)).scalars(), limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return users
\ No newline at end of file
@@ -1,20 +1,99 @@
-from databases import Database
-from sqlalchemy import create_engine, MetaData
+import time
+from typing import List, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import MetaData
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from .config import settings
+from .utils import db_metrics
+
+# Set after a write whose result the client reads back right away
+PRIMARY_COOKIE = "read_primary"
+
+
+def _create_engine(url: str):
+    # One pool per worker process and database: size it so that
+    # workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays below Postgres max_connections.
+    engine = create_async_engine(
+        url,
+        poolclass=db_metrics.InstrumentedPool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args={"prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE},
+    )
+    db_metrics.instrument(engine)
+    return engine
 
-# Async database connection
-database = Database(settings.DATABASE_URL)
 
 # SQLAlchemy engine and metadata
-engine = create_async_engine(settings.DATABASE_URL)
+engine = _create_engine(settings.DATABASE_URL)
+replica_engines = [_create_engine(url.strip()) for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
 metadata = MetaData()
 
 # Async session maker
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+class ReplicaRouter:
+    """Round robin over the read replicas, skipping the ones that failed recently."""
+
+    def __init__(self, engines, retry_after: float):
+        self._factories = [sessionmaker(engine, class_=AsyncSession, expire_on_commit=False) for engine in engines]
+        self._retry_after = retry_after
+        self._down_until: List[float] = [0.0] * len(engines)
+        self._next = 0
+
+    async def open_session(self) -> Optional[AsyncSession]:
+        """A session on a reachable replica, or None when there is none."""
+        for _ in range(len(self._factories)):
+            index = self._next
+            self._next = (self._next + 1) % len(self._factories)
+            if time.monotonic() < self._down_until[index]:
+                continue
+            session = self._factories[index]()
+            try:
+                await session.connection()  # Checks out (and pre-pings) now, so we can still fall back
+            except (DBAPIError, OSError, PoolTimeoutError):
+                await session.close()
+                self._down_until[index] = time.monotonic() + self._retry_after
+                continue
+            return session
+        return None
+
+
+replica_router = ReplicaRouter(replica_engines, settings.DB_REPLICA_RETRY_SECONDS)
+
+
 async def get_db():
     async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+async def get_read_db(request: Request):
+    """Session for read-only endpoints: a replica when one is up, else the primary.
+
+    Clients that just wrote something (see `stick_to_primary`) keep reading
+    from the primary for a few seconds, so replication lag can't hide their
+    own changes from them.
+    """
+    session = None
+    if PRIMARY_COOKIE not in request.cookies:
+        session = await replica_router.open_session()
+    async with session or AsyncSessionLocal() as session:
+        yield session
+
+
+def stick_to_primary(response: Response):
+    if replica_engines:
+        response.set_cookie(
+            PRIMARY_COOKIE, "1",
+            max_age=settings.DB_REPLICA_STICKY_SECONDS,
+            httponly=True,
+            secure=True,
+            samesite="none",  # The mini app calls the API cross-site
+        )
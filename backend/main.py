@@ -1,8 +1,16 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .api.v1.routers import users, menu, orders, payments, delivery, notifications, analytics
+from .api.v1.routers import users, menu, orders, payments, delivery, notifications, analytics, bonus, system
 from .config import settings
-from .database import database
+from .database import engine
+from .utils.analytics_engine import analytics_engine
+from .utils.events import ORDERS_TOPIC, event_bus
+from .utils.instrumentation import InstrumentationMiddleware, SlowRequestProfiler
+from .utils.live_feed import order_feed
+from .utils.notifications import notification_dispatcher
+from .utils.order_notifications import notify_order_status
+from .utils.payment_events import payment_events
+from .utils.yookassa import yookassa_client
 import uvicorn
 
 app = FastAPI(
@@ -18,15 +26,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Added last so it wraps everything else; metrics at /api/v1/metrics
+profiler = None
+if settings.PROFILE_SLOW_REQUESTS_MS > 0:
+    profiler = SlowRequestProfiler(
+        threshold=settings.PROFILE_SLOW_REQUESTS_MS / 1000,
+        interval=settings.PROFILE_SAMPLE_INTERVAL_MS / 1000,
+        directory=settings.PROFILE_DIR,
+    )
+app.add_middleware(InstrumentationMiddleware, profiler=profiler)
+
+# Consumers of order changes, fed by the in-process event bus
+event_bus.subscribe(ORDERS_TOPIC, notify_order_status)
+event_bus.subscribe(ORDERS_TOPIC, analytics_engine.on_order_event)
+
 @app.on_event("startup")
 async def startup():
-    await database.connect()
+    await payment_events.start()
+    if settings.TELEGRAM_BOT_TOKEN and settings.NOTIFICATION_DISPATCHER_IN_APP:
+        await notification_dispatcher.start()
 
 @app.on_event("shutdown")
 async def shutdown():
-    await database.disconnect()
+    await notification_dispatcher.stop()
+    await payment_events.stop()
+    await yookassa_client.stop()
+    await order_feed.stop()
+    await event_bus.stop()
+    if profiler is not None:
+        profiler.stop()
+    await engine.dispose()
 
 # Include API routers
 app.include_router(users.router, prefix="/api/v1", tags=["users"])
@@ -36,6 +68,8 @@ app.include_router(payments.router, prefix="/api/v1", tags=["payments"])
 app.include_router(delivery.router, prefix="/api/v1", tags=["delivery"])
 app.include_router(notifications.router, prefix="/api/v1", tags=["notifications"])
 app.include_router(analytics.router, prefix="/api/v1", tags=["analytics"])
+app.include_router(bonus.router, prefix="/api/v1", tags=["bonus"])
+app.include_router(system.router, prefix="/api/v1", tags=["system"])
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -1,11 +1,13 @@
 from .user import User
 from .menu import Category, Product, ProductOption, ProductVariant
-from .order import Order, OrderItem, OrderStatusHistory
+from .order import Order, OrderItem, OrderStatusHistory, OrderNumberBlock
 from .payment import Payment, Transaction
 from .delivery import DeliveryZone, DeliveryCost
 from .bonus import BonusProgram, BonusTransaction
-from .notification import Notification, NotificationTemplate
+from .notification import Notification, NotificationTemplate, Broadcast
 from .business import Restaurant, AdminUser
+from .analytics import OrderRollup, UserRollup
+from .referral import ReferralPath, ReferralStats
 
 # Import all models here to make them available when importing from models
 __all__ = [
@@ -17,6 +19,7 @@ __all__ = [
     "Order",
     "OrderItem",
     "OrderStatusHistory",
+    "OrderNumberBlock",
     "Payment",
     "Transaction",
     "DeliveryZone",
@@ -25,6 +28,11 @@ __all__ = [
     "BonusTransaction",
     "Notification",
     "NotificationTemplate",
+    "Broadcast",
     "Restaurant",
-    "AdminUser"
+    "AdminUser",
+    "OrderRollup",
+    "UserRollup",
+    "ReferralPath",
+    "ReferralStats"
 ]
\ No newline at end of file
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, String, Numeric, DateTime, Enum, UniqueConstraint
+from sqlalchemy.sql import func
+from ..database import metadata
+from .order import OrderStatus
+
+
+class OrderRollup:
+    __tablename__ = "order_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    granularity = Column(String, nullable=False)  # "hour" or "day"
+    bucket_start = Column(DateTime(timezone=True), nullable=False)  # Start of the bucket in restaurant time
+    status = Column(Enum(OrderStatus), nullable=False)  # Current status of the counted orders
+    order_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Numeric(precision=12, scale=2), nullable=False, default=0.00)
+    final_amount = Column(Numeric(precision=12, scale=2), nullable=False, default=0.00)
+    bonus_used = Column(Numeric(precision=12, scale=2), nullable=False, default=0.00)
+    delivery_cost = Column(Numeric(precision=12, scale=2), nullable=False, default=0.00)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket_start", "status", name="uq_order_rollups_bucket"),
+    )
+
+
+class UserRollup:
+    __tablename__ = "user_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    granularity = Column(String, nullable=False)  # "hour" or "day"
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    new_users = Column(Integer, nullable=False, default=0)  # Registrations
+    new_customers = Column(Integer, nullable=False, default=0)  # Users placing their first order
+    repeat_orders = Column(Integer, nullable=False, default=0)  # Orders from returning customers
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket_start", name="uq_user_rollups_bucket"),
+    )
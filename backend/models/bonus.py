@@ -24,7 +24,7 @@ class BonusTransaction:
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    program_id = Column(Integer, ForeignKey("bonus_programs.id"), nullable=False)
+    program_id = Column(Integer, ForeignKey("bonus_programs.id"), nullable=True)  # Null for spending and manual adjustments
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=True)  # Nullable for registration bonuses
     amount = Column(Numeric(precision=10, scale=2), nullable=False)  # Positive for earned, negative for used
     balance_before = Column(Numeric(precision=10, scale=2), nullable=False)
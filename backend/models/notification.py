@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from ..database import metadata
 
@@ -24,12 +24,40 @@ class Notification:
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     template_id = Column(Integer, ForeignKey("notification_templates.id"), nullable=False)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=True)  # Nullable for non-order notifications
+    broadcast_id = Column(Integer, ForeignKey("broadcasts.id"), nullable=True, index=True)  # Set for promotional broadcasts
     title = Column(String, nullable=True)
     message = Column(Text, nullable=False)
     channel = Column(String, nullable=False)  # "telegram", "sms", "email", "push"
-    status = Column(String, default="pending")  # "pending", "sent", "failed"
+    status = Column(String, default="pending")  # "pending", "sending", "sent", "failed", "paused"
+    attempts = Column(Integer, default=0)  # Delivery attempts made so far
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)  # Retry not before this time
     sent_at = Column(DateTime(timezone=True), nullable=True)
     error_message = Column(Text, nullable=True)
     metadata = Column(Text, nullable=True)  # JSON string for additional data
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+    # Dispatcher queue scan: pending rows in id order
+    __table_args__ = (
+        Index("ix_notifications_status_id", "status", "id"),
+    )
+
+
+class Broadcast:
+    __tablename__ = "broadcasts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    template_id = Column(Integer, ForeignKey("notification_templates.id"), nullable=False)
+    name = Column(String, nullable=True)
+    status = Column(String, default="running")  # "running", "paused", "completed", "failed"
+    # Audience filter; active, not blocked users are always required
+    last_order_after = Column(DateTime(timezone=True), nullable=True)
+    last_order_before = Column(DateTime(timezone=True), nullable=True)
+    # Progress
+    total_recipients = Column(Integer, nullable=True)
+    queued_count = Column(Integer, default=0)
+    last_user_id = Column(Integer, default=0)  # Recipients are queued in user id order; resume point
+    error_message = Column(Text, nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Numeric, Boolean, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, Numeric, Boolean, Date, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.sql import func
 from ..database import metadata
 from enum import Enum as PyEnum
@@ -52,6 +52,14 @@ class Order:
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
 
+    # Keyset pagination indexes, newest first by (created_at, id)
+    __table_args__ = (
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        Index("ix_orders_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_orders_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_orders_payment_status_created_at_id", "payment_status", "created_at", "id"),
+    )
+
 
 class OrderItem:
     __tablename__ = "order_items"
@@ -76,4 +84,11 @@ class OrderStatusHistory:
     status = Column(Enum(OrderStatus), nullable=False)
     comment = Column(Text, nullable=True)  # Optional comment about the status change
     changed_by = Column(Integer, nullable=True)  # Admin user ID who changed the status
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class OrderNumberBlock:
+    __tablename__ = "order_number_blocks"
+
+    day = Column(Date, primary_key=True)  # Business day the numbers belong to
+    next_value = Column(Integer, nullable=False)  # First number not yet reserved by any worker
@@ -27,7 +27,7 @@ class Payment:
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     payment_method = Column(Enum(PaymentMethod), nullable=False)
     payment_provider = Column(String, nullable=True)  # For external providers like Yookassa
-    provider_payment_id = Column(String, nullable=True)  # Payment ID from the provider
+    provider_payment_id = Column(String, nullable=True, index=True)  # Payment ID from the provider
     amount = Column(Numeric(precision=10, scale=2), nullable=False)
     status = Column(Enum(PaymentStatus), default=PaymentStatus.PENDING)
     currency = Column(String, default="RUB")
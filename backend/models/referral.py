@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, Numeric, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from ..database import metadata
+
+
+class ReferralPath:
+    """Closure table of the referral tree: one row per (ancestor, descendant) pair."""
+
+    __tablename__ = "referral_paths"
+
+    ancestor_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey("users.id"), primary_key=True, index=True)
+    depth = Column(Integer, nullable=False)  # 1 for direct referrals
+
+
+class ReferralStats:
+    """Per-user totals over everyone in the user's referral subtree."""
+
+    __tablename__ = "referral_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    direct_referrals = Column(Integer, nullable=False, default=0)
+    total_referrals = Column(Integer, nullable=False, default=0)  # All levels
+    downstream_orders = Column(Integer, nullable=False, default=0)
+    downstream_spent = Column(Numeric(precision=12, scale=2), nullable=False, default=0.00)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, Index
 from sqlalchemy.sql import func
 from ..database import metadata
 
@@ -19,6 +19,7 @@ class User:
     bonus_balance = Column(Numeric(precision=10, scale=2), default=0.00)
     total_spent = Column(Numeric(precision=10, scale=2), default=0.00)
     order_count = Column(Integer, default=0)
+    last_order_at = Column(DateTime(timezone=True), nullable=True)
     is_active = Column(Boolean, default=True)
     is_blocked = Column(Boolean, default=False)
     referral_code = Column(String, unique=True, index=True, nullable=True)
@@ -26,5 +27,10 @@ class User:
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
 
+    # Keyset pagination index, newest first by (created_at, id)
+    __table_args__ = (
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
+
     def __repr__(self):
         return f"<User(id={self.id}, telegram_id={self.telegram_id}, username={self.username})>"
\ No newline at end of file
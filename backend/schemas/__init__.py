@@ -1,35 +1,61 @@
 # Import all schemas here to make them available when importing from schemas
-from .user import User, UserCreate, UserUpdate
-from .menu import Category, CategoryCreate, CategoryUpdate, Product, ProductCreate, ProductUpdate
-from .order import Order, OrderCreate, OrderUpdate, OrderItem
+from .user import User, UserCreate, UserUpdate, ReferralStats
+from .menu import (
+    Category, CategoryCreate, CategoryUpdate, Product, ProductCreate, ProductUpdate,
+    ProductOption, ProductVariant, MenuProduct, MenuCategory
+)
+from .order import Order, OrderCreate, OrderUpdate, OrderItem, OrderStatus, OrderStatusChange
 from .payment import Payment, PaymentCreate
-from .delivery import DeliveryZone, DeliveryCost
-from .bonus import BonusProgram, BonusTransaction
-from .notification import Notification, NotificationTemplate
+from .delivery import (
+    DeliveryZone, DeliveryZoneCreate, DeliveryZoneUpdate, DeliveryCost, DeliveryCostCreate,
+    DeliveryQuoteBatchRequest
+)
+from .bonus import BonusProgram, BonusProgramCreate, BonusProgramUpdate, BonusEvaluation, BonusTransaction
+from .notification import (
+    Notification, NotificationTemplate, NotificationTemplateCreate, NotificationSend, Broadcast, BroadcastCreate
+)
 from .business import Restaurant, AdminUser
 
 __all__ = [
     "User",
     "UserCreate", 
     "UserUpdate",
+    "ReferralStats",
     "Category",
     "CategoryCreate",
     "CategoryUpdate",
     "Product",
     "ProductCreate",
     "ProductUpdate",
+    "ProductOption",
+    "ProductVariant",
+    "MenuProduct",
+    "MenuCategory",
     "Order",
     "OrderCreate",
     "OrderUpdate",
     "OrderItem",
+    "OrderStatus",
+    "OrderStatusChange",
     "Payment",
     "PaymentCreate",
     "DeliveryZone",
+    "DeliveryZoneCreate",
+    "DeliveryZoneUpdate",
     "DeliveryCost",
+    "DeliveryCostCreate",
+    "DeliveryQuoteBatchRequest",
     "BonusProgram",
+    "BonusProgramCreate",
+    "BonusProgramUpdate",
+    "BonusEvaluation",
     "BonusTransaction",
     "Notification",
     "NotificationTemplate",
+    "NotificationTemplateCreate",
+    "NotificationSend",
+    "Broadcast",
+    "BroadcastCreate",
     "Restaurant",
     "AdminUser"
 ]
\ No newline at end of file
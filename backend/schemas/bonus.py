@@ -0,0 +1,58 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+
+class BonusProgramBase(BaseModel):
+    name: str
+    description: Optional[str] = None
+    type: str  # "registration", "order_percent", "fixed_amount", "referral"
+    value: float  # Bonus amount or percentage
+    min_order_amount: Optional[float] = None
+    max_bonus_amount: Optional[float] = None
+    is_active: bool = True
+    is_default: bool = False
+
+
+class BonusProgramCreate(BonusProgramBase):
+    pass
+
+
+class BonusProgramUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    value: Optional[float] = None
+    min_order_amount: Optional[float] = None
+    max_bonus_amount: Optional[float] = None
+    is_active: Optional[bool] = None
+    is_default: Optional[bool] = None
+
+
+class BonusEvaluation(BaseModel):
+    program_id: int
+    amount: float
+
+
+class BonusProgram(BonusProgramBase):
+    id: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class BonusTransaction(BaseModel):
+    id: int
+    user_id: int
+    program_id: Optional[int] = None
+    order_id: Optional[int] = None
+    amount: float  # Positive for earned, negative for used
+    balance_before: float
+    balance_after: float
+    description: Optional[str] = None
+    transaction_type: str  # "earned", "used", "referral_bonus"
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
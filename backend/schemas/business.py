@@ -0,0 +1,41 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+
+class Restaurant(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    address: str
+    address_lat: float
+    address_lon: float
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    working_hours: Optional[str] = None
+    min_order_amount: float
+    free_delivery_threshold: float
+    delivery_base_cost: float
+    delivery_cost_per_km: float
+    is_active: bool
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class AdminUser(BaseModel):
+    id: int
+    username: str
+    email: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    role: str
+    is_active: bool
+    is_superuser: bool
+    last_login: Optional[datetime] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
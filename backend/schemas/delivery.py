@@ -0,0 +1,111 @@
+import math
+from pydantic import BaseModel, Field, FiniteFloat, field_validator, model_validator
+from typing import Annotated, Optional, List
+from datetime import datetime
+
+MAX_QUOTE_POINTS = 10000  # Per batch quote request
+
+
+class DeliveryCostBase(BaseModel):
+    min_order_amount: Optional[float] = 0.0
+    cost: float
+    is_free: bool = False
+    is_flat_rate: bool = False
+
+
+class DeliveryCostCreate(DeliveryCostBase):
+    pass
+
+
+class DeliveryCost(DeliveryCostBase):
+    id: int
+    zone_id: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+Latitude = Annotated[float, Field(ge=-90, le=90)]
+Longitude = Annotated[float, Field(ge=-180, le=180)]
+
+
+def _non_finite_as_str(value):
+    # Validation rejects NaN and Infinity all the same, but as strings: the 422
+    # echoes the input back and would not be valid JSON with the floats themselves
+    if isinstance(value, list):
+        return [_non_finite_as_str(item) for item in value]
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    return value
+
+
+def check_zone_bounds(zone):
+    """Raise ValueError unless min <= max for the bounds that are set."""
+    for axis in ("lat", "lon"):
+        low, high = getattr(zone, f"min_{axis}"), getattr(zone, f"max_{axis}")
+        if low is not None and high is not None and low > high:
+            raise ValueError(f"min_{axis} must not be greater than max_{axis}")
+
+
+class DeliveryZoneBase(BaseModel):
+    name: str
+    description: Optional[str] = None
+    min_lat: float
+    max_lat: float
+    min_lon: float
+    max_lon: float
+    is_active: bool = True
+
+
+class DeliveryZoneCreate(DeliveryZoneBase):
+    min_lat: Latitude
+    max_lat: Latitude
+    min_lon: Longitude
+    max_lon: Longitude
+
+    _bounds_non_finite = field_validator("min_lat", "max_lat", "min_lon", "max_lon", mode="before")(_non_finite_as_str)
+
+    @model_validator(mode="after")
+    def bounds_are_ordered(self):
+        check_zone_bounds(self)
+        return self
+
+
+class DeliveryZoneUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    min_lat: Optional[Latitude] = None
+    max_lat: Optional[Latitude] = None
+    min_lon: Optional[Longitude] = None
+    max_lon: Optional[Longitude] = None
+    is_active: Optional[bool] = None
+
+    _bounds_non_finite = field_validator("min_lat", "max_lat", "min_lon", "max_lon", mode="before")(_non_finite_as_str)
+
+    @model_validator(mode="after")
+    def bounds_are_ordered(self):
+        # Only the bounds sent together; the router checks them against the stored ones
+        check_zone_bounds(self)
+        return self
+
+
+class DeliveryZone(DeliveryZoneBase):
+    id: int
+    costs: List[DeliveryCost] = []
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class DeliveryQuoteBatchRequest(BaseModel):
+    # Parallel arrays: the i-th point is (lat[i], lon[i], order_amount[i]).
+    # NaN and Infinity are refused: they have no JSON encoding for the answer
+    lat: List[FiniteFloat] = Field(max_length=MAX_QUOTE_POINTS)
+    lon: List[FiniteFloat] = Field(max_length=MAX_QUOTE_POINTS)
+    order_amount: Optional[List[FiniteFloat]] = Field(None, max_length=MAX_QUOTE_POINTS)
+
+    _quote_non_finite = field_validator("lat", "lon", "order_amount", mode="before")(_non_finite_as_str)
@@ -80,4 +80,35 @@ class Product(ProductBase):
     updated_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ProductVariant(BaseModel):
+    id: int
+    option_id: Optional[int] = None
+    name: str
+    price_addition: float = 0.0
+    position: Optional[int] = 0
+
+    class Config:
+        from_attributes = True
+
+
+class ProductOption(BaseModel):
+    id: int
+    name: str
+    type: str
+    required: bool = False
+    position: Optional[int] = 0
+    variants: List[ProductVariant] = []
+
+    class Config:
+        from_attributes = True
+
+
+class MenuProduct(Product):
+    options: List[ProductOption] = []
+    variants: List[ProductVariant] = []  # Variants that don't belong to an option
+
+
+class MenuCategory(Category):
+    products: List[MenuProduct] = []
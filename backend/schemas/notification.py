@@ -0,0 +1,74 @@
+from pydantic import BaseModel
+from typing import Dict, Optional, List
+from datetime import datetime
+
+
+class NotificationTemplateBase(BaseModel):
+    name: str
+    title: Optional[str] = None
+    message: str
+    type: str  # "order_status", "promotional", "system"
+    channel: str = "telegram"  # "telegram", "sms", "email", "push"
+    is_active: bool = True
+
+
+class NotificationTemplateCreate(NotificationTemplateBase):
+    pass
+
+
+class NotificationTemplate(NotificationTemplateBase):
+    id: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class NotificationSend(BaseModel):
+    user_ids: List[int]
+    template_id: int
+    order_id: Optional[int] = None
+    # Override the template text
+    title: Optional[str] = None
+    message: Optional[str] = None
+
+
+class Notification(BaseModel):
+    id: int
+    user_id: int
+    template_id: int
+    order_id: Optional[int] = None
+    title: Optional[str] = None
+    message: str
+    channel: str
+    status: str
+    attempts: int = 0
+    sent_at: Optional[datetime] = None
+    error_message: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class BroadcastCreate(BaseModel):
+    template_id: int
+    name: Optional[str] = None
+    # Audience: active, not blocked users, optionally by the date of their last order
+    last_order_after: Optional[datetime] = None
+    last_order_before: Optional[datetime] = None
+
+
+class Broadcast(BroadcastCreate):
+    id: int
+    status: str
+    total_recipients: Optional[int] = None
+    queued_count: int = 0
+    delivery: Dict[str, int] = {}  # Queued notifications by status
+    error_message: Optional[str] = None
+    completed_at: Optional[datetime] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -68,6 +68,12 @@ class OrderUpdate(BaseModel):
     admin_note: Optional[str] = None
 
 
+class OrderStatusChange(BaseModel):
+    order_id: int
+    status: OrderStatus
+    comment: Optional[str] = None
+
+
 class Order(OrderBase):
     id: int
     order_number: str
@@ -0,0 +1,48 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+from enum import Enum
+
+
+class PaymentStatus(str, Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    SUCCEEDED = "succeeded"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+    REFUNDED = "refunded"
+
+
+class PaymentMethod(str, Enum):
+    YOOKASSA = "yookassa"
+    CASH = "cash"
+    BONUS = "bonus"
+
+
+class PaymentBase(BaseModel):
+    order_id: int
+    payment_method: PaymentMethod = PaymentMethod.YOOKASSA
+    description: Optional[str] = None
+
+
+class PaymentCreate(PaymentBase):
+    # Where YooKassa sends the user after paying (defaults to YOOKASSA_RETURN_URL)
+    return_url: Optional[str] = None
+
+
+class Payment(PaymentBase):
+    id: int
+    user_id: int
+    payment_provider: Optional[str] = None
+    provider_payment_id: Optional[str] = None
+    amount: float
+    status: PaymentStatus
+    currency: str = "RUB"
+    refunded: bool = False
+    refunded_at: Optional[datetime] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    confirmation_url: Optional[str] = None  # YooKassa payment page, while the payment is pending
+
+    class Config:
+        from_attributes = True
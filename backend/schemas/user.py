@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from typing import Optional
 from datetime import datetime
 
@@ -33,15 +33,36 @@ class UserUpdate(BaseModel):
     address_description: Optional[str] = None
     is_blocked: Optional[bool] = None
 
+    @model_validator(mode="before")
+    @classmethod
+    def referrer_is_fixed(cls, data):
+        # The referral index (utils/referrals.py) is built at sign-up and
+        # never moves a subtree, so the referrer can't change afterwards
+        if isinstance(data, dict) and "referred_by" in data:
+            raise ValueError("referred_by can't be changed")
+        return data
+
 
 class User(UserBase):
     id: int
     total_spent: float
     order_count: int
+    last_order_at: Optional[datetime] = None
     is_active: bool
     is_blocked: bool
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class ReferralStats(BaseModel):
+    user_id: int
+    direct_referrals: int = 0
+    total_referrals: int = 0  # All levels of the referral tree
+    downstream_orders: int = 0
+    downstream_spent: float = 0.0
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,66 @@
+import hmac
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException, Query
+
+from ..config import settings
+from .telegram_auth import AUTH_SCHEME, InitDataError, authenticate
+
+STAFF_SCHEME = "bearer"  # Authorization: Bearer <STAFF_API_TOKEN>
+
+
+@dataclass(frozen=True)
+class Caller:
+    """Who sent the request: a Mini App user, or staff (back office, bots, Prometheus)."""
+
+    user_id: Optional[int] = None
+    is_staff: bool = False
+
+    def can_access(self, user_id: Optional[int]) -> bool:
+        return self.is_staff or (self.user_id is not None and self.user_id == user_id)
+
+
+async def resolve_caller(authorization: Optional[str]) -> Caller:
+    scheme, _, credentials = (authorization or "").partition(" ")
+    scheme = scheme.lower()
+    if scheme == STAFF_SCHEME and credentials:
+        if not settings.STAFF_API_TOKEN:
+            raise HTTPException(status_code=503, detail="Staff authentication is not configured")
+        if not hmac.compare_digest(credentials.encode(), settings.STAFF_API_TOKEN.encode()):
+            raise HTTPException(status_code=401, detail="Invalid staff token")
+        return Caller(is_staff=True)
+    if scheme == AUTH_SCHEME and credentials:
+        if not settings.TELEGRAM_BOT_TOKEN:
+            raise HTTPException(status_code=503, detail="Telegram authentication is not configured")
+        try:
+            return Caller(user_id=await authenticate(credentials))
+        except InitDataError as e:
+            raise HTTPException(status_code=401, detail=str(e))
+    raise HTTPException(status_code=401, detail="Authentication required")
+
+
+async def current_caller(authorization: Optional[str] = Header(None)) -> Caller:
+    """Dependency for endpoints used by both the Mini App and staff."""
+    return await resolve_caller(authorization)
+
+
+async def stream_caller(
+    authorization: Optional[str] = Header(None),
+    auth: Optional[str] = Query(None, description="Authorization header value, for EventSource clients"),
+) -> Caller:
+    """current_caller that also takes the credentials from `?auth=`, since
+    browsers' EventSource can't send headers."""
+    return await resolve_caller(authorization or auth)
+
+
+async def require_staff(caller: Caller = Depends(current_caller)) -> Caller:
+    if not caller.is_staff:
+        raise HTTPException(status_code=403, detail="Staff only")
+    return caller
+
+
+def check_access(caller: Caller, user_id: Optional[int]):
+    """403 unless the caller is staff or the user `user_id` itself."""
+    if not caller.can_access(user_id):
+        raise HTTPException(status_code=403, detail="Not allowed")
@@ -0,0 +1,285 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pytz
+from sqlalchemy import select
+
+from .. import models
+from ..config import settings
+from ..models.order import OrderStatus
+
+LOAD_BATCH_SIZE = 10000
+# Orders are re-read if their updated_at is this close to the last sync, to
+# catch transactions that committed late with an older timestamp
+SYNC_OVERLAP = timedelta(seconds=60)
+
+ORDER_DIMENSIONS = ("hour", "weekday", "order_type", "payment_method", "status")
+ITEM_DIMENSIONS = ("category_id", "product_id")
+DIMENSIONS = ORDER_DIMENSIONS + ITEM_DIMENSIONS
+NON_REVENUE_STATUSES = (OrderStatus.CANCELLED.value, OrderStatus.REFUNDED.value)
+# Up to this many possible dimension combinations groups are found by counting
+DENSE_KEY_LIMIT = 1 << 22
+
+
+class Dictionary:
+    """Dictionary encoding of a low-cardinality string column."""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def encode(self, value) -> int:
+        value = "" if value is None else str(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value) -> int:
+        return self.codes.get(value, -1)
+
+
+class GrowableColumns:
+    """Set of equally long NumPy columns with amortized O(1) appends."""
+
+    def __init__(self, dtypes: Dict[str, type]):
+        self.size = 0
+        self.data = {name: np.empty(0, dtype=dtype) for name, dtype in dtypes.items()}
+
+    def append(self, columns: Dict[str, np.ndarray]):
+        count = len(next(iter(columns.values())))
+        needed = self.size + count
+        for name, column in self.data.items():
+            if needed > column.shape[0]:
+                grown = np.empty(max(needed, 2 * column.shape[0], 1024), dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                self.data[name] = column = grown
+            column[self.size:needed] = columns[name]
+        self.size = needed
+
+    def __getitem__(self, name) -> np.ndarray:
+        return self.data[name][:self.size]
+
+    def permute(self, order: np.ndarray):
+        for name in self.data:
+            self.data[name][:self.size] = self[name][order]
+
+
+def _local_hour_and_weekday(timestamps: np.ndarray):
+    # UTC offsets only change between whole hours, so resolve them once per
+    # distinct hour and broadcast back
+    timezone = pytz.timezone(settings.RESTAURANT_TIMEZONE)
+    hours, inverse = np.unique(timestamps // 3600, return_inverse=True)
+    offsets = np.array([
+        int(datetime.fromtimestamp(int(hour) * 3600, timezone).utcoffset().total_seconds()) for hour in hours
+    ], dtype=np.int64)
+    local = timestamps + offsets[inverse] if len(hours) else timestamps
+    # 1970-01-01 was a Thursday; weekday 0 is Monday like datetime.weekday()
+    return ((local // 3600) % 24).astype(np.int8), ((local // 86400 + 3) % 7).astype(np.int8)
+
+
+class AnalyticsEngine:
+    """Columnar, in-memory copy of orders and order items for ad-hoc slicing.
+
+    Orders and items live in separate column sets; every item row points at
+    its order row, so order attributes (hour, weekday, order type, payment
+    method, status) are gathered per item on demand. Strings are dictionary
+    encoded and timestamps kept as epoch seconds. The engine loads lazily and
+    then syncs incrementally: new orders are appended and status changes
+    applied in place, based on orders.updated_at.
+    """
+
+    def __init__(self, sync_interval: float):
+        self.sync_interval = sync_interval
+        self.dictionaries = {name: Dictionary() for name in ("order_type", "payment_method", "status")}
+        self._reset()
+        self._lock = asyncio.Lock()
+
+    def _reset(self):
+        self.orders = GrowableColumns({
+            "order_id": np.int64, "created_ts": np.int64, "hour": np.int8, "weekday": np.int8,
+            "order_type": np.int16, "payment_method": np.int16, "status": np.int16,
+        })
+        self.items = GrowableColumns({
+            "order_index": np.int64, "category_id": np.int32, "product_id": np.int32,
+            "quantity": np.int32, "revenue": np.float64,
+        })
+        self._watermark: Optional[datetime] = None
+        self._synced_at = 0.0
+
+    # Loading
+
+    def _order_index(self, order_ids: np.ndarray) -> np.ndarray:
+        known = self.orders["order_id"]
+        position = np.searchsorted(known, order_ids)
+        position[position >= known.shape[0]] = 0
+        return np.where(known[position] == order_ids, position, -1) if known.shape[0] else np.full(len(order_ids), -1)
+
+    def append_orders(self, orders: Sequence, items: Sequence, category_by_product: Dict[int, int]):
+        """Appends new orders (and their items) and updates the status of known ones."""
+        if orders:
+            order_ids = np.fromiter((order.id for order in orders), dtype=np.int64, count=len(orders))
+            statuses = np.fromiter(
+                (self.dictionaries["status"].encode(getattr(order.status, "value", order.status)) for order in orders),
+                dtype=np.int16, count=len(orders),
+            )
+            existing = self._order_index(order_ids)
+            known = existing >= 0
+            self.orders["status"][existing[known]] = statuses[known]
+
+            new = [order for order, is_known in zip(orders, known) if not is_known]
+            if new:
+                created_ts = np.fromiter((int(order.created_at.timestamp()) for order in new), dtype=np.int64, count=len(new))
+                hour, weekday = _local_hour_and_weekday(created_ts)
+                self.orders.append({
+                    "order_id": order_ids[~known],
+                    "created_ts": created_ts,
+                    "hour": hour,
+                    "weekday": weekday,
+                    "order_type": [self.dictionaries["order_type"].encode(order.order_type) for order in new],
+                    "payment_method": [self.dictionaries["payment_method"].encode(order.payment_method) for order in new],
+                    "status": statuses[~known],
+                })
+                self._ensure_sorted()
+
+        if items:
+            item_order_ids = np.fromiter((item.order_id for item in items), dtype=np.int64, count=len(items))
+            self.items.append({
+                "order_index": self._order_index(item_order_ids),
+                "category_id": [category_by_product.get(item.product_id, -1) for item in items],
+                "product_id": [item.product_id for item in items],
+                "quantity": [item.quantity for item in items],
+                "revenue": [float(item.total_price) for item in items],
+            })
+
+    async def on_order_event(self, event):
+        # Status changes arrive from the event bus, so slices see them without
+        # waiting for the next sync; new orders still come in with the sync
+        if event.type != "status_changed" or not self.orders.size:
+            return
+        index = self._order_index(np.array([event.order_id], dtype=np.int64))[0]
+        if index >= 0:
+            self.orders["status"][index] = self.dictionaries["status"].encode(event.status)
+
+    def _ensure_sorted(self):
+        order_ids = self.orders["order_id"]
+        if order_ids.shape[0] < 2 or np.all(order_ids[1:] > order_ids[:-1]):
+            return
+        # Late commits can arrive with a lower id: re-sort and remap items
+        order = np.argsort(order_ids, kind="stable")
+        self.orders.permute(order)
+        new_position = np.empty_like(order)
+        new_position[order] = np.arange(order.shape[0])
+        self.items["order_index"][:] = new_position[self.items["order_index"]]
+
+    async def _load_since(self, db, since: Optional[datetime]):
+        query = select(models.Order).order_by(models.Order.id)
+        if since is not None:
+            query = query.where(models.Order.updated_at >= since - SYNC_OVERLAP)
+        category_by_product = dict((await db.execute(select(models.Product.id, models.Product.category_id))).all())
+
+        result = await db.stream(query.execution_options(yield_per=LOAD_BATCH_SIZE))
+        async for rows in result.partitions():
+            orders = [row[0] for row in rows]
+            known = self._order_index(np.fromiter((order.id for order in orders), dtype=np.int64, count=len(orders)))
+            new_ids = [order.id for order, index in zip(orders, known) if index < 0]
+            items = (await db.execute(
+                select(models.OrderItem).where(models.OrderItem.order_id.in_(new_ids)).order_by(models.OrderItem.id)
+            )).scalars().all() if new_ids else []
+            self.append_orders(orders, items, category_by_product)
+            for order in orders:
+                if order.updated_at and (self._watermark is None or order.updated_at > self._watermark):
+                    self._watermark = order.updated_at
+
+    async def sync(self, db, force: bool = False):
+        if not force and time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        async with self._lock:
+            if not force and time.monotonic() - self._synced_at < self.sync_interval:
+                return
+            await self._load_since(db, self._watermark)
+            self._synced_at = time.monotonic()
+
+    # Querying
+
+    def _dimension(self, name: str) -> np.ndarray:
+        if name in ITEM_DIMENSIONS:
+            return self.items[name]
+        return self.orders[name][self.items["order_index"]]
+
+    def _mask(self, date_from=None, date_to=None, include_cancelled=False, **equals) -> np.ndarray:
+        mask = self.items["order_index"] >= 0
+        created_ts = self.orders["created_ts"][self.items["order_index"]]
+        if date_from is not None:
+            mask &= created_ts >= int(date_from.timestamp())
+        if date_to is not None:
+            mask &= created_ts < int(date_to.timestamp())
+        if not include_cancelled:
+            excluded = [self.dictionaries["status"].lookup(status) for status in NON_REVENUE_STATUSES]
+            mask &= ~np.isin(self._dimension("status"), excluded)
+        for name, values in equals.items():
+            if not values:
+                continue
+            if name in self.dictionaries:
+                values = [self.dictionaries[name].lookup(value) for value in values]
+            mask &= np.isin(self._dimension(name), values)
+        return mask
+
+    def group_by(self, dimensions: Sequence[str], **filters) -> List[dict]:
+        """Revenue, quantity and distinct order count per combination of `dimensions`."""
+        mask = self._mask(**filters)
+
+        # Combine the dimension codes into one int64 key (mixed radix) so a
+        # single np.unique does the grouping
+        columns = [self._dimension(name)[mask].astype(np.int64) for name in dimensions]
+        key = np.zeros(int(mask.sum()), dtype=np.int64)
+        offsets, radices = [], []
+        for column in columns:
+            low = int(column.min()) if column.size else 0
+            radix = (int(column.max()) - low + 1) if column.size else 1
+            key = key * radix + (column - low)
+            offsets.append(low)
+            radices.append(radix)
+        if np.prod(radices, dtype=np.float64) <= DENSE_KEY_LIMIT:
+            # Small key space: counting beats sorting
+            present = np.bincount(key, minlength=1) > 0
+            groups = np.flatnonzero(present)
+            dense = np.cumsum(present) - 1
+            inverse = dense[key]
+        else:
+            groups, inverse = np.unique(key, return_inverse=True)
+
+        revenue = np.bincount(inverse, weights=self.items["revenue"][mask], minlength=groups.shape[0])
+        quantity = np.bincount(inverse, weights=self.items["quantity"][mask], minlength=groups.shape[0])
+        order_index = self.items["order_index"][mask]
+        pairs = np.sort(inverse.astype(np.int64) * (self.orders.size + 1) + order_index)
+        distinct = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))] if pairs.size else pairs
+        orders = np.bincount(distinct // (self.orders.size + 1), minlength=groups.shape[0])
+
+        values = []
+        remainder = groups.copy()
+        for low, radix in zip(reversed(offsets), reversed(radices)):
+            values.append(remainder % radix + low)
+            remainder //= radix
+        values.reverse()
+
+        rows = []
+        for position in range(groups.shape[0]):
+            row = {}
+            for name, column in zip(dimensions, values):
+                value = int(column[position])
+                row[name] = self.dictionaries[name].values[value] if name in self.dictionaries else value
+            row.update(
+                revenue=round(float(revenue[position]), 2),
+                quantity=int(quantity[position]),
+                orders=int(orders[position]),
+            )
+            rows.append(row)
+        return rows
+
+
+analytics_engine = AnalyticsEngine(sync_interval=settings.ANALYTICS_ENGINE_SYNC_SECONDS)
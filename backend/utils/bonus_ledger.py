@@ -0,0 +1,155 @@
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sqlalchemy import Integer, Numeric, String, Text, cast, column, func, insert, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from .. import models
+from .user_cache import user_cache
+
+CENT = Decimal("0.01")
+
+
+class InsufficientBonusError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Accrual:
+    user_id: int
+    amount: Decimal
+    transaction_type: str = "earned"
+    program_id: Optional[int] = None
+    order_id: Optional[int] = None
+    description: Optional[str] = None
+
+
+def to_amount(value) -> Decimal:
+    return Decimal(str(value)).quantize(CENT)
+
+
+def _ledger_insert(changed, accruals):
+    """INSERT of the ledger rows for the users an UPDATE ... RETURNING changed.
+
+    `changed` is the UPDATE as a CTE with the new balance; `accruals` the
+    accrual rows the amounts came from. Both run as one statement, so the
+    balance change and its ledger row can't be separated.
+    """
+    ledger = models.BonusTransaction
+    return (
+        insert(ledger)
+        .from_select(
+            [
+                ledger.user_id, ledger.program_id, ledger.order_id, ledger.amount,
+                ledger.balance_before, ledger.balance_after, ledger.description, ledger.transaction_type,
+            ],
+            select(
+                changed.c.id,
+                accruals.c.program_id,
+                accruals.c.order_id,
+                accruals.c.amount,
+                changed.c.bonus_balance - accruals.c.amount,
+                changed.c.bonus_balance,
+                accruals.c.description,
+                accruals.c.transaction_type,
+            ).join_from(changed, accruals, accruals.c.user_id == changed.c.id),
+        )
+        .returning(ledger.user_id, ledger.balance_after)
+    )
+
+
+def _accruals_values(accruals: List[Accrual]):
+    # One array parameter per column instead of a VALUES row per accrual: the
+    # statement is the same for any batch, so it is compiled once and cached
+    rows = func.unnest(
+        cast([a.user_id for a in accruals], ARRAY(Integer)),
+        cast([to_amount(a.amount) for a in accruals], ARRAY(Numeric(10, 2))),
+        cast([a.transaction_type for a in accruals], ARRAY(String)),
+        cast([a.program_id for a in accruals], ARRAY(Integer)),
+        cast([a.order_id for a in accruals], ARRAY(Integer)),
+        cast([a.description for a in accruals], ARRAY(Text)),
+    ).table_valued(
+        column("user_id", Integer),
+        column("amount", Numeric(10, 2)),
+        column("transaction_type", String),
+        column("program_id", Integer),
+        column("order_id", Integer),
+        column("description", Text),
+    ).render_derived(name="rows")
+    return select(rows).cte("accruals")
+
+
+async def apply(
+    db,
+    user_id: int,
+    amount,
+    transaction_type: str,
+    program_id: Optional[int] = None,
+    order_id: Optional[int] = None,
+    description: Optional[str] = None,
+) -> Decimal:
+    """Adds `amount` (negative to spend) to the user's balance; returns the new balance.
+
+    A single conditional UPDATE, so concurrent earns and spends never lose an
+    update and the balance can't go negative, without SELECT ... FOR UPDATE.
+    Raises InsufficientBonusError when the balance doesn't cover a spend.
+    The caller commits.
+    """
+    accruals = _accruals_values([Accrual(user_id, amount, transaction_type, program_id, order_id, description)])
+    user = models.User
+    changed = (
+        update(user)
+        .where(user.id == accruals.c.user_id, user.bonus_balance + accruals.c.amount >= 0)
+        .values(bonus_balance=user.bonus_balance + accruals.c.amount)
+        .returning(user.id, user.bonus_balance)
+        .cte("changed")
+    )
+    row = (await db.execute(_ledger_insert(changed, accruals))).first()
+    if row is None:
+        raise InsufficientBonusError("Not enough bonuses")
+    user_cache.mark_dirty(db, user_id)
+    return row.balance_after
+
+
+async def earn(db, user_id: int, amount, **kwargs) -> Decimal:
+    return await apply(db, user_id, to_amount(amount), kwargs.pop("transaction_type", "earned"), **kwargs)
+
+
+async def spend(db, user_id: int, amount, **kwargs) -> Decimal:
+    return await apply(db, user_id, -to_amount(amount), kwargs.pop("transaction_type", "used"), **kwargs)
+
+
+async def accrue_many(db, accruals: List[Accrual]) -> Dict[int, Decimal]:
+    """Credits many users with one UPDATE ... FROM unnest(...) per round; returns new balances.
+
+    An UPDATE changes each row at most once, so a user with several accruals
+    gets them over consecutive rounds (usually there is just one). Accruals
+    must be non-negative; the caller commits.
+    """
+    rounds: List[List[Accrual]] = []
+    seen: Dict[int, int] = {}  # user id -> accruals queued so far
+    for accrual in accruals:
+        if to_amount(accrual.amount) < 0:
+            raise ValueError("Use spend() for negative amounts")
+        index = seen.get(accrual.user_id, 0)
+        seen[accrual.user_id] = index + 1
+        if index == len(rounds):
+            rounds.append([])
+        rounds[index].append(accrual)
+
+    balances: Dict[int, Decimal] = {}
+    user = models.User
+    for batch in rounds:
+        accrual_values = _accruals_values(batch)
+        changed = (
+            update(user)
+            .where(user.id == accrual_values.c.user_id)
+            .values(bonus_balance=user.bonus_balance + accrual_values.c.amount)
+            .returning(user.id, user.bonus_balance)
+            .cte("changed")
+        )
+        for row in (await db.execute(_ledger_insert(changed, accrual_values))).all():
+            balances[row.user_id] = row.balance_after
+    user_cache.mark_dirty(db, *balances)
+    return balances
@@ -0,0 +1,216 @@
+import argparse
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import List, Tuple
+
+import numpy as np
+import pytz
+from sqlalchemy import func, select
+
+from .. import models
+from ..config import settings
+from ..models.order import OrderStatus
+from . import bonus_ledger
+from .bonus_ledger import Accrual
+from .order_numbers import business_day
+from .snapshot import VersionedCache
+
+logger = logging.getLogger(__name__)
+
+ORDER_PROGRAM_TYPES = ("order_percent", "fixed_amount")
+REACCRUAL_CHUNK_SIZE = 5000
+
+
+def bonus_base(total_amount, bonus_used):
+    # Bonuses are earned on what was paid for the goods (delivery excluded)
+    return total_amount - bonus_used
+
+
+@dataclass(frozen=True)
+class BonusRules:
+    """Active bonus programs compiled into arrays.
+
+    Order programs become one column each, so any number of orders is
+    evaluated against all programs with a handful of NumPy operations.
+    """
+
+    program_ids: np.ndarray
+    is_percent: np.ndarray
+    values: np.ndarray
+    min_amounts: np.ndarray
+    max_amounts: np.ndarray
+    registration: List[Tuple[int, float]]  # (program id, amount)
+    referral: List[Tuple[int, float]]
+
+    @classmethod
+    def compile(cls, programs) -> "BonusRules":
+        order_programs = [program for program in programs if program.type in ORDER_PROGRAM_TYPES]
+        return cls(
+            program_ids=np.array([program.id for program in order_programs], dtype=np.int64),
+            is_percent=np.array([program.type == "order_percent" for program in order_programs], dtype=bool),
+            values=np.array([float(program.value) for program in order_programs], dtype=np.float64),
+            min_amounts=np.array(
+                [float(program.min_order_amount or 0) for program in order_programs], dtype=np.float64
+            ),
+            max_amounts=np.array(
+                [np.inf if program.max_bonus_amount is None else float(program.max_bonus_amount)
+                 for program in order_programs],
+                dtype=np.float64,
+            ),
+            registration=[(program.id, float(program.value)) for program in programs if program.type == "registration"],
+            referral=[(program.id, float(program.value)) for program in programs if program.type == "referral"],
+        )
+
+    def evaluate_many(self, amounts) -> np.ndarray:
+        """Bonus per order (rows) and order program (columns, see program_ids)."""
+        amounts = np.asarray(amounts, dtype=np.float64)[:, None]
+        bonus = np.where(self.is_percent, amounts * self.values / 100, self.values)
+        bonus = np.minimum(bonus, self.max_amounts)
+        bonus = np.where(amounts >= self.min_amounts, bonus, 0.0)
+        return np.round(bonus, 2)
+
+    def evaluate(self, amount: float) -> List[Tuple[int, float]]:
+        bonuses = self.evaluate_many([amount])[0]
+        return [
+            (program_id, bonus)
+            for program_id, bonus in zip(self.program_ids.tolist(), bonuses.tolist()) if bonus > 0
+        ]
+
+    def order_accruals(self, order) -> List[Accrual]:
+        amount = float(bonus_base(order.total_amount, order.bonus_used or 0))
+        return [
+            Accrual(
+                user_id=order.user_id,
+                amount=bonus,
+                program_id=program_id,
+                order_id=order.id,
+                description=f"Order {order.order_number}",
+            )
+            for program_id, bonus in self.evaluate(amount)
+        ]
+
+
+class BonusRulesCache(VersionedCache):
+    async def build(self, db) -> BonusRules:
+        programs = (await db.execute(
+            select(models.BonusProgram)
+            .where(models.BonusProgram.is_active == True)
+            .order_by(models.BonusProgram.id)
+        )).scalars().all()
+        return BonusRules.compile(programs)
+
+
+bonus_rules = BonusRulesCache(ttl=settings.BONUS_RULES_CACHE_TTL_SECONDS)
+
+
+async def accrue_for_new_user(db, user):
+    """Registration bonus for the user and referral bonus for whoever invited them."""
+    await accrue_for_new_users(db, [user])
+
+
+async def accrue_for_new_users(db, users):
+    rules = (await bonus_rules.get(db)).data
+    accruals = []
+    for user in users:
+        accruals += [
+            Accrual(user_id=user.id, amount=amount, program_id=program_id, description="Registration bonus")
+            for program_id, amount in rules.registration
+        ]
+        if user.referred_by:
+            accruals += [
+                Accrual(
+                    user_id=user.referred_by,
+                    amount=amount,
+                    transaction_type="referral_bonus",
+                    program_id=program_id,
+                    description=f"Referral of user {user.id}",
+                )
+                for program_id, amount in rules.referral
+            ]
+    if accruals:
+        await bonus_ledger.accrue_many(db, accruals)
+
+
+async def reaccrue(db, date_from: date, date_to: date) -> int:
+    """Credits bonuses missing for orders delivered in [date_from, date_to).
+
+    Expected bonuses of all orders are computed in one vectorized pass and
+    compared with what the ledger already holds per (order, program), so the
+    job can be re-run any time: it only credits the difference. Returns the
+    number of accruals made.
+    """
+    rules = (await bonus_rules.get(db)).data
+    if not len(rules.program_ids):
+        return 0
+    timezone = pytz.timezone(settings.RESTAURANT_TIMEZONE)
+    order = models.Order
+    in_range = (
+        order.status == OrderStatus.DELIVERED,
+        order.created_at >= timezone.localize(datetime.combine(date_from, time())),
+        order.created_at < timezone.localize(datetime.combine(date_to, time())),
+    )
+    orders = (await db.execute(
+        select(order.id, order.user_id, order.order_number, order.total_amount, order.bonus_used)
+        .where(*in_range)
+        .order_by(order.id)
+    )).all()
+    if not orders:
+        return 0
+
+    order_ids = np.fromiter((row.id for row in orders), dtype=np.int64, count=len(orders))
+    amounts = np.fromiter(
+        (float(bonus_base(row.total_amount, row.bonus_used or 0)) for row in orders),
+        dtype=np.float64, count=len(orders),
+    )
+    missing = rules.evaluate_many(amounts)
+
+    ledger = models.BonusTransaction
+    credited = (await db.execute(
+        select(ledger.order_id, ledger.program_id, func.sum(ledger.amount))
+        .join(order, order.id == ledger.order_id)
+        .where(*in_range, ledger.program_id.in_(rules.program_ids.tolist()))
+        .group_by(ledger.order_id, ledger.program_id)
+    )).all()
+    if credited:
+        # Program ids are sorted by the cache query, which searchsorted relies on
+        rows = np.searchsorted(order_ids, [row[0] for row in credited])
+        columns = np.searchsorted(rules.program_ids, [row[1] for row in credited])
+        np.subtract.at(missing, (rows, columns), [float(row[2]) for row in credited])
+
+    rows, columns = np.nonzero(np.round(missing, 2) >= 0.01)
+    accruals = [
+        Accrual(
+            user_id=orders[row].user_id,
+            amount=round(float(missing[row, column]), 2),
+            program_id=int(rules.program_ids[column]),
+            order_id=orders[row].id,
+            description=f"Order {orders[row].order_number}",
+        )
+        for row, column in zip(rows.tolist(), columns.tolist())
+    ]
+    for start in range(0, len(accruals), REACCRUAL_CHUNK_SIZE):
+        await bonus_ledger.accrue_many(db, accruals[start:start + REACCRUAL_CHUNK_SIZE])
+        await db.commit()
+    return len(accruals)
+
+
+async def _main(date_from: date, date_to: date):
+    from ..database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        count = await reaccrue(db, date_from, date_to)
+    logger.info("Credited %s missing order bonuses", count)
+
+
+if __name__ == "__main__":
+    # Nightly: python -m backend.utils.bonus_rules (defaults to yesterday)
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Credit order bonuses missing from the ledger")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat)
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="exclusive")
+    args = parser.parse_args()
+    date_to = args.date_to or business_day()
+    date_from = args.date_from or date_to - timedelta(days=1)
+    asyncio.run(_main(date_from, date_to))
@@ -0,0 +1,149 @@
+import logging
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, List, Sequence
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_QUERY_LOG_SIZE = 50
+SLOW_QUERY_TEXT_LENGTH = 500
+
+# Per-request totals: the request middleware sets an object with `queries`
+# and `db_time` attributes, and every query of the request adds to it
+request_db_stats: ContextVar = ContextVar("request_db_stats", default=None)
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and an increment."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        total, result = 0, []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "buckets": {
+                str(bound): count
+                for bound, count in zip((*self.buckets, "+Inf"), self.cumulative())
+            },
+        }
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkout_time = Histogram()
+        self.checkout_timeouts = 0
+        self.connections_created = 0
+        self.connections_invalidated = 0
+
+
+class QueryMetrics:
+    def __init__(self, slow_threshold: float):
+        self.slow_threshold = slow_threshold
+        self.duration = Histogram()
+        self.slow_count = 0
+        self.slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+    def record(self, statement: str, duration: float):
+        self.duration.observe(duration)
+        if duration >= self.slow_threshold:
+            self.slow_count += 1
+            self.slow_queries.append({
+                "statement": statement[:SLOW_QUERY_TEXT_LENGTH],
+                "duration_ms": round(duration * 1000, 3),
+                "at": datetime.now(timezone.utc).isoformat(),
+            })
+            logger.warning("Slow query (%.1f ms): %s", duration * 1000, statement[:SLOW_QUERY_TEXT_LENGTH])
+
+
+pool_metrics = PoolMetrics()
+query_metrics = QueryMetrics(slow_threshold=settings.DB_SLOW_QUERY_MS / 1000)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """The async engine's default pool, timing how long checkouts take.
+
+    The time includes waiting for a free connection, opening a new one and
+    the pre-ping, i.e. everything a request waits for before its first query.
+    """
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            pool_metrics.checkout_timeouts += 1
+            raise
+        finally:
+            pool_metrics.checkout_time.observe(time.perf_counter() - started)
+
+
+def instrument(engine):
+    """Hooks pool and query timing into an (async) engine."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_started"].pop()
+        query_metrics.record(statement, duration)
+        stats = request_db_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += duration
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _failed(context):
+        # after_cursor_execute doesn't run for failed statements
+        if context.connection is not None:
+            started = context.connection.info.get("query_started")
+            if started:
+                started.pop()
+
+    @event.listens_for(sync_engine.pool, "connect")
+    def _connected(dbapi_connection, connection_record):
+        pool_metrics.connections_created += 1
+
+    @event.listens_for(sync_engine.pool, "invalidate")
+    def _invalidated(dbapi_connection, connection_record, exception):
+        pool_metrics.connections_invalidated += 1
+
+
+def pool_status(engine) -> Dict[str, int]:
+    pool = getattr(engine, "sync_engine", engine).pool
+    return {
+        "size": pool.size(),
+        "in_use": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+    }
@@ -0,0 +1,239 @@
+import math
+from bisect import bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from statistics import median
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from .. import models, schemas
+from ..config import settings
+from .etag import make_etag
+from .geo import haversine_km, haversine_km_np
+from .snapshot import VersionedCache
+
+
+@dataclass(frozen=True)
+class DeliveryQuote:
+    is_available: bool
+    zone_id: Optional[int]
+    zone_name: Optional[str]
+    distance_km: float
+    delivery_cost: Optional[float]
+    min_order_amount: Optional[float] = None  # Set when the order is too small for the zone
+
+
+@dataclass(frozen=True)
+class DeliveryQuoteBatch:
+    is_available: np.ndarray
+    zone_id: np.ndarray  # -1 where no zone matched
+    distance_km: np.ndarray
+    delivery_cost: np.ndarray  # NaN where delivery is not available
+    min_order_amount: np.ndarray  # NaN unless the order is too small for the zone
+
+
+class DeliveryZoneIndex:
+    """Uniform grid over the bounding boxes of the active zones.
+
+    Every zone is registered in each grid cell its box overlaps, so locating a
+    point only checks the handful of zones of a single cell. Candidates are
+    ordered smallest zone first, which lets a small zone (e.g. downtown) take
+    precedence over a larger one it lies in. Zones that would cover more than
+    MAX_CELLS_PER_ZONE cells (e.g. a catch-all region) aren't put in the grid
+    but kept in a short list checked for every point. Cost tiers are kept
+    sorted by min_order_amount per zone and picked with bisect.
+    """
+
+    MIN_CELL_SIZE = 0.001  # ~110 m
+    MAX_CELLS_PER_ZONE = 1024
+
+    def __init__(self, zones: List[schemas.DeliveryZone]):
+        self.zones = sorted(
+            zones,
+            key=lambda zone: ((zone.max_lat - zone.min_lat) * (zone.max_lon - zone.min_lon), zone.id),
+        )
+        self.tiers: Dict[int, List[schemas.DeliveryCost]] = {}
+        self.tier_thresholds: Dict[int, List[float]] = {}
+        for zone in self.zones:
+            tiers = sorted(zone.costs, key=lambda tier: (tier.min_order_amount or 0.0, tier.id))
+            self.tiers[zone.id] = tiers
+            self.tier_thresholds[zone.id] = [tier.min_order_amount or 0.0 for tier in tiers]
+
+        spans = [max(zone.max_lat - zone.min_lat, zone.max_lon - zone.min_lon) for zone in self.zones]
+        self.cell_size = max(median(spans) / 2, self.MIN_CELL_SIZE) if spans else 1.0
+        self.rank = {zone.id: rank for rank, zone in enumerate(self.zones)}  # Smallest first
+        self.cells: Dict[Tuple[int, int], List[schemas.DeliveryZone]] = defaultdict(list)
+        self.wide_zones: List[schemas.DeliveryZone] = []
+        for zone in self.zones:
+            lat_from, lon_from = self._cell(zone.min_lat, zone.min_lon)
+            lat_to, lon_to = self._cell(zone.max_lat, zone.max_lon)
+            if (lat_to - lat_from + 1) * (lon_to - lon_from + 1) > self.MAX_CELLS_PER_ZONE:
+                self.wide_zones.append(zone)
+                continue
+            for lat_cell in range(lat_from, lat_to + 1):
+                for lon_cell in range(lon_from, lon_to + 1):
+                    self.cells[(lat_cell, lon_cell)].append(zone)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    @staticmethod
+    def _first_containing(zones, lat: float, lon: float) -> Optional[schemas.DeliveryZone]:
+        for zone in zones:
+            if zone.min_lat <= lat <= zone.max_lat and zone.min_lon <= lon <= zone.max_lon:
+                return zone
+        return None
+
+    def locate(self, lat: float, lon: float) -> Optional[schemas.DeliveryZone]:
+        zone = self._first_containing(self.cells.get(self._cell(lat, lon), ()), lat, lon)
+        wide = self._first_containing(self.wide_zones, lat, lon)
+        # A wide zone isn't necessarily a big one (a long thin strip), so compare
+        if zone is None or (wide is not None and self.rank[wide.id] < self.rank[zone.id]):
+            return wide
+        return zone
+
+    def tier_for(self, zone_id: int, order_amount: float) -> Optional[schemas.DeliveryCost]:
+        position = bisect_right(self.tier_thresholds[zone_id], order_amount)
+        return self.tiers[zone_id][position - 1] if position else None
+
+    def quote(self, lat: float, lon: float, order_amount: float = 0.0) -> DeliveryQuote:
+        distance_km = round(haversine_km(
+            settings.RESTAURANT_ADDRESS_LAT, settings.RESTAURANT_ADDRESS_LON, lat, lon
+        ), 2)
+        distance_cost = settings.DELIVERY_BASE_COST + settings.DELIVERY_COST_PER_KM * distance_km
+        free = order_amount >= settings.FREE_DELIVERY_THRESHOLD
+
+        if not self.zones:
+            # No zones configured: deliver anywhere with plain distance pricing
+            return DeliveryQuote(True, None, None, distance_km, 0.0 if free else round(distance_cost, 2))
+
+        zone = self.locate(lat, lon)
+        if zone is None:
+            return DeliveryQuote(False, None, None, distance_km, None)
+        if not self.tiers[zone.id]:
+            return DeliveryQuote(True, zone.id, zone.name, distance_km, 0.0 if free else round(distance_cost, 2))
+
+        tier = self.tier_for(zone.id, order_amount)
+        if tier is None:
+            return DeliveryQuote(False, zone.id, zone.name, distance_km, None,
+                                 min_order_amount=self.tier_thresholds[zone.id][0])
+        if free or tier.is_free:
+            cost = 0.0
+        elif tier.is_flat_rate:
+            cost = tier.cost
+        else:
+            cost = tier.cost + settings.DELIVERY_COST_PER_KM * distance_km
+        return DeliveryQuote(True, zone.id, zone.name, distance_km, round(cost, 2))
+
+    def quote_many(self, lat, lon, order_amount) -> DeliveryQuoteBatch:
+        """Vectorized `quote` over arrays of points; pricing rules are identical."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        order_amount = np.asarray(order_amount, dtype=np.float64)
+        size = lat.shape[0]
+
+        distance_km = np.round(haversine_km_np(
+            settings.RESTAURANT_ADDRESS_LAT, settings.RESTAURANT_ADDRESS_LON, lat, lon
+        ), 2)
+        distance_cost = settings.DELIVERY_BASE_COST + settings.DELIVERY_COST_PER_KM * distance_km
+        free = order_amount >= settings.FREE_DELIVERY_THRESHOLD
+
+        zone_id = np.full(size, -1, dtype=np.int64)
+        min_order_amount = np.full(size, np.nan)
+        if not self.zones:
+            cost = np.where(free, 0.0, np.round(distance_cost, 2))
+            return DeliveryQuoteBatch(np.ones(size, dtype=bool), zone_id, distance_km, cost, min_order_amount)
+
+        cost = np.full(size, np.nan)
+        matched = np.zeros(size, dtype=bool)
+        # Points sorted by latitude: each zone only inspects the slice inside its
+        # latitude band. Zones go smallest first, so the first match wins exactly
+        # as in `locate`.
+        by_lat = np.argsort(lat, kind="stable")
+        sorted_lat = lat[by_lat]
+        for zone in self.zones:
+            start = np.searchsorted(sorted_lat, zone.min_lat, side="left")
+            stop = np.searchsorted(sorted_lat, zone.max_lat, side="right")
+            candidates = by_lat[start:stop]
+            candidate_lon = lon[candidates]
+            points = candidates[
+                ~matched[candidates] & (candidate_lon >= zone.min_lon) & (candidate_lon <= zone.max_lon)
+            ]
+            if not points.size:
+                continue
+            matched[points] = True
+            zone_id[points] = zone.id
+
+            tiers = self.tiers[zone.id]
+            if not tiers:
+                cost[points] = np.where(free[points], 0.0, distance_cost[points])
+                continue
+            thresholds = np.asarray(self.tier_thresholds[zone.id])
+            position = np.searchsorted(thresholds, order_amount[points], side="right") - 1
+            too_small = position < 0
+            min_order_amount[points[too_small]] = thresholds[0]
+
+            points = points[~too_small]
+            position = position[~too_small]
+            tier_cost = np.asarray([tier.cost for tier in tiers])[position]
+            tier_free = np.asarray([tier.is_free for tier in tiers])[position]
+            tier_flat = np.asarray([tier.is_flat_rate for tier in tiers])[position]
+            cost[points] = np.where(
+                free[points] | tier_free,
+                0.0,
+                np.where(tier_flat, tier_cost, tier_cost + settings.DELIVERY_COST_PER_KM * distance_km[points]),
+            )
+
+        cost = np.round(cost, 2)
+        return DeliveryQuoteBatch(~np.isnan(cost), zone_id, distance_km, cost, min_order_amount)
+
+
+@dataclass(frozen=True)
+class DeliveryZonesSnapshot:
+    zones: List[schemas.DeliveryZone]
+    index: DeliveryZoneIndex
+    zones_json: bytes
+    zones_etag: str
+
+
+_zones_adapter = TypeAdapter(List[schemas.DeliveryZone])
+
+
+class DeliveryZoneCache(VersionedCache):
+    """Active delivery zones together with their cost tiers."""
+
+    async def build(self, db) -> DeliveryZonesSnapshot:
+        zones = (await db.execute(
+            select(models.DeliveryZone)
+            .where(models.DeliveryZone.is_active == True)
+            .order_by(models.DeliveryZone.id)
+        )).scalars().all()
+        costs = (await db.execute(
+            select(models.DeliveryCost)
+            .where(models.DeliveryCost.zone_id.in_([zone.id for zone in zones]))
+            .order_by(models.DeliveryCost.zone_id, models.DeliveryCost.min_order_amount)
+        )).scalars().all() if zones else []
+
+        costs_by_zone = defaultdict(list)
+        for cost in costs:
+            costs_by_zone[cost.zone_id].append(schemas.DeliveryCost.model_validate(cost))
+
+        items = []
+        for zone in zones:
+            item = schemas.DeliveryZone.model_validate(zone)
+            item.costs = costs_by_zone.get(item.id, [])
+            items.append(item)
+
+        zones_json = _zones_adapter.dump_json(items)
+        return DeliveryZonesSnapshot(
+            zones=items,
+            index=DeliveryZoneIndex(items),
+            zones_json=zones_json,
+            zones_etag=make_etag(zones_json),
+        )
+
+
+delivery_zone_cache = DeliveryZoneCache(ttl=settings.DELIVERY_ZONES_CACHE_TTL_SECONDS)
@@ -0,0 +1,32 @@
+import hashlib
+
+from fastapi import Request, Response
+
+
+def make_etag(body: bytes) -> str:
+    # Strong validator: identical bytes produce identical tags in every worker
+    return '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so a W/ prefix is ignored
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def json_response(request: Request, body: bytes, etag: str) -> Response:
+    # "no-cache" makes clients revalidate every time, which is cheap thanks to the 304
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
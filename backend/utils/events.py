@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+ORDERS_TOPIC = "orders"
+SUBSCRIPTION_QUEUE_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class OrderEvent:
+    type: str  # "created", "status_changed" ("snapshot" for a live feed's first message)
+    order_id: int
+    order_number: str
+    user_id: int
+    order_type: str
+    status: str
+    old_status: Optional[str]
+    final_amount: float
+    changed_at: datetime
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["changed_at"] = self.changed_at.isoformat()
+        return data
+
+
+def order_event(event_type: str, order, old_status=None, changed_at: Optional[datetime] = None) -> OrderEvent:
+    return OrderEvent(
+        type=event_type,
+        order_id=order.id,
+        order_number=order.order_number,
+        user_id=order.user_id,
+        order_type=order.order_type,
+        status=getattr(order.status, "value", order.status),
+        old_status=getattr(old_status, "value", old_status),
+        final_amount=float(order.final_amount),
+        changed_at=changed_at or datetime.now(timezone.utc),
+    )
+
+
+class Subscription:
+    """Bounded queue of events for one consumer.
+
+    A consumer that falls behind loses the oldest events rather than
+    holding memory or slowing down publishers; `dropped` tells it so.
+    """
+
+    def __init__(self, bus: "EventBus", topic: str, maxsize: int):
+        self._bus = bus
+        self.topic = topic
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self._bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EventBus:
+    """In-process topic pub/sub.
+
+    Publishing never blocks and never fails: each subscriber has its own
+    bounded queue. Handlers registered with `subscribe` are run one event at
+    a time by a worker task of their own, so a slow or failing handler
+    neither delays the publisher nor other handlers. Events are published
+    after the change they describe was committed.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._handlers: List[tuple] = []  # (subscription, handler)
+        self._workers: Dict[Subscription, asyncio.Task] = {}
+
+    def listen(self, topic: str, maxsize: int = SUBSCRIPTION_QUEUE_SIZE) -> Subscription:
+        subscription = Subscription(self, topic, maxsize)
+        self._subscriptions[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions[subscription.topic].discard(subscription)
+
+    def subscribe(self, topic: str, handler: Callable[[Any], Awaitable[None]]):
+        self._handlers.append((self.listen(topic), handler))
+
+    def publish(self, topic: str, event):
+        self._start_workers()
+        for subscription in list(self._subscriptions.get(topic, ())):
+            subscription.put(event)
+
+    def _start_workers(self):
+        # Lazily, as handlers may be registered before the event loop runs
+        for subscription, handler in self._handlers:
+            if subscription not in self._workers:
+                self._workers[subscription] = asyncio.create_task(self._work(subscription, handler))
+
+    async def _work(self, subscription: Subscription, handler):
+        while True:
+            event = await subscription.get()
+            try:
+                await handler(event)
+            except Exception:
+                logger.exception("Handler %s failed on %s event", getattr(handler, "__qualname__", handler), subscription.topic)
+
+    async def stop(self):
+        workers, self._workers = list(self._workers.values()), {}
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+event_bus = EventBus()
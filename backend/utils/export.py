@@ -0,0 +1,129 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+
+from sqlalchemy import select
+
+from .. import models
+
+# Rows fetched per round trip from the server-side cursor; also the size of
+# the chunks handed to StreamingResponse
+EXPORT_BATCH_SIZE = 2000
+
+ORDER_COLUMNS = [
+    "id", "order_number", "user_id", "status", "order_type", "payment_method", "payment_status",
+    "total_amount", "bonus_used", "delivery_cost", "final_amount",
+    "delivery_address_description", "customer_phone", "created_at",
+]
+ORDER_ITEM_COLUMNS = ["product_id", "quantity", "price", "total_price", "note"]
+USER_COLUMNS = [
+    "id", "telegram_id", "username", "first_name", "last_name", "phone_number", "email",
+    "total_spent", "order_count", "bonus_balance", "is_active", "is_blocked",
+    "referral_code", "referred_by", "created_at",
+]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _plain(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+async def _partitions(db, query):
+    # db.stream() keeps a server-side cursor open, so only one batch of rows is
+    # held in memory at a time regardless of the table size
+    result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    async for rows in result.partitions():
+        yield rows
+
+
+def _orders_query(created_from=None, created_to=None):
+    order_columns = [getattr(models.Order, name) for name in ORDER_COLUMNS]
+    item_columns = [getattr(models.OrderItem, name).label(f"item_{name}") for name in ORDER_ITEM_COLUMNS]
+    query = (
+        select(*order_columns, models.OrderItem.id.label("item_id"), *item_columns)
+        .outerjoin(models.OrderItem, models.OrderItem.order_id == models.Order.id)
+        .order_by(models.Order.id, models.OrderItem.id)
+    )
+    if created_from is not None:
+        query = query.where(models.Order.created_at >= created_from)
+    if created_to is not None:
+        query = query.where(models.Order.created_at < created_to)
+    return query
+
+
+async def export_orders_ndjson(db, created_from=None, created_to=None):
+    """One JSON line per order with its items nested.
+
+    Rows arrive ordered by order id, so an order is complete as soon as the
+    next one starts and only the current order is buffered across batches.
+    """
+    current = None
+    async for rows in _partitions(db, _orders_query(created_from, created_to)):
+        lines = []
+        for row in rows:
+            if current is None or current["id"] != row.id:
+                if current is not None:
+                    lines.append(json.dumps(current, ensure_ascii=False))
+                current = {name: _plain(getattr(row, name)) for name in ORDER_COLUMNS}
+                current["items"] = []
+            if row.item_id is not None:
+                current["items"].append({name: _plain(getattr(row, f"item_{name}")) for name in ORDER_ITEM_COLUMNS})
+        if lines:
+            yield "\n".join(lines) + "\n"
+    if current is not None:
+        yield json.dumps(current, ensure_ascii=False) + "\n"
+
+
+async def export_orders_csv(db, created_from=None, created_to=None):
+    """One CSV row per order item, repeating the order columns."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ORDER_COLUMNS + [f"item_{name}" for name in ORDER_ITEM_COLUMNS])
+    yield buffer.getvalue()
+    async for rows in _partitions(db, _orders_query(created_from, created_to)):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            writer.writerow(
+                [_plain(getattr(row, name)) for name in ORDER_COLUMNS]
+                + [_plain(getattr(row, f"item_{name}")) for name in ORDER_ITEM_COLUMNS]
+            )
+        yield buffer.getvalue()
+
+
+def _users_query():
+    return select(*[getattr(models.User, name) for name in USER_COLUMNS]).order_by(models.User.id)
+
+
+async def export_users_ndjson(db):
+    async for rows in _partitions(db, _users_query()):
+        yield "".join(
+            json.dumps({name: _plain(getattr(row, name)) for name in USER_COLUMNS}, ensure_ascii=False) + "\n"
+            for row in rows
+        )
+
+
+async def export_users_csv(db):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(USER_COLUMNS)
+    yield buffer.getvalue()
+    async for rows in _partitions(db, _users_query()):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            writer.writerow([_plain(getattr(row, name)) for name in USER_COLUMNS])
+        yield buffer.getvalue()
@@ -0,0 +1,24 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def haversine_km_np(lat1, lon1, lat2, lon2) -> np.ndarray:
+    # Same formula as haversine_km, element-wise over arrays (scalars broadcast)
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = np.radians(np.subtract(lon2, lon1))
+    a = np.sin(d_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
@@ -0,0 +1,305 @@
+import asyncio
+import functools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+
+from .db_metrics import Histogram, pool_metrics, pool_status, query_metrics, request_db_stats
+
+logger = logging.getLogger(__name__)
+
+UNMATCHED_ROUTE = "unmatched"  # 404s, so that random paths don't create label sets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+PROFILE_MAX_STACKS = 10_000  # Distinct stacks kept per request, bounds long streams
+
+
+class RequestStats:
+    """What one request did; the middleware puts it in request_db_stats."""
+
+    __slots__ = ("route", "queries", "db_time", "endpoint_done", "serialization_time", "samples")
+
+    def __init__(self):
+        self.route: Optional[str] = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.endpoint_done: Optional[float] = None
+        self.serialization_time = 0.0
+        self.samples: Optional[Dict[str, int]] = None  # Folded stack -> count, when profiling
+
+
+class RequestMetrics:
+    """Histograms per route (the path template, e.g. /api/v1/orders/{order_id})."""
+
+    def __init__(self):
+        self.latency: Dict[Tuple[str, str, str], Histogram] = {}  # (method, route, status)
+        self.db_queries: Dict[Tuple[str, str], Histogram] = {}
+        self.db_time: Dict[Tuple[str, str], Histogram] = {}
+        self.serialization: Dict[Tuple[str, str], Histogram] = {}
+
+    @staticmethod
+    def _observe(histograms: dict, key: tuple, value: float, buckets=None):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(buckets) if buckets else Histogram()
+        histogram.observe(value)
+
+    def record(self, method: str, route: str, status: int, duration: float, stats: RequestStats):
+        self._observe(self.latency, (method, route, str(status)), duration)
+        self._observe(self.db_queries, (method, route), stats.queries, QUERY_COUNT_BUCKETS)
+        self._observe(self.db_time, (method, route), stats.db_time)
+        self._observe(self.serialization, (method, route), stats.serialization_time)
+
+
+request_metrics = RequestMetrics()
+
+
+class InstrumentedRoute(APIRoute):
+    """Labels the request with its route and times response serialization.
+
+    Serialization is everything FastAPI does between the endpoint returning
+    and the response being ready: response_model validation, jsonable
+    encoding and rendering the body.
+    """
+
+    def get_route_handler(self):
+        call = self.dependant.call
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def timed_call(**kwargs):
+                try:
+                    return await call(**kwargs)
+                finally:
+                    _mark_endpoint_done()
+        else:
+            @functools.wraps(call)
+            def timed_call(**kwargs):
+                try:
+                    return call(**kwargs)
+                finally:
+                    _mark_endpoint_done()
+        self.dependant.call = timed_call
+
+        handler = super().get_route_handler()
+        route = self.path_format
+
+        async def instrumented_handler(request):
+            stats = request_db_stats.get()
+            if stats is not None:
+                stats.route = route
+            response = await handler(request)
+            if stats is not None and stats.endpoint_done is not None:
+                stats.serialization_time = time.perf_counter() - stats.endpoint_done
+            return response
+
+        return instrumented_handler
+
+
+def _mark_endpoint_done():
+    stats = request_db_stats.get()
+    if stats is not None:
+        stats.endpoint_done = time.perf_counter()
+
+
+class SlowRequestProfiler:
+    """Opt-in sampling profiler for slow requests.
+
+    A background thread samples the event loop thread's stack every
+    `interval` seconds and files it under the request whose task is running
+    at that moment. Requests slower than `threshold` get their samples
+    written as folded stacks ("frame;frame;frame count" lines) that
+    flamegraph.pl, inferno or speedscope read directly. Sync endpoints run
+    in the thread pool and are not sampled.
+
+    The sampler only writes a request's samples under `_lock`, and `end()`
+    takes them away under the same lock, so a finished request's samples
+    are never written to while they are dumped.
+    """
+
+    def __init__(self, threshold: float, interval: float, directory: str):
+        self.threshold = threshold
+        self._interval = interval
+        self._directory = directory
+        self._active: Dict[asyncio.Task, RequestStats] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def begin(self, stats: RequestStats):
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._thread_id = threading.get_ident()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+            self._thread.start()
+        stats.samples = {}
+        with self._lock:
+            self._active[asyncio.current_task()] = stats
+
+    def end(self) -> Dict[str, int]:
+        """Stops sampling the current request and hands over its samples."""
+        with self._lock:
+            stats = self._active.pop(asyncio.current_task(), None)
+            if stats is None:
+                return {}
+            samples, stats.samples = stats.samples, None
+        return samples
+
+    def stop(self):
+        self._stopped.set()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stopped.wait(self._interval):
+            if not self._active:
+                continue
+            task = asyncio.current_task(self._loop)
+            frame = sys._current_frames().get(self._thread_id)
+            if task not in self._active or frame is None:
+                continue
+            stack = _fold(frame)
+            with self._lock:
+                # The request may have ended while the stack was folded
+                stats = self._active.get(task)
+                if stats is None or len(stats.samples) >= PROFILE_MAX_STACKS:
+                    continue
+                stats.samples[stack] = stats.samples.get(stack, 0) + 1
+
+    async def dump(self, method: str, route: str, duration: float, samples: Dict[str, int]) -> Optional[str]:
+        if not samples:
+            return None
+        name = "%d-%s-%s-%dms.folded" % (
+            time.time() * 1000, method, re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_"), duration * 1000,
+        )
+        path = os.path.join(self._directory, name)
+        try:
+            await asyncio.to_thread(_write_folded, path, samples)
+        except OSError:
+            logger.exception("Writing profile %s failed", path)
+            return None
+        return path
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _write_folded(path: str, samples: Dict[str, int]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        for stack, count in sorted(samples.items(), key=lambda item: -item[1]):
+            f.write(f"{stack} {count}\n")
+
+
+class InstrumentationMiddleware:
+    """Pure ASGI middleware recording latency, DB work and serialization per route."""
+
+    def __init__(self, app, profiler: Optional[SlowRequestProfiler] = None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        status = 500  # If the app fails before sending a response
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = request_db_stats.set(stats)
+        if self.profiler is not None:
+            self.profiler.begin(stats)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started
+            request_db_stats.reset(token)
+            route = stats.route or UNMATCHED_ROUTE
+            request_metrics.record(scope["method"], route, status, duration, stats)
+            if self.profiler is not None:
+                samples = self.profiler.end()
+                if duration >= self.profiler.threshold:
+                    path = await self.profiler.dump(scope["method"], route, duration, samples)
+                    if path:
+                        logger.warning("Slow request %s %s (%.0f ms), profile: %s",
+                                       scope["method"], route, duration * 1000, path)
+
+
+# Prometheus text exposition
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+
+def _histogram_lines(name: str, help_text: str, label_names: Tuple[str, ...], histograms: dict) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for key, histogram in sorted(histograms.items()):
+        for bound, count in zip((*histogram.buckets, "+Inf"), histogram.cumulative()):
+            le = 'le="%s"' % bound
+            lines.append(f"{name}_bucket{_labels(label_names, key, le)} {count}")
+        lines.append(f"{name}_sum{_labels(label_names, key)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(label_names, key)} {histogram.count}")
+    return lines
+
+
+def _metric_lines(name: str, metric_type: str, help_text: str, samples: List[Tuple[tuple, tuple, float]]) -> List[str]:
+    # samples: (label names, label values, value)
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    lines += [f"{name}{_labels(names, values)} {value}" for names, values, value in samples]
+    return lines
+
+
+def render_prometheus(engines: Dict[str, object]) -> str:
+    """Metrics of this worker process; `engines` maps a pool label to an engine."""
+    route = ("method", "route")
+    lines = []
+    lines += _histogram_lines(
+        "http_request_duration_seconds", "Request latency", ("method", "route", "status"), request_metrics.latency,
+    )
+    lines += _histogram_lines("http_request_db_queries", "Database queries per request", route, request_metrics.db_queries)
+    lines += _histogram_lines("http_request_db_seconds", "Database time per request", route, request_metrics.db_time)
+    lines += _histogram_lines(
+        "http_response_serialization_seconds", "Response validation and rendering time", route,
+        request_metrics.serialization,
+    )
+    lines += _histogram_lines("db_query_duration_seconds", "Query latency", (), {(): query_metrics.duration})
+    lines += _metric_lines("db_slow_queries_total", "counter", "Queries slower than DB_SLOW_QUERY_MS",
+                           [((), (), query_metrics.slow_count)])
+    lines += _histogram_lines(
+        "db_pool_checkout_seconds", "Connection checkout time (wait, connect, pre-ping)", (),
+        {(): pool_metrics.checkout_time},
+    )
+    lines += _metric_lines("db_pool_checkout_timeouts_total", "counter", "Checkouts that hit DB_POOL_TIMEOUT",
+                           [((), (), pool_metrics.checkout_timeouts)])
+    statuses = {label: pool_status(engine) for label, engine in engines.items()}
+    for field in ("size", "in_use", "idle", "overflow"):
+        lines += _metric_lines(
+            f"db_pool_{field}", "gauge", f"Connection pool {field.replace('_', ' ')}",
+            [(("pool",), (label,), status[field]) for label, status in statuses.items()],
+        )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY = 1.0  # Seconds, doubled up to RECONNECT_DELAY_MAX while Postgres is away
+RECONNECT_DELAY_MAX = 30.0
+CLIENT_RETRY_MS = 3000  # EventSource reconnect delay
+
+HEARTBEAT = object()
+CLOSE = object()
+
+
+async def notify_order_events(db, events):
+    """Queues the events for all processes' live feeds inside the caller's transaction.
+
+    NOTIFY is transactional: listeners get the events when (and only if) the
+    transaction commits, with one statement for any number of events.
+    """
+    if not events:
+        return
+    await db.execute(
+        text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+        {"channel": settings.LIVE_FEED_CHANNEL, "payloads": [json.dumps(event.to_dict()) for event in events]},
+    )
+
+
+def format_event(event_type: str, data: dict) -> bytes:
+    return f"event: {event_type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+class FeedConnection:
+    """One client stream. Holds at most `maxsize` undelivered events.
+
+    A client that can't keep up is disconnected instead of buffering without
+    bound; EventSource reconnects by itself and starts from a fresh snapshot.
+    """
+
+    def __init__(self, feed: "OrderFeed", maxsize: int):
+        self.feed = feed
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize + 1)  # One slot reserved for CLOSE
+        self.maxsize = maxsize
+
+    def put(self, item):
+        if self.queue.qsize() >= self.maxsize:
+            if item is not HEARTBEAT:
+                self.feed.unsubscribe(self)
+                self.queue.put_nowait(CLOSE)
+            return
+        self.queue.put_nowait(item)
+
+    async def stream(self, initial: Optional[bytes] = None):
+        """Body of the StreamingResponse."""
+        try:
+            yield f"retry: {CLIENT_RETRY_MS}\n\n".encode()
+            if initial is not None:
+                yield initial
+            while True:
+                item = await self.queue.get()
+                if item is CLOSE:
+                    return
+                yield b": ping\n\n" if item is HEARTBEAT else item
+        finally:
+            # Runs when the client goes away, too: the failed write cancels us
+            self.feed.unsubscribe(self)
+
+
+class OrderFeed:
+    """Fans order events out to SSE clients of this process.
+
+    Events come from a single LISTEN connection per process (published by
+    every worker with NOTIFY), and are routed through in-memory indexes by
+    order, by user and to the kitchen-wide feed, so idle clients cost no
+    database work at all. One timer sends heartbeats to every client.
+    """
+
+    def __init__(self):
+        self._by_order: Dict[int, Set[FeedConnection]] = defaultdict(set)
+        self._by_user: Dict[int, Set[FeedConnection]] = defaultdict(set)
+        self._kitchen: Set[FeedConnection] = set()
+        self._keys: Dict[FeedConnection, tuple] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    @property
+    def connection_count(self) -> int:
+        return len(self._keys)
+
+    def subscribe(self, order_id: Optional[int] = None, user_id: Optional[int] = None) -> FeedConnection:
+        """Kitchen feed unless an order or a user is given."""
+        self.start()
+        connection = FeedConnection(self, settings.LIVE_FEED_QUEUE_SIZE)
+        if order_id is not None:
+            self._by_order[order_id].add(connection)
+            self._keys[connection] = ("order", order_id)
+        elif user_id is not None:
+            self._by_user[user_id].add(connection)
+            self._keys[connection] = ("user", user_id)
+        else:
+            self._kitchen.add(connection)
+            self._keys[connection] = ("kitchen", None)
+        return connection
+
+    def unsubscribe(self, connection: FeedConnection):
+        key = self._keys.pop(connection, None)
+        if key is None:
+            return
+        kind, value = key
+        if kind == "kitchen":
+            self._kitchen.discard(connection)
+            return
+        index = self._by_order if kind == "order" else self._by_user
+        connections = index.get(value)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del index[value]
+
+    def dispatch(self, event: dict):
+        message = format_event(event["type"], event)
+        for connection in (
+            *self._by_order.get(event["order_id"], ()),
+            *self._by_user.get(event["user_id"], ()),
+            *self._kitchen,
+        ):
+            connection.put(message)
+
+    def _broadcast(self, item):
+        for connection in list(self._keys):
+            connection.put(item)
+
+    def _on_notification(self, connection, pid, channel, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed live feed payload")
+            return
+        self.dispatch(event)
+
+    # Background tasks
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def stop(self):
+        for task in (self._task, self._heartbeat_task):
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*[task for task in (self._task, self._heartbeat_task) if task], return_exceptions=True)
+        self._task = self._heartbeat_task = None
+        self._broadcast(CLOSE)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.LIVE_FEED_HEARTBEAT_SECONDS)
+            self._broadcast(HEARTBEAT)
+
+    async def _listen(self):
+        dsn = make_url(settings.DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        delay = RECONNECT_DELAY
+        reconnected = False
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _: lost.set())
+                await connection.add_listener(settings.LIVE_FEED_CHANNEL, self._on_notification)
+                delay = RECONNECT_DELAY
+                if reconnected:
+                    # Events may have been missed meanwhile: clients re-read their state
+                    self._broadcast(format_event("resync", {}))
+                reconnected = True
+                await lost.wait()
+                logger.warning("Live feed lost its database connection")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Live feed listener failed")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_DELAY_MAX)
+
+
+order_feed = OrderFeed()
@@ -0,0 +1,110 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List
+
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from .. import models, schemas
+from ..config import settings
+from .etag import make_etag
+from .snapshot import VersionedCache
+
+
+@dataclass(frozen=True)
+class MenuSnapshot:
+    tree: List[schemas.MenuCategory]
+    products_by_id: Dict[int, schemas.MenuProduct]
+    # Pre-serialized response bodies and their ETags, computed once per menu version
+    menu_json: bytes
+    menu_etag: str
+    categories_json: bytes
+    categories_etag: str
+    products_json: bytes
+    products_etag: str
+
+
+_menu_adapter = TypeAdapter(List[schemas.MenuCategory])
+_categories_adapter = TypeAdapter(List[schemas.Category])
+_products_adapter = TypeAdapter(List[schemas.Product])
+
+
+class MenuCache(VersionedCache):
+    """Category -> product -> option -> variant tree of the active menu."""
+
+    async def build(self, db) -> MenuSnapshot:
+        categories = (await db.execute(
+            select(models.Category)
+            .where(models.Category.is_active == True)
+            .order_by(models.Category.position, models.Category.id)
+        )).scalars().all()
+        products = (await db.execute(
+            select(models.Product)
+            .where(models.Product.is_active == True)
+            .order_by(models.Product.position, models.Product.id)
+        )).scalars().all()
+        options = (await db.execute(
+            select(models.ProductOption)
+            .where(models.ProductOption.is_active == True)
+            .order_by(models.ProductOption.position, models.ProductOption.id)
+        )).scalars().all()
+        variants = (await db.execute(
+            select(models.ProductVariant)
+            .where(models.ProductVariant.is_active == True)
+            .order_by(models.ProductVariant.position, models.ProductVariant.id)
+        )).scalars().all()
+
+        options_by_id = {}
+        options_by_product = defaultdict(list)
+        for option in options:
+            item = schemas.ProductOption.model_validate(option)
+            options_by_id[item.id] = item
+            options_by_product[option.product_id].append(item)
+
+        variants_by_product = defaultdict(list)
+        for variant in variants:
+            item = schemas.ProductVariant.model_validate(variant)
+            option = options_by_id.get(variant.option_id)
+            if option is not None:
+                option.variants.append(item)
+            elif variant.option_id is None:
+                variants_by_product[variant.product_id].append(item)
+
+        tree = []
+        categories_by_id = {}
+        for category in categories:
+            item = schemas.MenuCategory.model_validate(category)
+            categories_by_id[item.id] = item
+            tree.append(item)
+
+        products_by_id = {}
+        for product in products:
+            category = categories_by_id.get(product.category_id)
+            if category is None:
+                # Products of disabled categories are hidden from the menu
+                continue
+            item = schemas.MenuProduct.model_validate(product)
+            item.options = options_by_product.get(item.id, [])
+            item.variants = variants_by_product.get(item.id, [])
+            category.products.append(item)
+            products_by_id[item.id] = item
+
+        flat_categories = [schemas.Category.model_validate(category) for category in categories]
+        flat_products = [schemas.Product.model_validate(product) for product in products if product.id in products_by_id]
+
+        menu_json = _menu_adapter.dump_json(tree)
+        categories_json = _categories_adapter.dump_json(flat_categories)
+        products_json = _products_adapter.dump_json(flat_products)
+        return MenuSnapshot(
+            tree=tree,
+            products_by_id=products_by_id,
+            menu_json=menu_json,
+            menu_etag=make_etag(menu_json),
+            categories_json=categories_json,
+            categories_etag=make_etag(categories_json),
+            products_json=products_json,
+            products_etag=make_etag(products_json),
+        )
+
+
+menu_cache = MenuCache(ttl=settings.MENU_CACHE_TTL_SECONDS)
@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import and_, or_, select, update
+
+from .. import models
+from ..config import settings
+from ..database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "telegram"  # The only channel delivered so far
+# Rows left in "sending" this long (e.g. the worker died) are picked up again
+STALE_SENDING_AFTER = timedelta(minutes=5)
+# A batch stops sending after this long and hands its unsent messages back, so
+# it never runs into STALE_SENDING_AFTER and gets claimed a second time
+SEND_BUDGET = STALE_SENDING_AFTER.total_seconds() / 2
+RETRY_BASE_DELAY = 2.0  # Seconds, doubled on every attempt
+CHAT_BUCKET_IDLE = 60.0  # Forget per-chat buckets idle for this many seconds
+
+
+class TokenBucket:
+    """Token bucket; reserve() takes a slot ahead of time and returns how long to wait."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()  # Lets one waiter at a time line up for a chat's token
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        self._refill()
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def wait_time(self) -> float:
+        """How long until a whole token is available, without taking it."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def give_back(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds: float):
+        # Used when Telegram answers 429: nobody gets a token for `seconds`
+        self.reserve()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+@dataclass
+class Outgoing:
+    id: int
+    chat_id: str
+    text: str
+    attempts: int
+
+
+@dataclass
+class Outcome:
+    id: int
+    sent: bool
+    error: Optional[str] = None
+    retry_after: Optional[float] = None  # None: permanent failure (or sent)
+    deferred: bool = False  # Not attempted: the batch ran out of SEND_BUDGET
+
+
+class NotificationDispatcher:
+    """Drains pending telegram notifications in batches.
+
+    Each cycle claims a batch of rows (FOR UPDATE SKIP LOCKED, so several
+    workers can run side by side), sends them concurrently through one pooled
+    HTTP client while respecting a global and a per-chat token bucket, and
+    writes all outcomes back with bulk updates. Transient errors are retried
+    with exponential backoff until NOTIFICATION_MAX_ATTEMPTS is reached.
+
+    With shard_count > 1 the dispatcher only handles users whose id falls in
+    its shard: every chat is served by exactly one process (so per-chat
+    limits hold), and the bot-wide rate is split evenly between shards.
+    """
+
+    def __init__(self, shard_index: int = 0, shard_count: int = 1):
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        global_rate = settings.TELEGRAM_GLOBAL_RATE / shard_count
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._client = httpx.AsyncClient(
+            base_url=f"{settings.TELEGRAM_API_URL}/bot{settings.TELEGRAM_BOT_TOKEN}",
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=50),
+        )
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def wake(self):
+        # Called after new notifications were queued to skip the poll delay
+        self._wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                processed = await self.dispatch_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Notification dispatch failed")
+                processed = 0
+            if processed < settings.NOTIFICATION_BATCH_SIZE:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.NOTIFICATION_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _claim_filter(self):
+        notification = models.Notification
+        now = datetime.now(timezone.utc)
+        shard = notification.user_id % self.shard_count == self.shard_index if self.shard_count > 1 else True
+        return and_(
+            shard,
+            notification.channel == CHANNEL,
+            or_(
+                and_(
+                    notification.status == "pending",
+                    or_(notification.next_attempt_at.is_(None), notification.next_attempt_at <= now),
+                ),
+                and_(notification.status == "sending", notification.updated_at < now - STALE_SENDING_AFTER),
+            ),
+        )
+
+    async def claim_batch(self, db) -> List[Outgoing]:
+        notification = models.Notification
+        batch = (
+            select(notification.id)
+            .where(self._claim_filter())
+            .order_by(notification.id)
+            .limit(settings.NOTIFICATION_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        rows = (await db.execute(
+            update(notification)
+            .where(notification.id.in_(batch.scalar_subquery()))
+            .values(status="sending", attempts=notification.attempts + 1)
+            .returning(notification.id, notification.user_id, notification.title, notification.message,
+                       notification.attempts)
+            .execution_options(synchronize_session=False)
+        )).all()
+        chat_ids = dict((await db.execute(
+            select(models.User.id, models.User.telegram_id).where(models.User.id.in_({row.user_id for row in rows}))
+        )).all()) if rows else {}
+        await db.commit()
+        return [
+            Outgoing(
+                id=row.id,
+                chat_id=chat_ids[row.user_id],
+                text=f"{row.title}\n\n{row.message}" if row.title else row.message,
+                attempts=row.attempts,
+            )
+            for row in rows
+        ]
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                now = time.monotonic()
+                self.chat_buckets = {
+                    key: value for key, value in self.chat_buckets.items() if now - value.updated < CHAT_BUCKET_IDLE
+                }
+            bucket = self.chat_buckets[chat_id] = TokenBucket(settings.TELEGRAM_CHAT_RATE, 1)
+        return bucket
+
+    def _retry_delay(self, attempts: int) -> Optional[float]:
+        if attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+            return None
+        return RETRY_BASE_DELAY * 2 ** (attempts - 1)
+
+    async def _wait_for_slot(self, chat_id: str, deadline: float) -> bool:
+        """Waits until both limits allow a message to `chat_id`; False past `deadline`.
+
+        A message waiting for its chat holds no global token (or messages
+        queued behind busy chats would later fire together above the global
+        rate), and the chat slot is taken only once the global token is in
+        hand, right before sending (or a message delayed by the global limit
+        could land too close to the next one for the same chat).
+        """
+        chat_bucket = self._chat_bucket(chat_id)
+        async with chat_bucket.lock:
+            delay = chat_bucket.wait_time()
+            if time.monotonic() + delay > deadline:
+                return False
+            if delay:
+                await asyncio.sleep(delay)
+            delay = self.global_bucket.reserve()
+            if time.monotonic() + delay > deadline:
+                self.global_bucket.give_back()
+                return False
+            if delay:
+                await asyncio.sleep(delay)
+            # Still there: only the lock holder takes this chat's tokens
+            chat_bucket.reserve()
+            return True
+
+    async def send(self, message: Outgoing, deadline: float = float("inf")) -> Outcome:
+        if not await self._wait_for_slot(message.chat_id, deadline):
+            return Outcome(message.id, False, deferred=True)
+        try:
+            response = await self._client.post("/sendMessage", json={"chat_id": message.chat_id, "text": message.text})
+        except httpx.HTTPError as e:
+            return Outcome(message.id, False, f"{type(e).__name__}: {e}", self._retry_delay(message.attempts))
+
+        if response.status_code == 200:
+            return Outcome(message.id, True)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        error = body.get("description") or f"HTTP {response.status_code}"
+        if response.status_code == 429:
+            retry_after = float(body.get("parameters", {}).get("retry_after", 1))
+            self.global_bucket.pause(retry_after)
+            # Flood control is not the message's fault: always try again later
+            return Outcome(message.id, False, error, retry_after)
+        if response.status_code >= 500:
+            return Outcome(message.id, False, error, self._retry_delay(message.attempts))
+        # 400/403: chat not found, bot blocked by the user, ... - retrying won't help
+        return Outcome(message.id, False, error)
+
+    async def record(self, db, outcomes: List[Outcome]):
+        now = datetime.now(timezone.utc)
+        sent = [outcome.id for outcome in outcomes if outcome.sent]
+        if sent:
+            await db.execute(
+                update(models.Notification)
+                .where(models.Notification.id.in_(sent))
+                .values(status="sent", sent_at=now, error_message=None)
+                .execution_options(synchronize_session=False)
+            )
+        deferred = [outcome.id for outcome in outcomes if outcome.deferred]
+        if deferred:
+            # Back to the queue as they were: the claim's attempt didn't happen
+            await db.execute(
+                update(models.Notification)
+                .where(models.Notification.id.in_(deferred))
+                .values(status="pending", attempts=models.Notification.attempts - 1)
+                .execution_options(synchronize_session=False)
+            )
+        unsent = [
+            {
+                "id": outcome.id,
+                "status": "failed" if outcome.retry_after is None else "pending",
+                "error_message": outcome.error,
+                "next_attempt_at": None if outcome.retry_after is None else now + timedelta(seconds=outcome.retry_after),
+            }
+            for outcome in outcomes if not outcome.sent and not outcome.deferred
+        ]
+        if unsent:
+            # ORM bulk update by primary key: one executemany
+            await db.execute(update(models.Notification), unsent)
+        await db.commit()
+
+    async def dispatch_batch(self) -> int:
+        async with AsyncSessionLocal() as db:
+            batch = await self.claim_batch(db)
+            if not batch:
+                return 0
+            deadline = time.monotonic() + SEND_BUDGET
+            outcomes = await asyncio.gather(*(self.send(message, deadline) for message in batch))
+            await self.record(db, list(outcomes))
+            return len(batch)
+
+
+notification_dispatcher = NotificationDispatcher()
+
+
+def _run_shard(shard_index: int, shard_count: int):
+    async def main():
+        dispatcher = NotificationDispatcher(shard_index, shard_count)
+        await dispatcher.start()
+        try:
+            await dispatcher._task
+        finally:
+            await dispatcher.stop()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    # Standalone dispatchers, one process per user-id shard
+    parser = argparse.ArgumentParser(description="Run notification dispatcher processes")
+    parser.add_argument("--shards", type=int, default=1)
+    args = parser.parse_args()
+    processes = [
+        multiprocessing.Process(target=_run_shard, args=(index, args.shards), name=f"notifications-{index}")
+        for index in range(args.shards)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
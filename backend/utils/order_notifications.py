@@ -0,0 +1,64 @@
+from typing import Dict
+
+from sqlalchemy import insert, select
+
+from .. import models
+from ..database import AsyncSessionLocal
+from .notifications import notification_dispatcher
+from .snapshot import VersionedCache
+from .templates import ORDER_PLACEHOLDERS, RECIPIENT_PLACEHOLDERS, template_cache
+
+# Template edits in other workers show up after this many seconds
+TEMPLATES_CACHE_TTL = 60
+
+def template_name(status: str) -> str:
+    # Templates named "order_confirmed", "order_delivered", ... are sent on that status
+    return f"order_{status}"
+
+
+class OrderTemplateCache(VersionedCache):
+    """Active order_status templates by name."""
+
+    async def build(self, db) -> Dict[str, models.NotificationTemplate]:
+        templates = (await db.execute(
+            select(models.NotificationTemplate).where(
+                models.NotificationTemplate.type == "order_status",
+                models.NotificationTemplate.is_active == True,
+            )
+        )).scalars().all()
+        return {template.name: template for template in templates}
+
+
+order_templates = OrderTemplateCache(ttl=TEMPLATES_CACHE_TTL)
+
+
+async def notify_order_status(event):
+    """Event bus handler: queues the customer notification for a status change."""
+    if event.type != "status_changed":
+        return
+    async with AsyncSessionLocal() as db:
+        template = (await order_templates.get(db)).data.get(template_name(event.status))
+        if template is None:
+            return
+        context = (await db.execute(
+            select(
+                *[getattr(models.User, name) for name in sorted(RECIPIENT_PLACEHOLDERS)],
+                *[getattr(models.Order, name) for name in sorted(ORDER_PLACEHOLDERS)],
+            )
+            .join_from(models.Order, models.User, models.User.id == models.Order.user_id)
+            .where(models.Order.id == event.order_id)
+        )).first()
+        if context is None:
+            return
+        [(title, message)] = template_cache.render_many(template, [{**context._mapping, "status": event.status}])
+        await db.execute(insert(models.Notification).values(
+            user_id=event.user_id,
+            template_id=template.id,
+            order_id=event.order_id,
+            title=title,
+            message=message,
+            channel=template.channel,
+            status="pending",
+        ))
+        await db.commit()
+    notification_dispatcher.wake()
@@ -0,0 +1,63 @@
+import asyncio
+from datetime import date, datetime
+
+import pytz
+from sqlalchemy.dialects.postgresql import insert
+
+from .. import models
+from ..config import settings
+from ..database import engine
+
+
+def business_day() -> date:
+    return datetime.now(pytz.timezone(settings.RESTAURANT_TIMEZONE)).date()
+
+
+class OrderNumberAllocator:
+    """Hands out order numbers like "240517-0042" from pre-reserved blocks.
+
+    A worker reserves a block of numbers for the current business day with a
+    single upsert and then serves them from memory, so checkouts neither wait
+    on each other nor retry on unique violations. Numbers grow monotonically
+    per day within a worker; blocks of different workers interleave, and a
+    restart leaves a gap where the rest of its block was.
+    """
+
+    def __init__(self, block_size: int):
+        self.block_size = block_size
+        self._day = None
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def _reserve_block(self, day: date) -> int:
+        block = models.OrderNumberBlock
+        statement = insert(block).values(day=day, next_value=self.block_size + 1)
+        statement = statement.on_conflict_do_update(
+            index_elements=[block.day],
+            set_={"next_value": block.next_value + self.block_size},
+        ).returning(block.next_value)
+        # Own short transaction: the reservation must survive a rolled back order
+        async with engine.begin() as conn:
+            end = (await conn.execute(statement)).scalar_one()
+        return end
+
+    def _take(self, day: date) -> str:
+        number = self._next
+        self._next += 1
+        return f"{day:%y%m%d}-{number:04d}"
+
+    async def next_number(self) -> str:
+        day = business_day()
+        if day == self._day and self._next < self._end:
+            return self._take(day)
+
+        async with self._lock:
+            day = business_day()
+            if day != self._day or self._next >= self._end:
+                end = await self._reserve_block(day)
+                self._day, self._next, self._end = day, end - self.block_size, end
+            return self._take(day)
+
+
+order_numbers = OrderNumberAllocator(block_size=settings.ORDER_NUMBER_BLOCK_SIZE)
@@ -0,0 +1,154 @@
+from dataclasses import dataclass
+from typing import List
+
+from sqlalchemy import func, insert, update
+
+from .. import models, schemas
+from ..config import settings
+from ..models.order import OrderStatus
+from .delivery_zones import delivery_zone_cache
+from .menu_cache import menu_cache
+from .order_numbers import order_numbers
+from .user_cache import user_cache
+from . import bonus_ledger, live_feed, referrals, rollups
+from .events import ORDERS_TOPIC, event_bus, order_event
+
+PRICE_TOLERANCE = 0.01
+
+
+class OrderValidationError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class PricedOrder:
+    items: List[dict]
+    total_amount: float
+    delivery_cost: float
+    final_amount: float
+
+
+def _same_amount(a: float, b: float) -> bool:
+    return abs(a - b) < PRICE_TOLERANCE
+
+
+async def price_order(db, order: schemas.OrderCreate) -> PricedOrder:
+    """Check the order against the cached menu and delivery zones.
+
+    Client-side prices and totals are only accepted when they match what we
+    would charge, so no per-item Product select is needed at checkout.
+    """
+    if not order.order_items:
+        raise OrderValidationError("Order has no items")
+
+    menu = (await menu_cache.get(db)).data
+    items = []
+    total_amount = 0.0
+    for item in order.order_items:
+        product = menu.products_by_id.get(item.product_id)
+        if product is None:
+            raise OrderValidationError(f"Product {item.product_id} is not available")
+        if product.is_stop_list:
+            raise OrderValidationError(f"Product {product.name} is in the stop list")
+        if item.quantity <= 0:
+            raise OrderValidationError(f"Invalid quantity for product {product.name}")
+        price = product.discount_price if product.discount_price is not None else product.price
+        if not _same_amount(item.price, price):
+            raise OrderValidationError(f"Price of product {product.name} has changed")
+        total_price = round(price * item.quantity, 2)
+        total_amount += total_price
+        items.append({
+            "product_id": item.product_id,
+            "quantity": item.quantity,
+            "price": price,
+            "total_price": total_price,
+            "note": item.note,
+        })
+    total_amount = round(total_amount, 2)
+
+    if not _same_amount(order.total_amount, total_amount):
+        raise OrderValidationError("Order total does not match menu prices")
+    if total_amount < settings.MIN_ORDER_AMOUNT:
+        raise OrderValidationError(f"Minimum order amount is {settings.MIN_ORDER_AMOUNT}")
+
+    delivery_cost = 0.0
+    if order.order_type == "delivery":
+        if order.delivery_address_lat is None or order.delivery_address_lon is None:
+            raise OrderValidationError("Delivery address is required")
+        zones = (await delivery_zone_cache.get(db)).data
+        quote = zones.index.quote(order.delivery_address_lat, order.delivery_address_lon, total_amount)
+        if not quote.is_available:
+            raise OrderValidationError("Delivery is not available for this address")
+        delivery_cost = quote.delivery_cost
+
+    bonus_used = order.bonus_used or 0.0
+    if bonus_used < 0 or bonus_used > total_amount:
+        raise OrderValidationError("Invalid bonus amount")
+    final_amount = round(total_amount + delivery_cost - bonus_used, 2)
+    if not _same_amount(order.final_amount, final_amount):
+        raise OrderValidationError("Order final amount does not match")
+
+    return PricedOrder(items=items, total_amount=total_amount, delivery_cost=delivery_cost, final_amount=final_amount)
+
+
+async def create_order(db, order: schemas.OrderCreate) -> models.Order:
+    """Write an order in one transaction; the item count adds no round trips.
+
+    Every checkout runs seven statements: the order row (INSERT ...
+    RETURNING), all items (one multi-row INSERT), the initial status history
+    row, the user counters (UPDATE ... RETURNING), the order and customer
+    rollup upserts, and the live feed NOTIFY. Paying with bonuses adds the
+    ledger spend and a referred customer adds the referrers' totals, one
+    statement each. Prices and zones come from the in-process caches and
+    order numbers from a reserved block, so none of them query per order.
+    """
+    priced = await price_order(db, order)
+
+    values = order.model_dump(exclude={"order_items"})
+    values.update(
+        order_number=await order_numbers.next_number(),
+        status=OrderStatus.PENDING,
+        total_amount=priced.total_amount,
+        delivery_cost=priced.delivery_cost,
+        final_amount=priced.final_amount,
+        bonus_used=order.bonus_used or 0.0,
+    )
+    db_order = (await db.execute(
+        insert(models.Order).values(**values).returning(models.Order)
+    )).scalar_one()
+
+    await db.execute(insert(models.OrderItem).values([
+        {"order_id": db_order.id, **item} for item in priced.items
+    ]))
+    await db.execute(insert(models.OrderStatusHistory).values(
+        order_id=db_order.id,
+        status=OrderStatus.PENDING,
+    ))
+    if db_order.bonus_used:
+        try:
+            await bonus_ledger.spend(
+                db, db_order.user_id, db_order.bonus_used,
+                order_id=db_order.id, description=f"Order {db_order.order_number}",
+            )
+        except bonus_ledger.InsufficientBonusError:
+            await db.rollback()
+            raise OrderValidationError("Not enough bonuses")
+    customer = (await db.execute(
+        update(models.User)
+        .where(models.User.id == db_order.user_id)
+        .values(
+            order_count=models.User.order_count + 1,
+            total_spent=models.User.total_spent + priced.final_amount,
+            last_order_at=func.now(),
+        )
+        .returning(models.User.order_count, models.User.referred_by)
+    )).one()
+    user_cache.mark_dirty(db, db_order.user_id)
+    if customer.referred_by is not None:
+        await referrals.record_order(db, db_order.user_id, priced.final_amount)
+    await rollups.record_order_created(db, db_order, first_order=customer.order_count == 1)
+    event = order_event("created", db_order)
+    await live_feed.notify_order_events(db, [event])
+    await db.commit()
+    event_bus.publish(ORDERS_TOPIC, event)
+    return db_order
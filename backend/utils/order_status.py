@@ -0,0 +1,112 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert, select
+
+from .. import models
+from ..models.order import OrderStatus
+from . import bonus_ledger, live_feed, rollups
+from .bonus_ledger import Accrual
+from .bonus_rules import bonus_rules
+from .events import ORDERS_TOPIC, OrderEvent, event_bus, order_event
+
+# Allowed moves; anything else is rejected
+TRANSITIONS: Dict[OrderStatus, frozenset] = {
+    OrderStatus.PENDING: frozenset({OrderStatus.CONFIRMED, OrderStatus.CANCELLED}),
+    OrderStatus.CONFIRMED: frozenset({OrderStatus.PREPARING, OrderStatus.CANCELLED}),
+    OrderStatus.PREPARING: frozenset({OrderStatus.READY, OrderStatus.CANCELLED}),
+    OrderStatus.READY: frozenset({OrderStatus.ON_THE_WAY, OrderStatus.DELIVERED, OrderStatus.CANCELLED}),
+    OrderStatus.ON_THE_WAY: frozenset({OrderStatus.DELIVERED, OrderStatus.CANCELLED}),
+    OrderStatus.DELIVERED: frozenset({OrderStatus.REFUNDED}),
+    OrderStatus.CANCELLED: frozenset({OrderStatus.REFUNDED}),
+    OrderStatus.REFUNDED: frozenset(),
+}
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class StatusChange:
+    order_id: int
+    status: OrderStatus
+    comment: Optional[str] = None
+
+
+def check_transition(order, new_status: OrderStatus):
+    if new_status not in TRANSITIONS[order.status]:
+        raise InvalidTransition(
+            f"Order {order.order_number} can't go from {order.status.value} to {new_status.value}"
+        )
+    if new_status == OrderStatus.ON_THE_WAY and order.order_type != "delivery":
+        raise InvalidTransition(f"Order {order.order_number} is not a delivery order")
+
+
+async def apply_changes(db, changes: List[StatusChange], changed_by: Optional[int] = None) -> List[OrderEvent]:
+    """Validates and applies status changes inside the caller's transaction.
+
+    All or nothing: the orders are locked and every move is checked before
+    anything is written. The history rows go in with one multi-row INSERT
+    and the rollups with one upsert, however many orders change; delivered
+    orders earn their bonuses and cancelled ones get spent bonuses back.
+    Live feeds of all workers get the events on commit; the returned ones
+    are for the caller to publish in-process once it committed.
+    """
+    order_ids = sorted({change.order_id for change in changes})
+    orders = {
+        order.id: order
+        for order in (await db.execute(
+            select(models.Order)
+            .where(models.Order.id.in_(order_ids))
+            .order_by(models.Order.id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )).scalars()
+    }
+
+    rules = None
+    history, moves, accruals, events = [], [], [], []
+    for change in changes:
+        order = orders.get(change.order_id)
+        if order is None:
+            raise InvalidTransition(f"Order {change.order_id} not found")
+        new_status = OrderStatus(change.status)
+        old_status = order.status
+        check_transition(order, new_status)
+        order.status = new_status
+
+        history.append({"order_id": order.id, "status": new_status, "comment": change.comment, "changed_by": changed_by})
+        moves.append((order, old_status, new_status))
+        if new_status == OrderStatus.DELIVERED:
+            rules = rules or (await bonus_rules.get(db)).data
+            accruals += rules.order_accruals(order)
+        elif new_status == OrderStatus.CANCELLED and order.bonus_used:
+            accruals.append(Accrual(
+                user_id=order.user_id,
+                amount=order.bonus_used,
+                transaction_type="returned",
+                order_id=order.id,
+                description=f"Order {order.order_number} cancelled",
+            ))
+        events.append(order_event("status_changed", order, old_status))
+
+    if history:
+        await db.execute(insert(models.OrderStatusHistory).values(history))
+        await rollups.record_status_changes(db, moves)
+    if accruals:
+        await bonus_ledger.accrue_many(db, accruals)
+    await live_feed.notify_order_events(db, events)
+    return events
+
+
+def publish(events: List[OrderEvent]):
+    for event in events:
+        event_bus.publish(ORDERS_TOPIC, event)
+
+
+async def change_statuses(db, changes: List[StatusChange], changed_by: Optional[int] = None) -> List[OrderEvent]:
+    events = await apply_changes(db, changes, changed_by)
+    await db.commit()
+    publish(events)
+    return events
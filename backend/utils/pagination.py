@@ -0,0 +1,43 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import tuple_
+
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    raw = f"{created_at.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(id)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_page(query, model, cursor: Optional[str], limit: int):
+    """Newest-first page of `query` that starts right after `cursor`.
+
+    Uses a (created_at, id) row comparison instead of OFFSET, so with a
+    matching composite index every page costs the same as the first one. One
+    extra row is fetched to tell whether there is a next page.
+    """
+    if cursor:
+        created_at, id = decode_cursor(cursor)
+        query = query.where(tuple_(model.created_at, model.id) < tuple_(created_at, id))
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+
+def split_page(rows, limit: int):
+    """Returns the rows of the page and the cursor of the next one (or None)."""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
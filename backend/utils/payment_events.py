@@ -0,0 +1,329 @@
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert, select, update
+
+from .. import models
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.payment import PaymentStatus
+from .spool import SpoolReader, SpoolWriter
+from .yookassa import STATUS_EVENTS, YooKassaError, yookassa_client
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_PROVIDER = "yookassa"
+RECENT_EVENTS_SIZE = 100_000  # Retried webhooks this process already spooled are dropped
+
+# event -> (new payment status, statuses it may be set from, order payment_status, transaction type)
+EVENT_TRANSITIONS = {
+    "payment.waiting_for_capture": (
+        PaymentStatus.PROCESSING, (PaymentStatus.PENDING,), None, None,
+    ),
+    "payment.succeeded": (
+        PaymentStatus.SUCCEEDED, (PaymentStatus.PENDING, PaymentStatus.PROCESSING), "paid", "payment",
+    ),
+    "payment.canceled": (
+        PaymentStatus.CANCELLED, (PaymentStatus.PENDING, PaymentStatus.PROCESSING), "failed", None,
+    ),
+    "refund.succeeded": (
+        PaymentStatus.REFUNDED,
+        (PaymentStatus.PENDING, PaymentStatus.PROCESSING, PaymentStatus.SUCCEEDED),
+        "refunded",
+        "refund",
+    ),
+}
+
+
+class WebhookError(ValueError):
+    pass
+
+
+WEBHOOK_SENDERS = [
+    ipaddress.ip_network(network.strip())
+    for network in settings.YOOKASSA_WEBHOOK_ALLOWED_IPS.split(",")
+    if network.strip()
+]
+
+
+def is_allowed_sender(host: Optional[str]) -> bool:
+    if not WEBHOOK_SENDERS:
+        return True
+    try:
+        address = ipaddress.ip_address(host or "")
+    except ValueError:
+        return False
+    return any(address in network for network in WEBHOOK_SENDERS)
+
+
+def parse_notification(body: bytes) -> dict:
+    """Turns a YooKassa notification into a spool record."""
+    try:
+        notification = json.loads(body)
+        event = notification["event"]
+        payment_object = notification["object"]
+        if not isinstance(payment_object, dict):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        raise WebhookError("Malformed notification")
+    return event_record(event, payment_object)
+
+
+def event_record(event: str, payment_object: dict, verified: bool = False) -> dict:
+    """`verified`: the object was fetched from YooKassa, not taken from a webhook body."""
+    if event not in EVENT_TRANSITIONS:
+        raise WebhookError(f"Unsupported event: {event}")
+    # Refund notifications carry the refund; the payment is referenced by payment_id
+    provider_payment_id = payment_object.get("payment_id") if event.startswith("refund.") else payment_object.get("id")
+    if not provider_payment_id:
+        raise WebhookError("Notification without payment id")
+    amount = (payment_object.get("amount") or {}).get("value")  # Decimal string, e.g. "1250.00"
+    return {
+        "key": f"{event}:{provider_payment_id}",
+        "event": event,
+        "provider_payment_id": provider_payment_id,
+        "amount": amount,
+        "object": payment_object,
+        "verified": verified,
+    }
+
+
+async def _confirm(record: dict) -> Optional[dict]:
+    if record.get("verified"):
+        return record
+    try:
+        if record["event"].startswith("refund."):
+            refund_id = record["object"].get("id")
+            if not refund_id:
+                return None
+            refund = await yookassa_client.get_refund(refund_id)
+            if refund.get("status") != "succeeded":
+                return None
+            confirmed = event_record(record["event"], refund, verified=True)
+        else:
+            payment = await yookassa_client.get_payment(record["provider_payment_id"], fresh=True)
+            event = STATUS_EVENTS.get(payment.get("status"))
+            if event is None:
+                return None
+            confirmed = event_record(event, payment, verified=True)
+    except YooKassaError as e:
+        if e.status_code == 404:
+            return None
+        raise
+    if confirmed["provider_payment_id"] != record["provider_payment_id"]:
+        return None
+    return confirmed
+
+
+async def verify_events(records: List[dict]) -> List[dict]:
+    """Replaces webhook events by what YooKassa itself reports.
+
+    Anyone can POST to the webhook, so a notification only tells us which
+    payment to look at: the event applied is the one matching the status
+    the provider returns. Unconfirmed events are dropped; if the provider
+    can't be reached the error propagates and the batch is retried later.
+    """
+    confirmed = await asyncio.gather(*[_confirm(record) for record in records])
+    for record, result in zip(records, confirmed):
+        if result is None:
+            logger.warning("Dropping payment event %s not confirmed by YooKassa", record["key"])
+    return [result for result in confirmed if result is not None]
+
+
+def _amount_matches(amount: Optional[str], expected: Decimal) -> bool:
+    try:
+        return Decimal(amount) == expected
+    except (TypeError, InvalidOperation):
+        return False
+
+
+async def apply_events(db, records: List[dict]) -> int:
+    """Applies a batch of spooled events in one transaction; returns the payments changed.
+
+    Every update only matches payments in a status the event may move them
+    from, so replayed or duplicate events change nothing and write no
+    second Transaction row. Events whose amount differs from the payment's
+    (e.g. partial refunds) are not applied.
+    """
+    latest: Dict[str, dict] = {}
+    for record in records:
+        latest[record["key"]] = record
+    amounts = dict((await db.execute(
+        select(models.Payment.provider_payment_id, models.Payment.amount)
+        .where(
+            models.Payment.payment_provider == PAYMENT_PROVIDER,
+            models.Payment.provider_payment_id.in_({record["provider_payment_id"] for record in latest.values()}),
+        )
+    )).all()) if latest else {}
+    for key, record in list(latest.items()):
+        expected = amounts.get(record["provider_payment_id"])
+        if expected is not None and not _amount_matches(record["amount"], expected):
+            logger.warning("Ignoring %s: amount %s does not match payment amount %s", key, record["amount"], expected)
+            del latest[key]
+    changed = 0
+    for event, (status, from_statuses, order_payment_status, transaction_type) in EVENT_TRANSITIONS.items():
+        events = {record["provider_payment_id"]: record for record in latest.values() if record["event"] == event}
+        if not events:
+            continue
+        values = {"status": status}
+        if status == PaymentStatus.REFUNDED:
+            values.update(refunded=True, refunded_at=datetime.now(timezone.utc))
+        payments = (await db.execute(
+            update(models.Payment)
+            .where(
+                models.Payment.payment_provider == PAYMENT_PROVIDER,
+                models.Payment.provider_payment_id.in_(list(events)),
+                models.Payment.status.in_(from_statuses),
+            )
+            .values(**values)
+            .returning(
+                models.Payment.id, models.Payment.order_id, models.Payment.user_id,
+                models.Payment.amount, models.Payment.provider_payment_id,
+            )
+        )).all()
+        if not payments:
+            continue
+        changed += len(payments)
+
+        # Raw provider objects are kept for reconciliation
+        await db.execute(
+            update(models.Payment),
+            [
+                {"id": payment.id, "provider_response": json.dumps(events[payment.provider_payment_id]["object"])}
+                for payment in payments
+            ],
+        )
+        if order_payment_status is not None:
+            await db.execute(
+                update(models.Order)
+                .where(models.Order.id.in_([payment.order_id for payment in payments]))
+                .values(payment_status=order_payment_status)
+            )
+        if transaction_type is not None:
+            balances = dict((await db.execute(
+                select(models.User.id, models.User.bonus_balance)
+                .where(models.User.id.in_({payment.user_id for payment in payments}))
+            )).all())
+            await db.execute(insert(models.Transaction).values([
+                {
+                    "payment_id": payment.id,
+                    "order_id": payment.order_id,
+                    "user_id": payment.user_id,
+                    "type": transaction_type,
+                    "amount": payment.amount,
+                    # Card payments don't move the bonus balance
+                    "balance_before": balances.get(payment.user_id) or 0,
+                    "balance_after": balances.get(payment.user_id) or 0,
+                    "description": f"YooKassa {event}",
+                }
+                for payment in payments
+            ]))
+    await db.commit()
+    return changed
+
+
+class PaymentEventQueue:
+    """Durable local queue between the YooKassa webhook and the database.
+
+    The webhook only appends the event to this process's spool segment and
+    answers once it is fsynced, so its latency does not depend on the
+    database. A background worker, one per process, drains all segments in
+    the spool directory in batches.
+    """
+
+    def __init__(self, directory: str):
+        self.writer = SpoolWriter(directory, settings.PAYMENT_SPOOL_SEGMENT_BYTES)
+        self.reader = SpoolReader(directory)
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    async def enqueue(self, record: dict) -> bool:
+        """False if this process already spooled the same event."""
+        key = record["key"]
+        if key in self._recent:
+            self._recent.move_to_end(key)
+            return False
+        self._recent[key] = None
+        if len(self._recent) > RECENT_EVENTS_SIZE:
+            self._recent.popitem(last=False)
+        try:
+            await self.writer.append(record)
+        except BaseException:
+            # Not durable, so the provider's retry must not be dropped
+            self._recent.pop(key, None)
+            raise
+        self._wakeup.set()
+        return True
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.writer.close()
+
+    async def run(self):
+        while True:
+            try:
+                processed = await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Payment event processing failed")
+                processed = 0
+            if not processed:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.PAYMENT_EVENT_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def drain(self) -> int:
+        processed = 0
+        for segment in self.reader.segments():
+            claim = self.reader.claim(segment)
+            if claim is None:
+                continue
+            try:
+                processed += await self._drain_segment(claim)
+            finally:
+                claim.release()
+        return processed
+
+    async def _drain_segment(self, claim) -> int:
+        processed = 0
+        # Checked before reading: a sealed segment gets no more appends
+        sealed = claim.is_sealed()
+        while True:
+            records, offset = claim.read(settings.PAYMENT_EVENT_BATCH_SIZE)
+            if not records:
+                break
+            confirmed = await verify_events(records)
+            if confirmed:
+                async with AsyncSessionLocal() as db:
+                    await apply_events(db, confirmed)
+            claim.commit(offset)
+            processed += len(records)
+        if sealed:
+            if claim.offset < os.path.getsize(claim.segment):
+                logger.warning("Dropping torn record at the end of %s", claim.segment)
+            claim.delete()
+        return processed
+
+
+payment_events = PaymentEventQueue(settings.PAYMENT_SPOOL_DIR)
@@ -0,0 +1,113 @@
+import asyncio
+
+from sqlalchemy import case, delete, func, insert, literal, select, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .. import models
+
+MAX_DEPTH = 100  # Guards the rebuild against referred_by cycles
+STATS_MEASURES = ("direct_referrals", "total_referrals", "downstream_orders", "downstream_spent")
+
+
+async def record_user_created(db, user):
+    """Adds a new user to the referral index; O(depth) rows, two statements.
+
+    The new user's paths are the referrer's paths one level deeper plus the
+    direct link, and every ancestor's counters grow by one. The caller
+    commits.
+    """
+    if not user.referred_by:
+        return
+    path = models.ReferralPath
+    direct = select(models.User.id, literal(user.id), literal(1)).where(models.User.id == user.referred_by)
+    inherited = select(path.ancestor_id, literal(user.id), path.depth + 1).where(path.descendant_id == user.referred_by)
+    await db.execute(insert(path).from_select(["ancestor_id", "descendant_id", "depth"], union_all(direct, inherited)))
+
+    statement = pg_insert(models.ReferralStats).from_select(
+        ["user_id", *STATS_MEASURES],
+        select(
+            path.ancestor_id,
+            case((path.depth == 1, 1), else_=0),
+            literal(1),
+            literal(0),
+            literal(0),
+        ).where(path.descendant_id == user.id),
+    )
+    stats = models.ReferralStats
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[stats.user_id],
+        set_={
+            "direct_referrals": stats.direct_referrals + statement.excluded.direct_referrals,
+            "total_referrals": stats.total_referrals + 1,
+            "updated_at": func.now(),
+        },
+    ))
+
+
+async def record_order(db, user_id: int, amount):
+    """Adds an order of a referred user to all ancestors' downstream totals. The caller commits."""
+    path = models.ReferralPath
+    stats = models.ReferralStats
+    await db.execute(
+        update(stats)
+        .where(stats.user_id == path.ancestor_id, path.descendant_id == user_id)
+        .values(
+            downstream_orders=stats.downstream_orders + 1,
+            downstream_spent=stats.downstream_spent + amount,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def rebuild(db):
+    """Recomputes the closure table and the stats from users.referred_by."""
+    user = models.User
+    path = models.ReferralPath
+    await db.execute(delete(models.ReferralStats))
+    await db.execute(delete(path))
+
+    tree = select(
+        user.referred_by.label("ancestor_id"),
+        user.id.label("descendant_id"),
+        literal(1).label("depth"),
+    ).where(user.referred_by.is_not(None)).cte("tree", recursive=True)
+    child = user.__table__.alias("child")
+    tree = tree.union_all(
+        select(tree.c.ancestor_id, child.c.id, tree.c.depth + 1)
+        .join_from(tree, child, child.c.referred_by == tree.c.descendant_id)
+        .where(tree.c.depth < MAX_DEPTH)
+    )
+    await db.execute(insert(path).from_select(
+        ["ancestor_id", "descendant_id", "depth"],
+        # Drops links to deleted referrers
+        select(tree.c.ancestor_id, tree.c.descendant_id, func.min(tree.c.depth))
+        .join(user, user.id == tree.c.ancestor_id)
+        .where(tree.c.ancestor_id != tree.c.descendant_id)
+        .group_by(tree.c.ancestor_id, tree.c.descendant_id),
+    ))
+
+    await db.execute(insert(models.ReferralStats).from_select(
+        ["user_id", *STATS_MEASURES],
+        select(
+            path.ancestor_id,
+            func.sum(case((path.depth == 1, 1), else_=0)),
+            func.count(),
+            func.coalesce(func.sum(user.order_count), 0),
+            func.coalesce(func.sum(user.total_spent), 0),
+        )
+        .join(user, user.id == path.descendant_id)
+        .group_by(path.ancestor_id),
+    ))
+    await db.commit()
+
+
+async def _main():
+    from ..database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        await rebuild(db)
+
+
+if __name__ == "__main__":
+    # python -m backend.utils.referrals
+    asyncio.run(_main())
@@ -0,0 +1,203 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import pytz
+from sqlalchemy import case, delete, func, literal, select
+from sqlalchemy.dialects.postgresql import insert
+
+from .. import models
+from ..config import settings
+from ..models.order import OrderStatus
+
+GRANULARITIES = ("hour", "day")
+ORDER_MEASURES = ("total_amount", "final_amount", "bonus_used", "delivery_cost")
+USER_MEASURES = ("new_users", "new_customers", "repeat_orders")
+# Orders in these statuses don't count towards revenue
+NON_REVENUE_STATUSES = (OrderStatus.CANCELLED, OrderStatus.REFUNDED)
+
+
+def bucket_starts(moment: datetime) -> Dict[str, datetime]:
+    """Start of the hour and of the day containing `moment`, in restaurant time."""
+    timezone = pytz.timezone(settings.RESTAURANT_TIMEZONE)
+    if moment.tzinfo is None:
+        moment = pytz.utc.localize(moment)
+    local = moment.astimezone(timezone)
+    return {
+        "hour": timezone.normalize(local.replace(minute=0, second=0, microsecond=0)),
+        "day": timezone.localize(local.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)),
+    }
+
+
+def _merge(rows: List[dict], keys: Tuple[str, ...], measures: Tuple[str, ...]) -> List[dict]:
+    # One row per bucket: ON CONFLICT can't update the same row twice in a statement
+    merged: Dict[tuple, dict] = {}
+    for row in rows:
+        key = tuple(row[name] for name in keys)
+        if key in merged:
+            for name in measures:
+                merged[key][name] += row[name]
+        else:
+            merged[key] = dict(row)
+    return list(merged.values())
+
+
+async def _upsert_orders(db, rows: List[dict]):
+    rows = _merge(rows, ("granularity", "bucket_start", "status"), ("order_count", *ORDER_MEASURES))
+    statement = insert(models.OrderRollup).values(rows)
+    statement = statement.on_conflict_do_update(
+        constraint="uq_order_rollups_bucket",
+        set_={
+            "order_count": models.OrderRollup.order_count + statement.excluded.order_count,
+            **{name: getattr(models.OrderRollup, name) + getattr(statement.excluded, name) for name in ORDER_MEASURES},
+            "updated_at": func.now(),
+        },
+    )
+    await db.execute(statement)
+
+
+async def _upsert_users(db, rows: List[dict]):
+    rows = _merge(rows, ("granularity", "bucket_start"), USER_MEASURES)
+    statement = insert(models.UserRollup).values(rows)
+    statement = statement.on_conflict_do_update(
+        constraint="uq_user_rollups_bucket",
+        set_={
+            **{name: getattr(models.UserRollup, name) + getattr(statement.excluded, name) for name in USER_MEASURES},
+            "updated_at": func.now(),
+        },
+    )
+    await db.execute(statement)
+
+
+def _order_rows(order, status: OrderStatus, sign: int) -> List[dict]:
+    return [
+        {
+            "granularity": granularity,
+            "bucket_start": bucket_start,
+            "status": status,
+            "order_count": sign,
+            **{name: sign * (getattr(order, name) or 0) for name in ORDER_MEASURES},
+        }
+        for granularity, bucket_start in bucket_starts(order.created_at).items()
+    ]
+
+
+# The record_* helpers run inside the caller's transaction, so the rollups
+# commit or roll back together with the change they describe.
+
+async def record_order_created(db, order, first_order: bool):
+    await _upsert_orders(db, _order_rows(order, order.status, +1))
+    await _upsert_users(db, [
+        {
+            "granularity": granularity,
+            "bucket_start": bucket_start,
+            "new_users": 0,
+            "new_customers": 1 if first_order else 0,
+            "repeat_orders": 0 if first_order else 1,
+        }
+        for granularity, bucket_start in bucket_starts(order.created_at).items()
+    ])
+
+
+async def record_status_change(db, order, old_status: OrderStatus, new_status: OrderStatus):
+    await record_status_changes(db, [(order, old_status, new_status)])
+
+
+async def record_status_changes(db, changes: List[Tuple]):
+    # (order, old status, new status) triples, applied with one upsert. Orders
+    # stay in the bucket they were created in; only the status moves.
+    rows = []
+    for order, old_status, new_status in changes:
+        if old_status != new_status:
+            rows += _order_rows(order, old_status, -1) + _order_rows(order, new_status, +1)
+    if rows:
+        await _upsert_orders(db, rows)
+
+
+async def record_user_created(db, user):
+    await record_users_created(db, [user])
+
+
+async def record_users_created(db, users):
+    await _upsert_users(db, [
+        {"granularity": granularity, "bucket_start": bucket_start, "new_users": 1, "new_customers": 0, "repeat_orders": 0}
+        for user in users
+        for granularity, bucket_start in bucket_starts(user.created_at).items()
+    ])
+
+
+async def read_buckets(db, model, granularity: str, date_from: datetime, date_to: datetime):
+    return (await db.execute(
+        select(model)
+        .where(
+            model.granularity == granularity,
+            model.bucket_start >= date_from,
+            model.bucket_start < date_to,
+        )
+        .order_by(model.bucket_start)
+    )).scalars().all()
+
+
+def _truncate(granularity: str, column):
+    # date_trunc in restaurant time, converted back to timestamptz. The
+    # arguments are rendered inline so that the expression in SELECT and in
+    # GROUP BY is textually identical.
+    timezone = literal(settings.RESTAURANT_TIMEZONE, literal_execute=True)
+    unit = literal(granularity, literal_execute=True)
+    return func.timezone(timezone, func.date_trunc(unit, func.timezone(timezone, column)))
+
+
+async def rebuild(db):
+    """Recompute all rollups from the orders and users tables (backfill / repair)."""
+    await db.execute(delete(models.OrderRollup))
+    await db.execute(delete(models.UserRollup))
+
+    order = models.Order
+    ranked = select(
+        order.created_at,
+        (func.row_number().over(partition_by=order.user_id, order_by=(order.created_at, order.id)) == 1).label("first"),
+    ).subquery()
+
+    for granularity in GRANULARITIES:
+        bucket = _truncate(granularity, order.created_at)
+        await db.execute(insert(models.OrderRollup).from_select(
+            ["granularity", "bucket_start", "status", "order_count", *ORDER_MEASURES],
+            select(
+                literal(granularity), bucket, order.status, func.count(),
+                *[func.coalesce(func.sum(getattr(order, name)), 0) for name in ORDER_MEASURES],
+            ).group_by(bucket, order.status),
+        ))
+
+        user_bucket = _truncate(granularity, models.User.created_at)
+        await db.execute(insert(models.UserRollup).from_select(
+            ["granularity", "bucket_start", *USER_MEASURES],
+            select(literal(granularity), user_bucket, func.count(), literal(0), literal(0)).group_by(user_bucket),
+        ))
+
+        order_bucket = _truncate(granularity, ranked.c.created_at)
+        customers = select(
+            literal(granularity), order_bucket, literal(0),
+            func.sum(case((ranked.c.first, 1), else_=0)),
+            func.sum(case((ranked.c.first, 0), else_=1)),
+        ).group_by(order_bucket)
+        statement = insert(models.UserRollup).from_select(["granularity", "bucket_start", *USER_MEASURES], customers)
+        await db.execute(statement.on_conflict_do_update(
+            constraint="uq_user_rollups_bucket",
+            set_={
+                "new_customers": statement.excluded.new_customers,
+                "repeat_orders": statement.excluded.repeat_orders,
+            },
+        ))
+    await db.commit()
+
+
+async def _main():
+    from ..database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        await rebuild(db)
+
+
+if __name__ == "__main__":
+    # python -m backend.utils.rollups
+    asyncio.run(_main())
@@ -0,0 +1,60 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: int
+    data: Any
+    built_at: float
+
+
+class VersionedCache:
+    """Keeps one in-memory snapshot of rarely changing data.
+
+    The snapshot is rebuilt only when the version counter has been bumped by a
+    write (or when the optional TTL expires, so that other worker processes
+    eventually pick up edits made elsewhere). Concurrent readers of a stale
+    snapshot wait for a single rebuild instead of all hitting the database.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self._ttl = ttl
+        self._version = 0
+        self._snapshot: Optional[Snapshot] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self) -> int:
+        self._version += 1
+        return self._version
+
+    def _is_fresh(self, snapshot: Optional[Snapshot]) -> bool:
+        if snapshot is None or snapshot.version != self._version:
+            return False
+        return self._ttl is None or time.monotonic() - snapshot.built_at < self._ttl
+
+    async def get(self, db) -> Snapshot:
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot):
+            return snapshot
+
+        async with self._lock:
+            snapshot = self._snapshot
+            if self._is_fresh(snapshot):
+                return snapshot
+            # Remember the version we are building for: if a write bumps it while
+            # we are loading, the next reader will rebuild again.
+            version = self._version
+            data = await self.build(db)
+            snapshot = Snapshot(version=version, data=data, built_at=time.monotonic())
+            self._snapshot = snapshot
+            return snapshot
+
+    async def build(self, db) -> Any:
+        raise NotImplementedError
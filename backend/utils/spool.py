@@ -0,0 +1,194 @@
+import asyncio
+import fcntl
+import json
+import os
+import time
+from typing import List, Optional, Tuple
+
+SEGMENT_SUFFIX = ".log"
+
+
+def _try_lock(fd: int) -> bool:
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def _fsync_dir(directory: str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SpoolWriter:
+    """Append-only, fsynced journal of JSON lines on local disk.
+
+    Every process writes its own segment files, so appends never contend
+    with other workers. The writer holds an exclusive flock on its active
+    segment for as long as it writes to it; a segment nobody holds the lock
+    on is sealed (rotated, or its process exited or crashed) and may be
+    deleted once it was consumed.
+
+    Concurrent appends are group-committed: records that arrive while an
+    fsync is in flight are written and fsynced together by the next one.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._fd: Optional[int] = None
+        self._size = 0
+        self._sequence = 0
+        self._pending: List[Tuple[bytes, asyncio.Future]] = []
+        self._flushing = False
+
+    async def append(self, record: dict):
+        """Returns once the record is on disk."""
+        line = json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode() + b"\n"
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((line, future))
+        if not self._flushing:
+            self._flushing = True
+            asyncio.create_task(self._flush())
+        await future
+
+    async def _flush(self):
+        try:
+            while self._pending:
+                batch, self._pending = self._pending, []
+                try:
+                    await asyncio.to_thread(self._write, b"".join(line for line, _ in batch))
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_result(None)
+        finally:
+            self._flushing = False
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        name = f"{int(time.time() * 1000):013d}-{os.getpid()}-{self._sequence}{SEGMENT_SUFFIX}"
+        fd = os.open(os.path.join(self.directory, name), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        _fsync_dir(self.directory)
+        self._fd = fd
+        self._size = 0
+
+    def _write(self, data: bytes):
+        if self._fd is None or self._size >= self.segment_bytes:
+            self.close()
+            self._open_segment()
+        view = memoryview(data)
+        while view:
+            written = os.write(self._fd, view)
+            view = view[written:]
+        os.fsync(self._fd)
+        self._size += len(data)
+
+    def close(self):
+        # Closing releases the flock, which seals the segment
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class SpoolReader:
+    """Consumes sealed and active segments of a spool directory.
+
+    A consumer claims a segment with a flock on its ".lock" sidecar, so any
+    number of processes can read the same directory and each segment is
+    read by one of them at a time. Progress is stored as a byte offset in
+    the ".offset" sidecar after each batch was applied, so records are
+    delivered at least once and consumers must be idempotent.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def segments(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            os.path.join(self.directory, name) for name in names if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def claim(self, segment: str) -> Optional["SegmentClaim"]:
+        try:
+            lock_fd = os.open(segment + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        except FileNotFoundError:
+            return None
+        if not _try_lock(lock_fd):
+            os.close(lock_fd)
+            return None
+        if not os.path.exists(segment):
+            # Consumed and deleted by another reader in the meantime
+            os.close(lock_fd)
+            return None
+        return SegmentClaim(segment, lock_fd)
+
+
+class SegmentClaim:
+    def __init__(self, segment: str, lock_fd: int):
+        self.segment = segment
+        self._lock_fd = lock_fd
+        self.offset = self._read_offset()
+
+    def _read_offset(self) -> int:
+        try:
+            with open(self.segment + ".offset") as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def is_sealed(self) -> bool:
+        fd = os.open(self.segment, os.O_RDONLY)
+        try:
+            return _try_lock(fd)
+        finally:
+            os.close(fd)
+
+    def read(self, limit: int) -> Tuple[List[dict], int]:
+        """Up to `limit` complete records after the stored offset, and the offset after them."""
+        records = []
+        offset = self.offset
+        with open(self.segment, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Torn write of a crashed writer, or an append in progress
+                    break
+                offset += len(line)
+                records.append(json.loads(line))
+                if len(records) >= limit:
+                    break
+        return records, offset
+
+    def commit(self, offset: int):
+        path = self.segment + ".offset"
+        with open(path + ".tmp", "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self.offset = offset
+
+    def delete(self):
+        for path in (self.segment, self.segment + ".offset", self.segment + ".lock"):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def release(self):
+        os.close(self._lock_fd)
@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl
+
+from fastapi import Header, HTTPException
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from .. import models
+from ..config import settings
+from ..database import AsyncSessionLocal
+from . import bonus_rules, referrals, rollups
+
+logger = logging.getLogger(__name__)
+
+AUTH_SCHEME = "tma"  # Authorization: tma <initData>
+
+
+class InitDataError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class TelegramUser:
+    telegram_id: str
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    start_param: Optional[str]  # Referral code when opened from a referral link
+    auth_date: int
+
+
+def _secret_key(bot_token: str) -> bytes:
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+
+def verify_init_data(init_data: str, bot_token: str, max_age: float, now: Optional[float] = None) -> TelegramUser:
+    """Checks the Mini App initData signature and age, and returns its user.
+
+    See https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
+    """
+    if not bot_token:
+        # Anyone can sign with an empty key
+        raise InitDataError("Bot token is not configured")
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received_hash = fields.pop("hash", None)
+    if not received_hash:
+        raise InitDataError("Init data is not signed")
+    data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    expected_hash = hmac.new(_secret_key(bot_token), data_check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected_hash, received_hash):
+        raise InitDataError("Invalid init data signature")
+
+    try:
+        auth_date = int(fields["auth_date"])
+        user = json.loads(fields["user"])
+        telegram_id = str(user["id"])
+    except (KeyError, ValueError, TypeError):
+        raise InitDataError("Malformed init data")
+    if (now or time.time()) - auth_date > max_age:
+        raise InitDataError("Init data expired")
+    return TelegramUser(
+        telegram_id=telegram_id,
+        username=user.get("username"),
+        first_name=user.get("first_name"),
+        last_name=user.get("last_name"),
+        start_param=fields.get("start_param") or None,
+        auth_date=auth_date,
+    )
+
+
+class VerifiedInitDataCache:
+    """LRU of already verified initData -> user id.
+
+    The mini app sends the same initData with every request of a session, so
+    only the first one pays for the HMAC and the user lookup. Entries expire
+    with the initData itself (auth_date + max age). Keys are digests of the
+    whole string, not Telegram's hash field, so altered data never hits.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._entries: "OrderedDict[bytes, Tuple[int, float]]" = OrderedDict()
+
+    @staticmethod
+    def key(init_data: str) -> bytes:
+        return hashlib.blake2b(init_data.encode(), digest_size=16).digest()
+
+    def get(self, key: bytes, now: float) -> Optional[int]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        user_id, expires_at = entry
+        if now >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return user_id
+
+    def put(self, key: bytes, user_id: int, expires_at: float):
+        self._entries[key] = (user_id, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class UserResolver:
+    """Maps Telegram users to user ids, creating the missing ones in batches.
+
+    Lookups arriving within a short window share one SELECT, and first
+    visits within it share one INSERT plus one rollup upsert and one bonus
+    accrual, instead of a create_user round trip each.
+    """
+
+    def __init__(self, window: float, batch_size: int):
+        self._window = window
+        self._batch_size = batch_size
+        self._pending: Dict[str, Tuple[TelegramUser, asyncio.Future]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def resolve(self, telegram_user: TelegramUser) -> int:
+        pending = self._pending.get(telegram_user.telegram_id)
+        if pending is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[telegram_user.telegram_id] = (telegram_user, future)
+            if len(self._pending) >= self._batch_size:
+                self._flush_pending()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self._window, self._flush_pending)
+        else:
+            future = pending[1]
+        # Shielded: one caller going away must not fail the others' lookup
+        return await asyncio.shield(future)
+
+    def _flush_pending(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.ensure_future(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: Dict[str, Tuple[TelegramUser, asyncio.Future]]):
+        try:
+            async with AsyncSessionLocal() as db:
+                user_ids = await self.resolve_batch(db, [telegram_user for telegram_user, _ in batch.values()])
+        except Exception as e:
+            logger.exception("Resolving %s Telegram users failed", len(batch))
+            for _, future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for telegram_id, (_, future) in batch.items():
+            if future.done():
+                continue
+            if telegram_id in user_ids:
+                future.set_result(user_ids[telegram_id])
+            else:
+                future.set_exception(InitDataError("User could not be signed up"))
+
+    @staticmethod
+    async def resolve_batch(db, telegram_users: List[TelegramUser]) -> Dict[str, int]:
+        user = models.User
+        telegram_ids = [telegram_user.telegram_id for telegram_user in telegram_users]
+        user_ids = dict((await db.execute(
+            select(user.telegram_id, user.id).where(user.telegram_id.in_(telegram_ids))
+        )).all())
+        missing = [telegram_user for telegram_user in telegram_users if telegram_user.telegram_id not in user_ids]
+        if missing:
+            codes = {telegram_user.start_param for telegram_user in missing if telegram_user.start_param}
+            referrers = dict((await db.execute(
+                select(user.referral_code, user.id).where(user.referral_code.in_(codes))
+            )).all()) if codes else {}
+            rows = [
+                {
+                    "telegram_id": telegram_user.telegram_id,
+                    "username": telegram_user.username,
+                    "first_name": telegram_user.first_name,
+                    "last_name": telegram_user.last_name,
+                    "referred_by": referrers.get(telegram_user.start_param),
+                }
+                for telegram_user in missing
+            ]
+            created = (await db.execute(
+                insert(user).values(rows).on_conflict_do_nothing().returning(user)
+            )).scalars().all()
+            if len(created) < len(rows):
+                # Created by another worker meanwhile, or a stale username
+                # taken by someone else: try once more without the username
+                taken = {row.telegram_id for row in created}
+                retry = [{**row, "username": None} for row in rows if row["telegram_id"] not in taken]
+                created += (await db.execute(
+                    insert(user).values(retry).on_conflict_do_nothing().returning(user)
+                )).scalars().all()
+            if created:
+                await rollups.record_users_created(db, created)
+                for db_user in created:
+                    await referrals.record_user_created(db, db_user)
+                await bonus_rules.accrue_for_new_users(db, created)
+            await db.commit()
+            user_ids.update((db_user.telegram_id, db_user.id) for db_user in created)
+            if len(user_ids) < len(telegram_ids):
+                user_ids.update((await db.execute(
+                    select(user.telegram_id, user.id)
+                    .where(user.telegram_id.in_([telegram_id for telegram_id in telegram_ids if telegram_id not in user_ids]))
+                )).all())
+        return user_ids
+
+
+verified_init_data = VerifiedInitDataCache(settings.TELEGRAM_AUTH_CACHE_SIZE)
+user_resolver = UserResolver(settings.TELEGRAM_AUTH_BATCH_WINDOW, settings.TELEGRAM_AUTH_BATCH_SIZE)
+
+
+async def authenticate(init_data: str) -> int:
+    now = time.time()
+    key = verified_init_data.key(init_data)
+    user_id = verified_init_data.get(key, now)
+    if user_id is not None:
+        return user_id
+    telegram_user = verify_init_data(init_data, settings.TELEGRAM_BOT_TOKEN, settings.TELEGRAM_AUTH_MAX_AGE, now)
+    user_id = await user_resolver.resolve(telegram_user)
+    verified_init_data.put(key, user_id, telegram_user.auth_date + settings.TELEGRAM_AUTH_MAX_AGE)
+    return user_id
+
+
+async def current_user_id(authorization: Optional[str] = Header(None)) -> int:
+    """Dependency: id of the user whose Telegram initData signs the request."""
+    if not settings.TELEGRAM_BOT_TOKEN:
+        raise HTTPException(status_code=503, detail="Telegram authentication is not configured")
+    scheme, _, init_data = (authorization or "").partition(" ")
+    if scheme.lower() != AUTH_SCHEME or not init_data:
+        raise HTTPException(status_code=401, detail="Telegram init data required")
+    try:
+        return await authenticate(init_data)
+    except InitDataError as e:
+        raise HTTPException(status_code=401, detail=str(e))
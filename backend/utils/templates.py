@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from string import Formatter
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+
+# Placeholders available to each template type
+RECIPIENT_PLACEHOLDERS = frozenset({"first_name", "last_name", "username", "bonus_balance", "referral_code"})
+ORDER_PLACEHOLDERS = frozenset({
+    "order_number", "status", "order_type", "final_amount", "delivery_cost", "bonus_used",
+    "delivery_time", "pickup_time", "delivery_address_description",
+})
+PLACEHOLDERS: Dict[str, FrozenSet[str]] = {
+    "order_status": RECIPIENT_PLACEHOLDERS | ORDER_PLACEHOLDERS,
+    "promotional": RECIPIENT_PLACEHOLDERS,
+    "system": RECIPIENT_PLACEHOLDERS,
+}
+
+TEMPLATE_CACHE_SIZE = 256
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class CompiledTemplate:
+    """Notification text with {placeholders}, parsed once.
+
+    The text is turned into a positional format string ("Hi {0}, ...") plus
+    the ordered list of placeholder names, so rendering is a single C-level
+    str.format call with no parsing. Missing or None values render as an
+    empty string.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        chunks = []
+        self.field_order: List[str] = []
+        try:
+            for literal, field, format_spec, conversion in Formatter().parse(text):
+                chunks.append(literal.replace("{", "{{").replace("}", "}}"))
+                if field is None:
+                    continue
+                if format_spec or conversion:
+                    raise TemplateError(f"Formatting options are not supported: {{{field}}}")
+                if not field.isidentifier():
+                    raise TemplateError(f"Invalid placeholder: {{{field}}}")
+                chunks.append("{%d}" % len(self.field_order))
+                self.field_order.append(field)
+        except TemplateError:
+            raise
+        except ValueError as e:
+            raise TemplateError(str(e))
+        self._format = "".join(chunks).format
+        self.fields = frozenset(self.field_order)
+
+    def render(self, context: Mapping) -> str:
+        get = context.get
+        return self._format(*["" if (value := get(field)) is None else value for field in self.field_order])
+
+    def render_many(self, contexts: Iterable[Mapping]) -> List[str]:
+        render = self.render
+        return [render(context) for context in contexts]
+
+
+def compile_template(text: Optional[str]) -> CompiledTemplate:
+    return CompiledTemplate(text or "")
+
+
+def validate_template(template_type: str, *texts: Optional[str]):
+    """Raises TemplateError for syntax errors or placeholders the type doesn't provide."""
+    allowed = PLACEHOLDERS.get(template_type)
+    if allowed is None:
+        raise TemplateError(f"Unknown template type: {template_type}")
+    for text in texts:
+        unknown = compile_template(text).fields - allowed
+        if unknown:
+            raise TemplateError(
+                f"Unknown placeholders for {template_type} templates: {', '.join(sorted(unknown))}"
+            )
+
+
+class TemplateCache:
+    """LRU of compiled (title, message) pairs keyed by (template id, updated_at).
+
+    An edited template gets a new updated_at and therefore a new entry; the
+    stale one simply ages out.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._entries: "OrderedDict[Tuple, Tuple[CompiledTemplate, CompiledTemplate]]" = OrderedDict()
+
+    def get(self, template) -> Tuple[CompiledTemplate, CompiledTemplate]:
+        key = (template.id, template.updated_at)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        entry = (compile_template(template.title), compile_template(template.message))
+        self._entries[key] = entry
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        return entry
+
+    def render_many(self, template, contexts: Iterable[Mapping]) -> List[Tuple[Optional[str], str]]:
+        title, message = self.get(template)
+        contexts = list(contexts)
+        titles = title.render_many(contexts) if title.text else [None] * len(contexts)
+        return list(zip(titles, message.render_many(contexts)))
+
+
+template_cache = TemplateCache(TEMPLATE_CACHE_SIZE)
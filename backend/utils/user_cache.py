@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from .. import models, schemas
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+DIRTY_USERS = "dirty_user_ids"  # Session.info key
+# Invalidated Redis entries are left as empty tombstones this long, so that a
+# process still holding a profile it read before the commit can't put it back
+REDIS_TOMBSTONE_SECONDS = 5
+
+
+class UserCache:
+    """Profiles (schemas.User) by user id, with a telegram_id -> id index.
+
+    Per-process LRU in front of an optional shared Redis. Writers mark the
+    users they change on their session (`mark_dirty`) and the entries are
+    dropped once that session commits, so a profile is never served from
+    memory with counters older than the last commit of this process. Other
+    processes see the change as soon as their short local TTL runs out
+    (the Redis copy is replaced by a tombstone right away).
+
+    A load that overlaps an invalidation of the same user is not stored, so
+    a reader can't put back what it read before a concurrent commit.
+    """
+
+    def __init__(self, size: int, ttl: float, redis_url: str = "", redis_ttl: float = 300):
+        self._size = size
+        self._ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # user id -> (profile, expires at)
+        self._telegram_ids: "OrderedDict[str, int]" = OrderedDict()  # Never changes for a user
+        self._loads: Dict[int, list] = {}  # user id -> [future, still valid]
+        self._redis_url = redis_url
+        self._redis_ttl = redis_ttl
+        self._redis = None
+
+    # Shared backend (optional dependency, imported on first use)
+
+    def _get_redis(self):
+        if self._redis is None and self._redis_url:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                logger.warning("USER_CACHE_REDIS_URL is set but the redis package is not installed")
+                self._redis_url = ""
+                return None
+            self._redis = redis.from_url(self._redis_url)
+        return self._redis
+
+    @staticmethod
+    def _redis_key(user_id: int) -> str:
+        return f"user:{user_id}"
+
+    async def _redis_get(self, user_id: int) -> Optional[schemas.User]:
+        redis = self._get_redis()
+        if redis is None:
+            return None
+        try:
+            raw = await redis.get(self._redis_key(user_id))
+        except Exception:
+            logger.exception("Reading user %s from Redis failed", user_id)
+            return None
+        return schemas.User.model_validate_json(raw) if raw else None
+
+    async def _redis_set(self, profile: schemas.User):
+        redis = self._get_redis()
+        if redis is None:
+            return
+        try:
+            await redis.set(self._redis_key(profile.id), profile.model_dump_json(), ex=int(self._redis_ttl), nx=True)
+        except Exception:
+            logger.exception("Writing user %s to Redis failed", profile.id)
+
+    async def _redis_invalidate(self, user_ids):
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for user_id in user_ids:
+                    pipe.set(self._redis_key(user_id), b"", ex=REDIS_TOMBSTONE_SECONDS)
+                await pipe.execute()
+        except Exception:
+            logger.exception("Invalidating users in Redis failed")
+
+    # Reads
+
+    async def get(self, db, user_id: int) -> Optional[schemas.User]:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            profile, expires_at = entry
+            if time.monotonic() < expires_at:
+                self._entries.move_to_end(user_id)
+                return profile
+            del self._entries[user_id]
+
+        load = self._loads.get(user_id)
+        if load is not None:
+            # Someone is loading this user already: share their result
+            try:
+                return await asyncio.shield(load[0])
+            except asyncio.CancelledError:
+                if not load[0].cancelled():
+                    raise  # We are the one being cancelled
+                # The loading request was cancelled: load it ourselves
+                return await self.get(db, user_id)
+        load = self._loads[user_id] = [asyncio.get_running_loop().create_future(), True]
+        try:
+            profile = await self._redis_get(user_id)
+            from_redis = profile is not None
+            if not from_redis:
+                db_user = await db.get(models.User, user_id)
+                profile = schemas.User.model_validate(db_user) if db_user is not None else None
+        except Exception as e:
+            load[0].set_exception(e)
+            load[0].exception()  # Consumed here; waiters get it re-raised
+            raise
+        except BaseException:
+            # Cancelled mid-load: waiters must not wait for a result forever
+            load[0].cancel()
+            raise
+        finally:
+            del self._loads[user_id]
+        load[0].set_result(profile)
+        if profile is not None and load[1]:
+            self._store(profile)
+            if not from_redis:
+                await self._redis_set(profile)
+        return profile
+
+    async def get_by_telegram_id(self, db, telegram_id: str) -> Optional[schemas.User]:
+        user_id = self._telegram_ids.get(telegram_id)
+        if user_id is None:
+            user_id = (await db.execute(
+                select(models.User.id).where(models.User.telegram_id == telegram_id)
+            )).scalar_one_or_none()
+            if user_id is None:
+                return None
+            self._index(telegram_id, user_id)
+        return await self.get(db, user_id)
+
+    def _index(self, telegram_id: str, user_id: int):
+        self._telegram_ids[telegram_id] = user_id
+        self._telegram_ids.move_to_end(telegram_id)
+        while len(self._telegram_ids) > self._size:
+            self._telegram_ids.popitem(last=False)
+
+    def _store(self, profile: schemas.User):
+        self._entries[profile.id] = (profile, time.monotonic() + self._ttl)
+        self._entries.move_to_end(profile.id)
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+        self._index(profile.telegram_id, profile.id)
+
+    # Writes
+
+    @staticmethod
+    def mark_dirty(db, *user_ids: int):
+        """Drops the users' cached profiles when the session commits."""
+        db.info.setdefault(DIRTY_USERS, set()).update(user_ids)
+
+    def invalidate(self, user_ids: Iterable[int]):
+        user_ids = list(user_ids)
+        for user_id in user_ids:
+            self._entries.pop(user_id, None)
+            load = self._loads.get(user_id)
+            if load is not None:
+                load[1] = False
+        if user_ids and self._get_redis() is not None:
+            try:
+                asyncio.get_running_loop().create_task(self._redis_invalidate(user_ids))
+            except RuntimeError:
+                pass  # No event loop (sync scripts): the Redis TTL takes care of it
+
+    def clear(self):
+        self._entries.clear()
+        self._telegram_ids.clear()
+
+
+user_cache = UserCache(
+    size=settings.USER_CACHE_SIZE,
+    ttl=settings.USER_CACHE_TTL_SECONDS,
+    redis_url=settings.USER_CACHE_REDIS_URL,
+    redis_ttl=settings.USER_CACHE_REDIS_TTL_SECONDS,
+)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    user_ids = session.info.pop(DIRTY_USERS, None)
+    if user_ids:
+        user_cache.invalidate(user_ids)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_rolled_back(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop(DIRTY_USERS, None)
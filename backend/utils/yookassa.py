@@ -0,0 +1,184 @@
+import asyncio
+import time
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from ..config import settings
+
+STATUS_CACHE_MAX_ENTRIES = 10000
+
+# YooKassa payment status -> webhook event with the same effect
+STATUS_EVENTS = {
+    "waiting_for_capture": "payment.waiting_for_capture",
+    "succeeded": "payment.succeeded",
+    "canceled": "payment.canceled",
+}
+
+
+class YooKassaError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(YooKassaError):
+    pass
+
+
+class CircuitBreaker:
+    """Stops calling a failing provider for a while instead of piling up timeouts.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls fail immediately; once `reset_timeout` passed a single probe call
+    is let through, and its outcome closes or re-opens the circuit. A probe
+    that ends without an outcome (cancelled) or never reports one is
+    replaced by another after `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at < self.reset_timeout:
+            return False
+        if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+            return False
+        self._probe_started = now
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_started = None
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        self._probe_started = None
+
+
+class YooKassaClient:
+    """Shared async client for the YooKassa API.
+
+    One pooled keep-alive connection set per process. Status lookups are
+    cached for a few seconds and concurrent lookups of the same payment share
+    one in-flight request, so clients polling a payment cost at most one
+    provider call per payment per TTL.
+    """
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(settings.YOOKASSA_CIRCUIT_FAILURES, settings.YOOKASSA_CIRCUIT_RESET_SECONDS)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._status_cache: Dict[str, Tuple[float, dict]] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=settings.YOOKASSA_API_URL,
+                auth=(settings.YOOKASSA_SHOP_ID, settings.YOOKASSA_API_KEY),
+                timeout=httpx.Timeout(settings.YOOKASSA_TIMEOUT, connect=min(settings.YOOKASSA_TIMEOUT, 3.0)),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+            )
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        if self._client is None:
+            await self.start()
+        if not self.breaker.allow():
+            raise CircuitOpenError("YooKassa is unavailable")
+        try:
+            response = await self._client.request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            raise YooKassaError(f"{type(e).__name__}: {e}")
+        except BaseException:
+            # Cancelled, or failed in a way that says nothing about the provider
+            self.breaker.release_probe()
+            raise
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure()
+            raise YooKassaError(f"HTTP {response.status_code}", response.status_code)
+        # A 4xx is our request's fault, not a sign the provider is down
+        self.breaker.record_success()
+        if response.status_code >= 400:
+            try:
+                description = response.json().get("description")
+            except ValueError:
+                description = None
+            raise YooKassaError(description or f"HTTP {response.status_code}", response.status_code)
+        return response.json()
+
+    async def create_payment(
+        self,
+        amount: Decimal,
+        idempotence_key: str,
+        return_url: str,
+        description: Optional[str] = None,
+        metadata: Optional[dict] = None,
+    ) -> dict:
+        # The idempotence key makes a retried create return the same payment
+        payment = await self._request(
+            "POST",
+            "/payments",
+            headers={"Idempotence-Key": idempotence_key},
+            json={
+                "amount": {"value": f"{Decimal(amount):.2f}", "currency": "RUB"},
+                "capture": True,
+                "confirmation": {"type": "redirect", "return_url": return_url},
+                "description": (description or "")[:128],
+                "metadata": metadata or {},
+            },
+        )
+        self._cache_status(payment)
+        return payment
+
+    async def get_payment(self, provider_payment_id: str, fresh: bool = False) -> dict:
+        """`fresh` skips the status cache, for when the answer decides what we apply."""
+        cached = self._status_cache.get(provider_payment_id)
+        if not fresh and cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        future = self._in_flight.get(provider_payment_id)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch_payment(provider_payment_id))
+            self._in_flight[provider_payment_id] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(provider_payment_id, None))
+        # Shielded: a caller that goes away must not cancel the others' request
+        return await asyncio.shield(future)
+
+    async def _fetch_payment(self, provider_payment_id: str) -> dict:
+        payment = await self._request("GET", f"/payments/{provider_payment_id}")
+        self._cache_status(payment)
+        return payment
+
+    async def get_refund(self, refund_id: str) -> dict:
+        return await self._request("GET", f"/refunds/{refund_id}")
+
+    def _cache_status(self, payment: dict):
+        now = time.monotonic()
+        if len(self._status_cache) >= STATUS_CACHE_MAX_ENTRIES:
+            self._status_cache = {key: value for key, value in self._status_cache.items() if value[0] > now}
+        self._status_cache[payment["id"]] = (now + settings.YOOKASSA_STATUS_CACHE_TTL, payment)
+
+    def forget(self, provider_payment_id: str):
+        self._status_cache.pop(provider_payment_id, None)
+
+
+yookassa_client = YooKassaClient()
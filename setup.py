@@ -11,7 +11,6 @@ setup(
         "fastapi==0.104.1",
         "uvicorn[standard]==0.24.0",
         "sqlalchemy==2.0.23",
-        "databases[postgresql]==0.8.0",
         "asyncpg==0.29.0",
         "pydantic==2.5.0",
         "pydantic-settings==2.1.0",
@@ -20,9 +19,11 @@ setup(
         "python-multipart==0.0.6",
         "aiofiles==23.2.1",
         "requests==2.31.0",
+        "httpx==0.25.2",
         "yookassa==2.4.0",
         "python-telegram-bot==20.7",
         "geopy==2.4.1",
+        "numpy==1.26.2",
         "pytz==2023.3.post1",
         "cryptography==41.0.8",
         "Pillow==10.1.0",
@@ -31,6 +32,7 @@ setup(
         "dev": [
             "pytest",
             "pytest-asyncio",
+            "aiosqlite",
             "black",
             "flake8",
         ]
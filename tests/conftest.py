@@ -0,0 +1,57 @@
+import os
+import tempfile
+
+# Settings are read when backend modules are imported
+os.environ.setdefault("PAYMENT_SPOOL_DIR", tempfile.mkdtemp(prefix="payment_spool_"))
+
+import pytest
+import pytest_asyncio
+
+from .database import TEST_DATABASE_URL, create_database, map_models
+
+map_models()
+
+# Benchmarks take minutes and print their numbers instead of asserting
+# timings: they only run with RUN_BENCHMARKS=1
+RUN_BENCHMARKS = os.getenv("RUN_BENCHMARKS") == "1"
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: slow benchmark, runs only with RUN_BENCHMARKS=1")
+
+
+def pytest_collection_modifyitems(config, items):
+    if RUN_BENCHMARKS:
+        return
+    skip = pytest.mark.skip(reason="RUN_BENCHMARKS is not set")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def report(capsys):
+    """Prints benchmark results past pytest's output capture."""
+
+    def report(message: str, *args):
+        with capsys.disabled():
+            print(message % args if args else message)
+
+    return report
+
+
+@pytest_asyncio.fixture
+async def sqlite_engine(tmp_path):
+    pytest.importorskip("aiosqlite")
+    engine = await create_database(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def pg_engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    engine = await create_database(TEST_DATABASE_URL, pool_size=20, max_overflow=0)
+    yield engine
+    await engine.dispose()
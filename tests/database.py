@@ -0,0 +1,44 @@
+import os
+
+from sqlalchemy import Column, MetaData, Table
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import registry, sessionmaker
+
+from backend import models
+
+# Postgres for the tests that run Postgres-only SQL (UPDATE ... FROM VALUES,
+# ON CONFLICT, pg_notify), e.g. postgresql+asyncpg://postgres@localhost/miniapp_test.
+# Its tables are dropped and recreated.
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+
+mapper_registry = registry(metadata=MetaData())
+
+
+def map_models():
+    # The model classes declare __tablename__, columns and __table_args__
+    # without a declarative base: build their tables and map them here
+    if mapper_registry.mappers:
+        return
+    for name in models.__all__:
+        model = getattr(models, name)
+        columns = []
+        for key, value in list(vars(model).items()):
+            if isinstance(value, Column):
+                value.name = value.name or key
+                value.key = key
+                columns.append(value)
+        table = Table(model.__tablename__, mapper_registry.metadata, *columns, *getattr(model, "__table_args__", ()))
+        mapper_registry.map_imperatively(model, table)
+
+
+async def create_database(url: str, **kwargs):
+    """Engine on `url` with all tables freshly created."""
+    engine = create_async_engine(url, **kwargs)
+    async with engine.begin() as connection:
+        await connection.run_sync(mapper_registry.metadata.drop_all)
+        await connection.run_sync(mapper_registry.metadata.create_all)
+    return engine
+
+
+def session_factory(engine) -> sessionmaker:
+    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -0,0 +1,95 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from backend import models
+from backend.api.routers import analytics, bonus, delivery, menu, notifications, users
+from backend.config import settings
+from backend.database import get_db
+from backend.utils import access
+from backend.utils.user_cache import UserCache
+
+from .database import session_factory
+
+STAFF_ONLY = [
+    ("POST", "/notifications/templates/"),
+    ("POST", "/notifications/send/"),
+    ("POST", "/notifications/broadcasts/"),
+    ("GET", "/notifications/broadcasts/1"),
+    ("POST", "/notifications/broadcasts/1/pause/"),
+    ("POST", "/notifications/broadcasts/1/resume/"),
+    ("POST", "/bonus/programs/"),
+    ("PUT", "/bonus/programs/1"),
+    ("POST", "/categories/"),
+    ("PUT", "/categories/1"),
+    ("POST", "/products/"),
+    ("PUT", "/products/1"),
+    ("POST", "/delivery/zones/"),
+    ("PUT", "/delivery/zones/1"),
+    ("POST", "/delivery/zones/1/costs/"),
+    ("GET", "/analytics/orders/"),
+    ("GET", "/analytics/revenue/"),
+    ("GET", "/analytics/slice/"),
+]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "STAFF_API_TOKEN", "staff-token")
+    monkeypatch.setattr(settings, "TELEGRAM_BOT_TOKEN", "123:bot")
+
+    async def authenticate(init_data: str) -> int:
+        return 7
+
+    monkeypatch.setattr(access, "authenticate", authenticate)
+    app = FastAPI()
+    for module in (analytics, bonus, delivery, menu, notifications):
+        app.include_router(module.router, prefix="/api/v1")
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("method,path", STAFF_ONLY)
+async def test_back_office_endpoints_are_staff_only(client, method, path):
+    async with client:
+        anonymous = await client.request(method, f"/api/v1{path}", json={})
+        mini_app = await client.request(method, f"/api/v1{path}", json={}, headers={"Authorization": "tma signed"})
+    assert anonymous.status_code == 401
+    assert mini_app.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_telegram_id_lookup_does_not_reveal_other_users(pg_engine, monkeypatch):
+    sessions = session_factory(pg_engine)
+    async with sessions() as db:
+        ann, bob = models.User(telegram_id="100"), models.User(telegram_id="200")
+        db.add_all([ann, bob])
+        await db.commit()
+
+    async def get_test_db():
+        async with sessions() as db:
+            yield db
+
+    async def authenticate(init_data: str) -> int:
+        return ann.id
+
+    monkeypatch.setattr(settings, "STAFF_API_TOKEN", "staff-token")
+    monkeypatch.setattr(settings, "TELEGRAM_BOT_TOKEN", "123:bot")
+    monkeypatch.setattr(access, "authenticate", authenticate)
+    monkeypatch.setattr(users, "user_cache", UserCache(size=100, ttl=60))
+    app = FastAPI()
+    app.include_router(users.router, prefix="/api/v1")
+    app.dependency_overrides[get_db] = get_test_db
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        async def lookup(telegram_id: str, authorization: str) -> httpx.Response:
+            return await client.get(f"/api/v1/users/telegram/{telegram_id}", headers={"Authorization": authorization})
+
+        own = await lookup("100", "tma signed")
+        someone_else, nobody = await lookup("200", "tma signed"), await lookup("999", "tma signed")
+        staff, staff_missing = await lookup("200", "Bearer staff-token"), await lookup("999", "Bearer staff-token")
+
+    assert (own.status_code, own.json()["id"]) == (200, ann.id)
+    assert (someone_else.status_code, someone_else.json()) == (nobody.status_code, nobody.json()) == (404, {"detail": "User not found"})
+    assert (staff.status_code, staff.json()["id"]) == (200, bob.id)
+    assert staff_missing.status_code == 404
@@ -0,0 +1,216 @@
+import random
+import statistics
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+import pytz
+from sqlalchemy import text
+
+from backend import models
+from backend.api.routers import analytics
+from backend.config import settings
+from backend.utils.analytics_engine import AnalyticsEngine
+
+from .database import session_factory
+
+SLICE = ("weekday", "hour", "order_type", "payment_method", "category_id")
+ORDER_TYPES = ("delivery", "pickup")
+PAYMENT_METHODS = ("yookassa", "cash", "card")
+STATUSES = ("pending", "delivered", "delivered", "delivered", "cancelled", "refunded")
+PRODUCTS = 40
+CATEGORIES = 8
+BENCHMARK_ORDERS = 1_000_000
+REPEATS = 5
+
+
+def _category(product_id: int) -> int:
+    return product_id % CATEGORIES + 1
+
+
+def _synthetic(count: int, seed: int = 0):
+    generator = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=pytz.utc)
+    orders, items = [], []
+    for order_id in range(1, count + 1):
+        orders.append(SimpleNamespace(
+            id=order_id,
+            created_at=start + timedelta(minutes=generator.randrange(366 * 24 * 60)),
+            order_type=generator.choice(ORDER_TYPES),
+            payment_method=generator.choice(PAYMENT_METHODS),
+            status=generator.choice(STATUSES),
+        ))
+        for _ in range(generator.randint(1, 4)):
+            quantity = generator.randint(1, 3)
+            items.append(SimpleNamespace(
+                order_id=order_id, product_id=generator.randint(1, PRODUCTS), quantity=quantity,
+                total_price=quantity * generator.choice((150, 250.5, 390)),
+            ))
+    return orders, items
+
+
+def _expected(orders, items):
+    timezone = pytz.timezone(settings.RESTAURANT_TIMEZONE)
+    by_id = {order.id: order for order in orders}
+    groups = defaultdict(lambda: [0.0, 0, set()])
+    for item in items:
+        order = by_id[item.order_id]
+        if order.status in ("cancelled", "refunded"):
+            continue
+        local = order.created_at.astimezone(timezone)
+        key = (local.weekday(), local.hour, order.order_type, order.payment_method, _category(item.product_id))
+        group = groups[key]
+        group[0] += item.total_price
+        group[1] += item.quantity
+        group[2].add(order.id)
+    return {key: (round(revenue, 2), quantity, len(ids)) for key, (revenue, quantity, ids) in groups.items()}
+
+
+def _actual(engine: AnalyticsEngine):
+    return {
+        tuple(row[name] for name in SLICE): (row["revenue"], row["quantity"], row["orders"])
+        for row in engine.group_by(SLICE)
+    }
+
+
+def test_group_by_matches_row_by_row_totals():
+    orders, items = _synthetic(3000)
+    categories = {product_id: _category(product_id) for product_id in range(1, PRODUCTS + 1)}
+    engine = AnalyticsEngine(sync_interval=0)
+
+    # Incremental loads, one of them committed late with lower ids
+    engine.append_orders(orders[:1000], items[:sum(1 for item in items if item.order_id <= 1000)], categories)
+    late = [order for order in orders if 2000 < order.id]
+    engine.append_orders(late, [item for item in items if item.order_id > 2000], categories)
+    middle = [order for order in orders if 1000 < order.id <= 2000]
+    engine.append_orders(middle, [item for item in items if 1000 < item.order_id <= 2000], categories)
+    assert _actual(engine) == _expected(orders, items)
+
+    # Status changes of known orders are applied in place
+    for order in orders[::7]:
+        order.status = "cancelled" if order.status == "delivered" else "delivered"
+    engine.append_orders(orders[::7], [], categories)
+    assert _actual(engine) == _expected(orders, items)
+
+
+@pytest.mark.asyncio
+async def test_slice_reads_naive_dates_as_restaurant_time(monkeypatch):
+    timezone = pytz.timezone(settings.RESTAURANT_TIMEZONE)
+    order = SimpleNamespace(
+        id=1, created_at=timezone.localize(datetime(2024, 5, 1, 10)), order_type="pickup",
+        payment_method="cash", status="delivered",
+    )
+    item = SimpleNamespace(order_id=1, product_id=1, quantity=2, total_price=500.0)
+    engine = AnalyticsEngine(sync_interval=3600)
+    engine.append_orders([order], [item], {1: 1})
+
+    async def sync(db, force=False):
+        pass
+
+    monkeypatch.setattr(engine, "sync", sync)
+    monkeypatch.setattr(analytics, "analytics_engine", engine)
+    result = await analytics.get_revenue_slice(
+        dimensions="hour", date_from=datetime(2024, 5, 1, 9, 30), date_to=datetime(2024, 5, 1, 10, 30),
+        order_type=None, payment_method=None, category_id=None, include_cancelled=False, db=None,
+    )
+    assert result["rows"] == [{"hour": 10, "revenue": 500.0, "quantity": 2, "orders": 1}]
+
+
+async def _generate_orders(sessions, count: int):
+    async with sessions() as db:
+        user = models.User(telegram_id="1")
+        db.add(user)
+        await db.flush()
+        await db.execute(text(
+            "INSERT INTO categories (id, name) SELECT n, 'Category ' || n FROM generate_series(1, :categories) AS n"
+        ), {"categories": CATEGORIES})
+        await db.execute(text(
+            "INSERT INTO products (id, category_id, name, price) "
+            "SELECT n, n % :categories + 1, 'Product ' || n, 250 FROM generate_series(1, :products) AS n"
+        ), {"categories": CATEGORIES, "products": PRODUCTS})
+        await db.execute(text(
+            "INSERT INTO orders (user_id, order_number, status, order_type, payment_method, "
+            "total_amount, final_amount, created_at, updated_at) "
+            "SELECT :user_id, 'B-' || n, "
+            "(ARRAY['PENDING', 'DELIVERED', 'DELIVERED', 'DELIVERED', 'CANCELLED', 'REFUNDED'])[1 + n % 6]::orderstatus, "
+            "(ARRAY['delivery', 'pickup'])[1 + n % 2], (ARRAY['yookassa', 'cash', 'card'])[1 + n % 3], "
+            "500, 500, created_at, created_at "
+            "FROM (SELECT n, timestamptz '2024-01-01' + random() * interval '366 days' AS created_at "
+            "FROM generate_series(1, :count) AS n) AS generated"
+        ), {"user_id": user.id, "count": count})
+        await db.execute(text(
+            "INSERT INTO order_items (order_id, product_id, quantity, price, total_price) "
+            "SELECT orders.id, 1 + (orders.id * 7 + k) % :products, 1 + k % 3, 250, 250 * (1 + k % 3) "
+            "FROM orders, generate_series(1, 1 + orders.id % 4) AS k"
+        ), {"products": PRODUCTS})
+        await db.commit()
+
+
+SQL_SLICE = text(
+    "SELECT extract(isodow FROM orders.created_at AT TIME ZONE :timezone) - 1 AS weekday, "
+    "extract(hour FROM orders.created_at AT TIME ZONE :timezone) AS hour, "
+    "orders.order_type, orders.payment_method, products.category_id, "
+    "sum(order_items.total_price) AS revenue, sum(order_items.quantity) AS quantity, "
+    "count(DISTINCT orders.id) AS orders "
+    "FROM order_items JOIN orders ON orders.id = order_items.order_id "
+    "JOIN products ON products.id = order_items.product_id "
+    "WHERE orders.status NOT IN ('CANCELLED', 'REFUNDED') "
+    "GROUP BY 1, 2, 3, 4, 5"
+)
+
+
+def _timed(function, repeats=REPEATS):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return result, statistics.median(timings)
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_engine_against_sql(pg_engine, report):
+    sessions = session_factory(pg_engine)
+    await _generate_orders(sessions, BENCHMARK_ORDERS)
+
+    engine = AnalyticsEngine(sync_interval=0)
+    async with sessions() as db:
+        started = time.perf_counter()
+        await engine.sync(db, force=True)
+        load = time.perf_counter() - started
+    report("loaded %d orders and %d items in %.1f s", engine.orders.size, engine.items.size, load)
+
+    rows, engine_time = _timed(lambda: engine.group_by(SLICE))
+
+    sql_timings = []
+    async with sessions() as db:
+        for _ in range(REPEATS):
+            started = time.perf_counter()
+            sql_rows = (await db.execute(SQL_SLICE, {"timezone": settings.RESTAURANT_TIMEZONE})).all()
+            sql_timings.append(time.perf_counter() - started)
+    sql_time = statistics.median(sql_timings)
+    report(
+        "%s over %d items: engine %.0f ms, SQL %.0f ms (%.0fx)",
+        " x ".join(SLICE), engine.items.size, engine_time * 1000, sql_time * 1000, sql_time / engine_time,
+    )
+
+    _, filtered_time = _timed(lambda: engine.group_by(("hour",), order_type=["delivery"], payment_method=["cash"]))
+    report("filtered slice by hour: engine %.0f ms", filtered_time * 1000)
+
+    assert len(rows) == len(sql_rows)
+    assert round(sum(row["revenue"] for row in rows)) == round(float(sum(row.revenue for row in sql_rows)))
+
+    async with sessions() as db:
+        await db.execute(text(
+            "INSERT INTO orders (user_id, order_number, status, order_type, payment_method, total_amount, final_amount) "
+            "SELECT user_id, 'N-' || n, 'PENDING', 'pickup', 'cash', 500, 500 "
+            "FROM (SELECT min(id) AS user_id FROM users) AS u, generate_series(1, 1000) AS n"
+        ))
+        await db.commit()
+        started = time.perf_counter()
+        await engine.sync(db, force=True)
+        report("incremental sync of 1000 new orders: %.0f ms", (time.perf_counter() - started) * 1000)
+    assert engine.orders.size == BENCHMARK_ORDERS + 1000
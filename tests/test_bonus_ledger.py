@@ -0,0 +1,104 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+
+from backend import models
+from backend.utils import bonus_ledger
+
+from .database import session_factory
+
+SPENDERS = 300
+
+
+async def _create_user(sessions, balance) -> int:
+    async with sessions() as db:
+        user = models.User(telegram_id="1", bonus_balance=Decimal(balance))
+        db.add(user)
+        await db.commit()
+        return user.id
+
+
+async def _spend(sessions, user_id: int, amount) -> bool:
+    async with sessions() as db:
+        try:
+            await bonus_ledger.spend(db, user_id, amount)
+        except bonus_ledger.InsufficientBonusError:
+            await db.rollback()
+            return False
+        await db.commit()
+        return True
+
+
+async def _earn(sessions, user_id: int, amount):
+    async with sessions() as db:
+        await bonus_ledger.earn(db, user_id, amount)
+        await db.commit()
+
+
+async def _ledger(sessions, user_id: int):
+    async with sessions() as db:
+        balance = (await db.execute(
+            select(models.User.bonus_balance).where(models.User.id == user_id)
+        )).scalar_one()
+        rows = (await db.execute(
+            select(models.BonusTransaction).where(models.BonusTransaction.user_id == user_id)
+        )).scalars().all()
+    return balance, rows
+
+
+@pytest.mark.asyncio
+async def test_concurrent_spends_never_overdraw(pg_engine):
+    sessions = session_factory(pg_engine)
+    user_id = await _create_user(sessions, "1000.00")
+
+    results = await asyncio.gather(*[_spend(sessions, user_id, "5.00") for _ in range(SPENDERS)])
+
+    balance, rows = await _ledger(sessions, user_id)
+    assert sum(results) == 200  # 1000 / 5, the other 100 are refused
+    assert balance == Decimal("0.00")
+    assert len(rows) == 200
+    assert min(row.balance_after for row in rows) >= 0
+    # Every spend saw the balance the previous one left: no lost updates
+    assert sorted(row.balance_before for row in rows) == [Decimal(5 * i) for i in range(1, 201)]
+    assert all(row.balance_before - row.balance_after == Decimal("5.00") for row in rows)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_earns_and_spends_add_up(pg_engine):
+    sessions = session_factory(pg_engine)
+    user_id = await _create_user(sessions, "0.00")
+
+    spends = [_spend(sessions, user_id, "2.00") for _ in range(SPENDERS)]
+    earns = [_earn(sessions, user_id, "3.00") for _ in range(SPENDERS)]
+    results = await asyncio.gather(*spends, *earns)
+
+    spent = sum(result is True for result in results[:SPENDERS])
+    balance, rows = await _ledger(sessions, user_id)
+    assert balance == Decimal(3 * SPENDERS - 2 * spent)
+    assert balance >= 0
+    assert len(rows) == SPENDERS + spent
+    assert min(row.balance_after for row in rows) >= 0
+    assert sum(row.amount for row in rows) == balance
+
+
+@pytest.mark.asyncio
+async def test_accrue_many_credits_repeated_users(pg_engine):
+    sessions = session_factory(pg_engine)
+    async with sessions() as db:
+        users = [models.User(telegram_id=str(i), bonus_balance=Decimal("0")) for i in range(3)]
+        db.add_all(users)
+        await db.commit()
+        user_ids = [user.id for user in users]
+
+    accruals = [bonus_ledger.Accrual(user_id, Decimal("10")) for user_id in user_ids]
+    accruals.append(bonus_ledger.Accrual(user_ids[0], Decimal("2.50")))
+    async with sessions() as db:
+        balances = await bonus_ledger.accrue_many(db, accruals)
+        await db.commit()
+
+    assert balances == {user_ids[0]: Decimal("12.50"), user_ids[1]: Decimal("10.00"), user_ids[2]: Decimal("10.00")}
+    async with sessions() as db:
+        count = (await db.execute(select(func.count()).select_from(models.BonusTransaction))).scalar_one()
+    assert count == 4
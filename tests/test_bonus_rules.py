@@ -0,0 +1,159 @@
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import pytz
+from sqlalchemy import func, select, text
+
+from backend import models
+from backend.config import settings
+from backend.models.order import OrderStatus
+from backend.utils import bonus_ledger
+from backend.utils.bonus_rules import BonusRules, bonus_rules, reaccrue
+
+from .database import session_factory
+
+BENCHMARK_ORDERS = 1_000_000
+BENCHMARK_USERS = 100_000
+
+
+def _program(id, type, value, min_order_amount=None, max_bonus_amount=None):
+    return SimpleNamespace(
+        id=id, type=type, value=Decimal(value), min_order_amount=min_order_amount, max_bonus_amount=max_bonus_amount,
+    )
+
+
+PROGRAMS = [
+    _program(1, "registration", "100"),
+    _program(2, "order_percent", "5", max_bonus_amount=Decimal("200")),
+    _program(3, "fixed_amount", "50", min_order_amount=Decimal("1500")),
+    _program(4, "referral", "300"),
+    _program(5, "order_percent", "1.5", min_order_amount=Decimal("1000")),
+]
+
+
+def _expected(program, amount: float) -> float:
+    # Row-by-row reading of the program rules
+    if amount < float(program.min_order_amount or 0):
+        return 0.0
+    bonus = amount * float(program.value) / 100 if program.type == "order_percent" else float(program.value)
+    if program.max_bonus_amount is not None:
+        bonus = min(bonus, float(program.max_bonus_amount))
+    return round(bonus, 2)
+
+
+def test_batch_evaluation_matches_the_rules():
+    rules = BonusRules.compile(PROGRAMS)
+    assert rules.program_ids.tolist() == [2, 3, 5]
+    assert rules.registration == [(1, 100.0)]
+    assert rules.referral == [(4, 300.0)]
+
+    amounts = [0, 999.99, 1000, 1499.99, 1500, 3999, 4000, 4000.01, 12345.67]
+    order_programs = [program for program in PROGRAMS if program.id in (2, 3, 5)]
+    expected = [[_expected(program, amount) for program in order_programs] for amount in amounts]
+    assert rules.evaluate_many(amounts).tolist() == expected
+    assert rules.evaluate(1200) == [(2, 60.0), (5, 18.0)]
+    assert rules.evaluate(0) == []
+
+
+async def _create_programs(db):
+    for program in PROGRAMS:
+        db.add(models.BonusProgram(
+            id=program.id, name=f"Program {program.id}", type=program.type, value=program.value,
+            min_order_amount=program.min_order_amount, max_bonus_amount=program.max_bonus_amount, is_active=True,
+        ))
+    await db.flush()
+    bonus_rules.invalidate()
+
+
+@pytest.mark.asyncio
+async def test_reaccrual_only_credits_what_is_missing(pg_engine):
+    sessions = session_factory(pg_engine)
+    timezone = pytz.timezone(settings.RESTAURANT_TIMEZONE)
+    async with sessions() as db:
+        await _create_programs(db)
+        user = models.User(telegram_id="1", bonus_balance=Decimal("0"))
+        db.add(user)
+        await db.flush()
+        orders = []
+        for number, (amount, status, day) in enumerate([
+            (1200, OrderStatus.DELIVERED, 1), (2000, OrderStatus.DELIVERED, 1), (800, OrderStatus.DELIVERED, 2),
+            (5000, OrderStatus.CANCELLED, 1), (5000, OrderStatus.DELIVERED, 3),  # Outside the range
+        ]):
+            order = models.Order(
+                user_id=user.id, order_number=f"T-{number}", status=status, order_type="pickup",
+                total_amount=Decimal(amount), bonus_used=Decimal("0"), final_amount=Decimal(amount),
+                payment_method="cash", created_at=timezone.localize(datetime(2024, 5, day, 12)),
+            )
+            db.add(order)
+            orders.append(order)
+        await db.flush()
+        # The 5% bonus of the first order was already credited
+        await bonus_ledger.earn(db, user.id, Decimal("60"), program_id=2, order_id=orders[0].id)
+        await db.commit()
+
+    async with sessions() as db:
+        assert await reaccrue(db, date(2024, 5, 1), date(2024, 5, 3)) == 5
+    async with sessions() as db:
+        assert await reaccrue(db, date(2024, 5, 1), date(2024, 5, 3)) == 0
+        balance = (await db.execute(select(models.User.bonus_balance))).scalar_one()
+        credited = dict((await db.execute(
+            select(models.BonusTransaction.order_id, func.sum(models.BonusTransaction.amount))
+            .group_by(models.BonusTransaction.order_id)
+        )).all())
+    # 60 + 18 for 1200, 100 + 50 + 30 for 2000, 40 for 800
+    assert credited == {orders[0].id: Decimal("78.00"), orders[1].id: Decimal("180.00"), orders[2].id: Decimal("40.00")}
+    assert balance == Decimal("298.00")
+
+
+@pytest.mark.benchmark
+def test_evaluation_speed(report):
+    rules = BonusRules.compile(PROGRAMS)
+    amounts = np.random.default_rng(0).uniform(300, 6000, BENCHMARK_ORDERS).round(2)
+
+    started = time.perf_counter()
+    rules.evaluate_many(amounts)
+    vectorized = time.perf_counter() - started
+
+    sample = amounts[:10_000].tolist()
+    started = time.perf_counter()
+    for amount in sample:
+        rules.evaluate(amount)
+    per_order = (time.perf_counter() - started) / len(sample)
+
+    report(
+        "%d orders x %d programs: batch %.0f ms, one by one %.1f us per order (%.0f s for all)",
+        BENCHMARK_ORDERS, len(rules.program_ids), vectorized * 1000, per_order * 1e6, per_order * BENCHMARK_ORDERS,
+    )
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_reaccrual_speed(pg_engine, report):
+    sessions = session_factory(pg_engine)
+    async with sessions() as db:
+        await _create_programs(db)
+        await db.execute(text(
+            "INSERT INTO users (telegram_id, bonus_balance) SELECT n::text, 0 FROM generate_series(1, :users) AS n"
+        ), {"users": BENCHMARK_USERS})
+        await db.execute(text(
+            "INSERT INTO orders (user_id, order_number, status, order_type, total_amount, bonus_used, "
+            "final_amount, payment_method, created_at) "
+            "SELECT 1 + n % :users, 'B-' || n, 'DELIVERED', 'pickup', 300 + n % 5700, 0, 300 + n % 5700, 'cash', "
+            "timestamptz '2024-05-01 12:00+03' + (n % 30) * interval '1 day' FROM generate_series(1, :orders) AS n"
+        ), {"users": BENCHMARK_USERS, "orders": BENCHMARK_ORDERS})
+        await db.commit()
+
+    async with sessions() as db:
+        started = time.perf_counter()
+        count = await reaccrue(db, date(2024, 5, 1), date(2024, 6, 1))
+        elapsed = time.perf_counter() - started
+    report("re-accrual of %d orders: %d accruals in %.1f s", BENCHMARK_ORDERS, count, elapsed)
+
+    async with sessions() as db:
+        started = time.perf_counter()
+        assert await reaccrue(db, date(2024, 5, 1), date(2024, 6, 1)) == 0
+        report("re-run with nothing missing: %.1f s", time.perf_counter() - started)
@@ -0,0 +1,78 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+
+from backend import models
+from backend.utils import broadcast as broadcast_module
+from backend.utils.broadcast import broadcasts, queue_next_chunk
+
+from .database import session_factory
+
+RECIPIENTS = 12
+CHUNK_SIZE = 5
+
+
+@pytest.fixture
+def sessions(pg_engine, monkeypatch):
+    sessions = session_factory(pg_engine)
+    monkeypatch.setattr(broadcast_module, "AsyncSessionLocal", sessions)
+    monkeypatch.setattr(broadcast_module, "BROADCAST_CHUNK_SIZE", CHUNK_SIZE)
+    return sessions
+
+
+async def _create_broadcast(sessions) -> int:
+    async with sessions() as db:
+        template = models.NotificationTemplate(
+            name="promo", message="Hi {first_name}", type="promotional", channel="telegram",
+        )
+        db.add(template)
+        db.add_all([
+            models.User(telegram_id=str(n), first_name=f"Guest {n}", bonus_balance=Decimal("0"), is_active=True, is_blocked=False)
+            for n in range(RECIPIENTS)
+        ])
+        await db.flush()
+        broadcast = models.Broadcast(template_id=template.id, status="running", queued_count=0, last_user_id=0)
+        db.add(broadcast)
+        await db.commit()
+        return broadcast.id
+
+
+async def _notification_statuses(sessions, broadcast_id: int) -> dict:
+    async with sessions() as db:
+        return dict((await db.execute(
+            select(models.Notification.status, func.count())
+            .where(models.Notification.broadcast_id == broadcast_id)
+            .group_by(models.Notification.status)
+        )).all())
+
+
+@pytest.mark.asyncio
+async def test_pause_stops_a_running_broadcast_and_resume_finishes_it(sessions):
+    broadcast_id = await _create_broadcast(sessions)
+
+    # The runner holds the broadcast in its session, as run_broadcast does
+    async with sessions() as runner:
+        loaded = await runner.get(models.Broadcast, broadcast_id)
+        template = await runner.get(models.NotificationTemplate, loaded.template_id)
+        assert await queue_next_chunk(runner, broadcast_id, template)
+
+        async with sessions() as db:
+            assert await broadcasts.pause(db, await db.get(models.Broadcast, broadcast_id))
+
+        assert not await queue_next_chunk(runner, broadcast_id, template)
+
+    assert await _notification_statuses(sessions, broadcast_id) == {"paused": CHUNK_SIZE}
+    async with sessions() as db:
+        broadcast = await db.get(models.Broadcast, broadcast_id)
+        assert (broadcast.status, broadcast.queued_count) == ("paused", CHUNK_SIZE)
+        assert not await broadcasts.pause(db, broadcast)  # Only running broadcasts pause
+        await db.refresh(broadcast)
+        await broadcasts.resume(db, broadcast)
+    await broadcasts.tasks[broadcast_id]
+
+    assert await _notification_statuses(sessions, broadcast_id) == {"pending": RECIPIENTS}
+    async with sessions() as db:
+        broadcast = await db.get(models.Broadcast, broadcast_id)
+        assert (broadcast.status, broadcast.queued_count) == ("completed", RECIPIENTS)
+        assert broadcast.total_recipients == RECIPIENTS
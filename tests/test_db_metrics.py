@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from backend.utils import db_metrics
+from backend.utils.db_metrics import Histogram, QueryMetrics, instrument, request_db_stats
+
+
+def test_histogram_buckets_are_upper_bounds():
+    histogram = Histogram(buckets=(0.1, 0.5, 1.0))
+    for value in (0.05, 0.1, 0.2, 0.5, 0.7, 3.0, 3.0):
+        histogram.observe(value)
+
+    # A value on a bound counts in that bucket (Prometheus `le`)
+    assert histogram.counts == [2, 2, 1, 2]
+    assert histogram.cumulative() == [2, 4, 5, 7]
+    assert histogram.snapshot() == {
+        "count": 7,
+        "sum": 7.55,
+        "buckets": {"0.1": 2, "0.5": 4, "1.0": 5, "+Inf": 7},
+    }
+
+
+def test_empty_histogram():
+    histogram = Histogram()
+    assert histogram.cumulative() == [0] * (len(db_metrics.LATENCY_BUCKETS) + 1)
+    assert histogram.snapshot()["count"] == 0
+
+
+def test_only_slow_queries_are_logged():
+    metrics = QueryMetrics(slow_threshold=0.1)
+    metrics.record("SELECT 1", 0.01)
+    metrics.record("SELECT " + "x" * 1000, 0.1)
+    metrics.record("SELECT 3", 0.25)
+
+    assert (metrics.duration.count, metrics.slow_count) == (3, 2)
+    assert [(len(query["statement"]), query["duration_ms"]) for query in metrics.slow_queries] == [
+        (db_metrics.SLOW_QUERY_TEXT_LENGTH, 100.0), (8, 250.0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_queries_count_towards_the_current_request(sqlite_engine, monkeypatch):
+    metrics = QueryMetrics(slow_threshold=60)
+    monkeypatch.setattr(db_metrics, "query_metrics", metrics)
+    instrument(sqlite_engine)
+
+    stats = SimpleNamespace(queries=0, db_time=0.0)
+    token = request_db_stats.set(stats)
+    try:
+        async with sqlite_engine.connect() as connection:
+            for _ in range(3):
+                await connection.execute(text("SELECT 1"))
+            with pytest.raises(OperationalError):
+                await connection.execute(text("SELECT * FROM no_such_table"))
+    finally:
+        request_db_stats.reset(token)
+    async with sqlite_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))  # Outside any request
+
+    assert stats.queries == 3
+    assert 0 < stats.db_time < 60
+    assert metrics.duration.count == 4
@@ -0,0 +1,165 @@
+import json
+import math
+import random
+from datetime import datetime
+
+import httpx
+import numpy as np
+import pytest
+from fastapi import FastAPI
+
+from backend import schemas
+from backend.api.routers import delivery
+from backend.database import get_db
+from backend.schemas.delivery import MAX_QUOTE_POINTS
+from backend.utils.access import Caller, require_staff
+from backend.utils.delivery_zones import DeliveryZoneIndex
+
+from .database import session_factory
+
+POINTS = 20000
+CREATED = datetime(2024, 5, 17)
+
+
+def _zones(count: int, seed: int = 0):
+    generator = random.Random(seed)
+    zones = []
+    for zone_id in range(1, count + 1):
+        lat, lon = generator.uniform(55.5, 56.0), generator.uniform(37.3, 37.9)
+        size = generator.choice((0.01, 0.05, 0.2))
+        costs = [
+            schemas.DeliveryCost(
+                id=zone_id * 10 + n, zone_id=zone_id, min_order_amount=minimum, cost=generator.choice((0, 99, 150, 300)),
+                is_free=generator.random() < 0.1, is_flat_rate=generator.random() < 0.5, created_at=CREATED,
+            )
+            for n, minimum in enumerate(sorted(generator.sample((0, 500, 800, 1000, 2000), generator.randint(0, 3))))
+        ]
+        zones.append(schemas.DeliveryZone(
+            id=zone_id, name=f"Zone {zone_id}", min_lat=lat, max_lat=lat + size, min_lon=lon, max_lon=lon + size,
+            costs=costs, created_at=CREATED,
+        ))
+    return zones
+
+
+def _nan_to_none(value: float):
+    return None if math.isnan(value) else value
+
+
+@pytest.mark.parametrize("zone_count", [0, 40])
+def test_quote_many_matches_quote(zone_count):
+    index = DeliveryZoneIndex(_zones(zone_count))
+    generator = np.random.default_rng(1)
+    lat = generator.uniform(55.4, 56.3, POINTS)
+    lon = generator.uniform(37.2, 38.2, POINTS)
+    order_amount = generator.choice([0, 499.99, 500, 999, 1000, 1499.99, 1500, 2500], POINTS)
+    # Points on zone edges too, where the bounds are inclusive
+    zones = index.zones
+    for i, zone in enumerate(zones):
+        lat[i], lon[i] = zone.max_lat, zone.min_lon
+
+    quotes = index.quote_many(lat, lon, order_amount)
+    for i in range(POINTS):
+        quote = index.quote(float(lat[i]), float(lon[i]), float(order_amount[i]))
+        assert (
+            bool(quotes.is_available[i]),
+            None if quotes.zone_id[i] < 0 else int(quotes.zone_id[i]),
+            float(quotes.distance_km[i]),
+            _nan_to_none(float(quotes.delivery_cost[i])),
+            _nan_to_none(float(quotes.min_order_amount[i])),
+        ) == (quote.is_available, quote.zone_id, quote.distance_km, quote.delivery_cost, quote.min_order_amount), i
+
+
+def test_oversized_zones_stay_out_of_the_grid():
+    zones = _zones(40)
+    zones.append(schemas.DeliveryZone(  # The whole region: ~10^5 cells at this cell size
+        id=100, name="Region", min_lat=50, max_lat=60, min_lon=30, max_lon=45, created_at=CREATED,
+    ))
+    zones.append(schemas.DeliveryZone(  # Thin strip across the city: many cells, smaller than most zones
+        id=101, name="Highway", min_lat=55.75, max_lat=55.751, min_lon=20, max_lon=50, created_at=CREATED,
+    ))
+    index = DeliveryZoneIndex(zones)
+    assert [zone.id for zone in index.wide_zones] == [101, 100]
+    assert sum(len(cell) for cell in index.cells.values()) <= 40 * DeliveryZoneIndex.MAX_CELLS_PER_ZONE
+
+    generator = np.random.default_rng(2)
+    lat = generator.uniform(55.4, 56.3, POINTS)
+    lon = generator.uniform(37.2, 38.2, POINTS)
+    lat[:100] = generator.uniform(55.75, 55.751, 100)  # On the strip, often inside a city zone too
+    quotes = index.quote_many(lat, lon, np.zeros(POINTS))
+    for i in range(POINTS):
+        # Smallest zone containing the point, by brute force
+        expected = next((
+            zone.id for zone in index.zones
+            if zone.min_lat <= lat[i] <= zone.max_lat and zone.min_lon <= lon[i] <= zone.max_lon
+        ), None)
+        assert getattr(index.locate(float(lat[i]), float(lon[i])), "id", None) == expected, i
+        assert int(quotes.zone_id[i]) == expected, i
+
+
+@pytest.fixture
+def client():
+    async def no_db():
+        yield None
+
+    app = FastAPI()
+    app.include_router(delivery.router, prefix="/api/v1")
+    app.dependency_overrides[get_db] = no_db
+    app.dependency_overrides[require_staff] = lambda: Caller(is_staff=True)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("body,error", [
+    ({"lat": [55.7] * (MAX_QUOTE_POINTS + 1), "lon": [37.6] * (MAX_QUOTE_POINTS + 1)}, "too_long"),
+    ({"lat": [55.7, float("nan")], "lon": [37.6, 37.6]}, "finite_number"),
+    ({"lat": [55.7], "lon": [float("inf")]}, "finite_number"),
+    ({"lat": [55.7], "lon": [37.6], "order_amount": [float("-inf")]}, "finite_number"),
+])
+async def test_batch_quote_rejects_oversized_or_non_finite_input(client, body, error):
+    async with client:
+        response = await client.post(
+            "/api/v1/delivery/calculate/batch/", content=json.dumps(body), headers={"Content-Type": "application/json"},
+        )
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["type"] == error
+
+
+ZONE = {"name": "Center", "min_lat": 55.7, "max_lat": 55.8, "min_lon": 37.5, "max_lon": 37.7}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("method,path,body,error", [
+    ("POST", "/delivery/zones/", {**ZONE, "min_lat": 55.9}, "min_lat must not be greater than max_lat"),
+    ("POST", "/delivery/zones/", {**ZONE, "max_lon": 37.4}, "min_lon must not be greater than max_lon"),
+    ("POST", "/delivery/zones/", {**ZONE, "max_lat": 91}, "less than or equal to 90"),
+    ("POST", "/delivery/zones/", {**ZONE, "min_lon": float("-inf")}, "greater than or equal to -180"),
+    ("PUT", "/delivery/zones/1", {"min_lat": 56, "max_lat": 55}, "min_lat must not be greater than max_lat"),
+])
+async def test_zone_bounds_are_validated(client, method, path, body, error):
+    async with client:
+        response = await client.request(
+            method, f"/api/v1{path}", content=json.dumps(body), headers={"Content-Type": "application/json"},
+        )
+    assert response.status_code == 422
+    assert error in response.json()["detail"][0]["msg"]
+
+
+@pytest.mark.asyncio
+async def test_single_bound_update_is_checked_against_the_stored_one(pg_engine):
+    sessions = session_factory(pg_engine)
+
+    async def get_test_db():
+        async with sessions() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(delivery.router, prefix="/api/v1")
+    app.dependency_overrides[get_db] = get_test_db
+    app.dependency_overrides[require_staff] = lambda: Caller(is_staff=True)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        zone_id = (await client.post("/api/v1/delivery/zones/", json=ZONE)).json()["id"]
+        too_far = await client.put(f"/api/v1/delivery/zones/{zone_id}", json={"min_lat": 55.9})
+        moved = await client.put(f"/api/v1/delivery/zones/{zone_id}", json={"min_lat": 55.75})
+
+    assert (too_far.status_code, too_far.json()) == (400, {"detail": "min_lat must not be greater than max_lat"})
+    assert (moved.status_code, moved.json()["min_lat"]) == (200, 55.75)
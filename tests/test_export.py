@@ -0,0 +1,118 @@
+import csv
+import io
+import json
+import resource
+import time
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+from backend import models
+from backend.utils import export
+
+from .database import session_factory
+
+BENCHMARK_ORDERS = 1_000_000
+ITEMS_PER_ORDER = 2
+EARLY_CHUNKS = 50
+
+
+def _max_rss() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # kB on Linux
+
+
+async def _drain(rows) -> str:
+    return "".join([chunk async for chunk in rows])
+
+
+@pytest.mark.asyncio
+async def test_orders_stay_whole_across_batches(sqlite_engine, monkeypatch):
+    # Small batches, so orders are split between them
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 3)
+    sessions = session_factory(sqlite_engine)
+    item_counts = [0, 1, 2, 5, 3, 0, 4]
+    async with sessions() as db:
+        user = models.User(telegram_id="1", bonus_balance=Decimal("0"))
+        category = models.Category(name="Pizza")
+        db.add_all([user, category])
+        await db.flush()
+        product = models.Product(category_id=category.id, name="Pizza", price=Decimal("10"))
+        db.add(product)
+        await db.flush()
+        for i, count in enumerate(item_counts):
+            order = models.Order(
+                user_id=user.id, order_number=f"T-{i}", order_type="pickup", total_amount=Decimal(10 * count),
+                final_amount=Decimal(10 * count), payment_method="cash",
+            )
+            db.add(order)
+            await db.flush()
+            db.add_all([
+                models.OrderItem(order_id=order.id, product_id=product.id, quantity=n + 1,
+                                 price=Decimal("10"), total_price=Decimal(10 * (n + 1)))
+                for n in range(count)
+            ])
+        await db.commit()
+
+    async with sessions() as db:
+        lines = (await _drain(export.export_orders_ndjson(db))).splitlines()
+    orders = [json.loads(line) for line in lines]
+    assert [order["order_number"] for order in orders] == [f"T-{i}" for i in range(len(item_counts))]
+    assert [len(order["items"]) for order in orders] == item_counts
+    assert [item["quantity"] for item in orders[3]["items"]] == [1, 2, 3, 4, 5]
+
+    async with sessions() as db:
+        rows = list(csv.reader(io.StringIO(await _drain(export.export_orders_csv(db)))))
+    assert rows[0] == export.ORDER_COLUMNS + [f"item_{name}" for name in export.ORDER_ITEM_COLUMNS]
+    # Orders without items still get one row, with empty item columns
+    assert len(rows) - 1 == sum(max(count, 1) for count in item_counts)
+
+
+async def _generate_orders(sessions, count: int):
+    async with sessions() as db:
+        user = models.User(telegram_id="1", bonus_balance=Decimal("0"))
+        category = models.Category(name="Pizza")
+        db.add_all([user, category])
+        await db.flush()
+        product = models.Product(category_id=category.id, name="Pizza", price=Decimal("250"))
+        db.add(product)
+        await db.flush()
+        await db.execute(text(
+            "INSERT INTO orders (user_id, order_number, status, order_type, total_amount, final_amount, "
+            "payment_method, payment_status, customer_phone, created_at) "
+            "SELECT :user_id, 'B-' || n, 'DELIVERED', 'delivery', 500, 500, 'yookassa', 'paid', "
+            "'+7900' || n, now() - n * interval '1 minute' FROM generate_series(1, :count) AS n"
+        ), {"user_id": user.id, "count": count})
+        await db.execute(text(
+            "INSERT INTO order_items (order_id, product_id, quantity, price, total_price) "
+            "SELECT orders.id, :product_id, 1, 250, 250 FROM orders, generate_series(1, :items)"
+        ), {"product_id": product.id, "items": ITEMS_PER_ORDER})
+        await db.commit()
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_export_throughput(pg_engine, report):
+    sessions = session_factory(pg_engine)
+    started = time.perf_counter()
+    await _generate_orders(sessions, BENCHMARK_ORDERS)
+    report("generated %d orders in %.1f s", BENCHMARK_ORDERS, time.perf_counter() - started)
+
+    for format, stream in (("ndjson", export.export_orders_ndjson), ("csv", export.export_orders_csv)):
+        size = chunks = 0
+        async with sessions() as db:
+            started = time.perf_counter()
+            async for chunk in stream(db):
+                size += len(chunk)
+                chunks += 1
+                if chunks == EARLY_CHUNKS:
+                    early_rss = _max_rss()
+            elapsed = time.perf_counter() - started
+        rss = _max_rss()
+        report(
+            "%s: %.0f orders/s, %.1f MB/s (%.0f MB total), max RSS %.0f MB after %d chunks, %.0f MB after %d",
+            format, BENCHMARK_ORDERS / elapsed, size / elapsed / 1e6, size / 1e6,
+            early_rss / 1e6, EARLY_CHUNKS, rss / 1e6, chunks,
+        )
+        # Memory must not grow with the number of rows sent
+        assert rss - early_rss < 20e6
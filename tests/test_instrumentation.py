@@ -0,0 +1,174 @@
+import asyncio
+import re
+import time
+from typing import List
+
+import httpx
+import pytest
+from fastapi import APIRouter, Depends, FastAPI
+from pydantic import BaseModel, field_validator
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from backend.utils import db_metrics, instrumentation
+from backend.utils.db_metrics import Histogram, PoolMetrics, QueryMetrics, instrument
+from backend.utils.instrumentation import (
+    InstrumentationMiddleware, InstrumentedRoute, RequestMetrics, RequestStats, SlowRequestProfiler,
+    render_prometheus,
+)
+
+SERIALIZATION_DELAY = 0.05
+SLOW_REQUEST = 0.4
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    """Fresh metrics for the test instead of the process-wide ones."""
+    request_metrics, query_metrics, pool_metrics = RequestMetrics(), QueryMetrics(slow_threshold=0.1), PoolMetrics()
+    monkeypatch.setattr(instrumentation, "request_metrics", request_metrics)
+    monkeypatch.setattr(instrumentation, "query_metrics", query_metrics)
+    monkeypatch.setattr(instrumentation, "pool_metrics", pool_metrics)
+    monkeypatch.setattr(db_metrics, "query_metrics", query_metrics)
+    return request_metrics, query_metrics, pool_metrics
+
+
+def test_prometheus_output(metrics):
+    request_metrics, query_metrics, pool_metrics = metrics
+    stats = RequestStats()
+    stats.queries, stats.db_time, stats.serialization_time = 2, 0.003, 0.0005
+    request_metrics.record("GET", '/items/"{name}"\\raw\nline', 200, 0.02, stats)
+    query_metrics.record("SELECT 1", 0.2)
+    pool_metrics.checkout_timeouts = 3
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=AsyncAdaptedQueuePool, pool_size=4)
+
+    lines = render_prometheus({'primary "a"': engine}).splitlines()
+
+    labels = 'method="GET",route="/items/\\"{name}\\"\\\\raw\\nline"'
+    assert "# TYPE http_request_duration_seconds histogram" in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},status="200",le="0.025"}} 1' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},status="200",le="0.01"}} 0' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},status="200",le="+Inf"}} 1' in lines
+    assert f"http_request_duration_seconds_count{{{labels},status=\"200\"}} 1" in lines
+    assert f'http_request_db_queries_bucket{{{labels},le="1"}} 0' in lines
+    assert f'http_request_db_queries_bucket{{{labels},le="2"}} 1' in lines
+    assert f"http_request_db_queries_sum{{{labels}}} 2.0" in lines
+    assert 'db_query_duration_seconds_bucket{le="0.1"} 0' in lines
+    assert 'db_query_duration_seconds_bucket{le="0.25"} 1' in lines
+    assert "db_slow_queries_total 1" in lines
+    assert "db_pool_checkout_timeouts_total 3" in lines
+    assert 'db_pool_size{pool="primary \\"a\\""} 4' in lines
+    assert 'db_pool_in_use{pool="primary \\"a\\""} 0' in lines
+    # Every sample line is one line: the newline in the label didn't break it
+    assert all(line.startswith(("#", "http_", "db_")) for line in lines)
+
+
+class Item(BaseModel):
+    name: str
+
+    @field_validator("name")
+    @classmethod
+    def slow(cls, name):
+        time.sleep(SERIALIZATION_DELAY / 10)
+        return name
+
+
+def _app(engine, profiler=None) -> FastAPI:
+    router = APIRouter(route_class=InstrumentedRoute)
+
+    async def connection():
+        async with engine.connect() as connection:
+            yield connection
+
+    @router.get("/items/{count}", response_model=List[Item])
+    async def items(count: int, connection=Depends(connection)):
+        for _ in range(count):
+            await connection.execute(text("SELECT 1"))
+        return [{"name": f"item {n}"} for n in range(10)]
+
+    @router.get("/slow/")
+    async def slow():
+        busy_until = time.perf_counter() + SLOW_REQUEST
+        while time.perf_counter() < busy_until:
+            _spin()
+        await asyncio.sleep(0)
+        return {}
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api/v1")
+    app.add_middleware(InstrumentationMiddleware, profiler=profiler)
+    return app
+
+
+def _spin():
+    sum(range(1000))
+
+
+@pytest.mark.asyncio
+async def test_requests_are_recorded_per_route(sqlite_engine, metrics):
+    request_metrics, _, _ = metrics
+    instrument(sqlite_engine)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=_app(sqlite_engine)), base_url="http://test") as client:
+        for count in (0, 3, 3):
+            assert (await client.get(f"/api/v1/items/{count}")).status_code == 200
+        assert (await client.get("/api/v1/nowhere")).status_code == 404
+
+    route = ("GET", "/api/v1/items/{count}")
+    assert request_metrics.latency[(*route, "200")].count == 3
+    assert request_metrics.latency[("GET", instrumentation.UNMATCHED_ROUTE, "404")].count == 1
+    queries: Histogram = request_metrics.db_queries[route]
+    assert (queries.count, queries.sum) == (3, 6)
+    assert queries.snapshot()["buckets"]["0"] == 1
+    assert request_metrics.db_time[route].sum > 0
+    # The response_model validation after the endpoint returned: 10 items each
+    serialization: Histogram = request_metrics.serialization[route]
+    assert serialization.count == 3
+    assert serialization.sum >= 3 * SERIALIZATION_DELAY
+    assert serialization.sum < request_metrics.latency[(*route, "200")].sum
+
+
+@pytest.mark.asyncio
+async def test_slow_requests_get_a_profile(sqlite_engine, metrics, tmp_path):
+    profiles = tmp_path / "profiles"
+    profiler = SlowRequestProfiler(threshold=SLOW_REQUEST * 0.75, interval=0.001, directory=str(profiles))
+    app = _app(sqlite_engine, profiler)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            assert (await client.get("/api/v1/items/0")).status_code == 200
+            assert not profiles.exists()  # Below the threshold
+            assert (await client.get("/api/v1/slow/")).status_code == 200
+    finally:
+        profiler.stop()
+
+    [profile] = profiles.iterdir()
+    assert re.fullmatch(r"\d+-GET-api_v1_slow-\d+ms\.folded", profile.name)
+    samples = {}
+    for line in profile.read_text().splitlines():
+        stack, _, count = line.rpartition(" ")
+        samples[stack] = int(count)
+    assert sum(samples.values()) > 10
+    # Sampled inside the endpoint: stacks run root first, down to the busy loop
+    assert any(stack.split(";")[-1].startswith("_spin (test_instrumentation.py") for stack in samples)
+    assert profiler._active == {}
+
+
+@pytest.mark.asyncio
+async def test_ended_requests_hand_over_their_samples(tmp_path):
+    profiler = SlowRequestProfiler(threshold=0, interval=0.001, directory=str(tmp_path))
+    stats = RequestStats()
+    try:
+        profiler.begin(stats)
+        busy_until = time.perf_counter() + 0.05
+        while time.perf_counter() < busy_until:
+            _spin()
+        samples = profiler.end()
+        taken = dict(samples)
+        busy_until = time.perf_counter() + 0.05
+        while time.perf_counter() < busy_until:
+            _spin()
+    finally:
+        profiler.stop()
+
+    assert taken and stats.samples is None
+    assert samples == taken  # Nothing was added after end()
+    assert profiler.end() == {}
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import resource
+import statistics
+import time
+
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import text
+
+from backend.api.routers import orders
+from backend.config import settings
+from backend.utils.live_feed import HEARTBEAT, OrderFeed, format_event, order_feed
+
+from .database import TEST_DATABASE_URL
+
+SWARM_CLIENTS = 5000
+SWARM_EVENTS = 20
+STAFF_TOKEN = "staff-token"
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    monkeypatch.setattr(settings, "LIVE_FEED_QUEUE_SIZE", 3)
+    feed = OrderFeed()
+    monkeypatch.setattr(feed, "start", lambda: None)  # No LISTEN connection
+    return feed
+
+
+def _event(order_id: int, user_id: int) -> dict:
+    return {"type": "status_changed", "order_id": order_id, "user_id": user_id, "status": "ready"}
+
+
+def test_events_reach_order_user_and_kitchen_feeds(feed):
+    by_order = feed.subscribe(order_id=1)
+    by_user = feed.subscribe(user_id=7)
+    kitchen = feed.subscribe()
+    other = feed.subscribe(order_id=2)
+
+    feed.dispatch(_event(1, 7))
+
+    message = format_event("status_changed", _event(1, 7))
+    for connection in (by_order, by_user, kitchen):
+        assert connection.queue.get_nowait() == message
+    assert other.queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_slow_client_is_disconnected(feed):
+    connection = feed.subscribe(order_id=1)
+    for _ in range(3):
+        feed.dispatch(_event(1, 7))
+    connection.put(HEARTBEAT)  # A full queue drops heartbeats but keeps the client
+    assert feed.connection_count == 1
+
+    feed.dispatch(_event(1, 7))
+    assert feed.connection_count == 0
+    chunks = [chunk async for chunk in connection.stream()]
+    assert chunks[0].startswith(b"retry: ")
+    assert chunks[1:] == [format_event("status_changed", _event(1, 7))] * 3
+
+
+@pytest.mark.asyncio
+async def test_stream_sends_heartbeats_and_unsubscribes(feed, monkeypatch):
+    monkeypatch.setattr(settings, "LIVE_FEED_HEARTBEAT_SECONDS", 0.01)
+    connection = feed.subscribe(user_id=7)
+    stream = connection.stream(initial=b"event: snapshot\n\n")
+    heartbeat = asyncio.create_task(feed._heartbeat())
+    try:
+        assert (await stream.__anext__()).startswith(b"retry: ")
+        assert await stream.__anext__() == b"event: snapshot\n\n"
+        assert await stream.__anext__() == b": ping\n\n"
+    finally:
+        heartbeat.cancel()
+    await stream.aclose()  # What happens when the client goes away
+    assert feed.connection_count == 0
+
+
+class SwarmClient:
+    """Bare asyncio SSE client, so thousands of them fit in the test process."""
+
+    def __init__(self):
+        self.latencies = []
+        self.first_event = asyncio.Event()
+        self.writer = None
+
+    async def connect(self, port: int, path: str):
+        reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+        self.writer.write(f"GET {path} HTTP/1.1\r\nHost: test\r\nAccept: text/event-stream\r\n\r\n".encode())
+        status = await reader.readline()
+        assert b" 200 " in status, status
+        return reader
+
+    async def listen(self, reader):
+        async for line in reader:
+            if line.startswith(b"data: "):
+                event = json.loads(line[6:])
+                if "sent_at" in event:
+                    self.latencies.append(time.time() - event["sent_at"])
+                self.first_event.set()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def _rss() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # kB on Linux
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_client_swarm(pg_engine, monkeypatch, report):
+    uvicorn = pytest.importorskip("uvicorn")
+    monkeypatch.setattr(settings, "DATABASE_URL", TEST_DATABASE_URL)  # Where the feed LISTENs
+    monkeypatch.setattr(settings, "STAFF_API_TOKEN", STAFF_TOKEN)
+    app = FastAPI()
+    app.include_router(orders.router, prefix="/api/v1")
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, lifespan="off", log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    clients = [SwarmClient() for _ in range(SWARM_CLIENTS)]
+    listeners = []
+    try:
+        rss = _rss()
+        started = time.perf_counter()
+        readers = await asyncio.gather(*[
+            client.connect(port, f"/api/v1/orders/feed/?auth=Bearer%20{STAFF_TOKEN}") for client in clients
+        ])
+        listeners = [asyncio.create_task(client.listen(reader)) for client, reader in zip(clients, readers)]
+        report(
+            "%d kitchen feed clients connected in %.1f s, %.1f kB per connection (client and server side)",
+            SWARM_CLIENTS, time.perf_counter() - started, (_rss() - rss) / SWARM_CLIENTS / 1024,
+        )
+        assert order_feed.connection_count == SWARM_CLIENTS
+
+        async def publish(event: dict):
+            async with pg_engine.begin() as connection:
+                await connection.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": settings.LIVE_FEED_CHANNEL, "payload": json.dumps(event)},
+                )
+
+        # The LISTEN connection opens with the first subscriber: wait until events flow
+        while not clients[0].first_event.is_set():
+            await publish(_event(0, 0))
+            await asyncio.sleep(0.1)
+
+        started = time.perf_counter()
+        for i in range(SWARM_EVENTS):
+            await publish({**_event(i, i), "sent_at": time.time()})
+            await asyncio.sleep(0.05)
+        deadline = time.monotonic() + 60
+        while sum(len(client.latencies) for client in clients) < SWARM_CLIENTS * SWARM_EVENTS:
+            assert time.monotonic() < deadline, "events were lost"
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for client in clients for latency in client.latencies)
+        # Clients share the event loop with the server: the numbers are pessimistic
+        report(
+            "%d events to %d clients: %.0f messages/s, latency p50 %.0f ms, p99 %.0f ms, max %.0f ms",
+            SWARM_EVENTS, SWARM_CLIENTS, len(latencies) / elapsed, statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000, latencies[-1] * 1000,
+        )
+    finally:
+        for client in clients:
+            client.close()
+        for listener in listeners:
+            listener.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+        server.should_exit = True
+        await serving
+        await order_feed.stop()
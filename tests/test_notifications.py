@@ -0,0 +1,249 @@
+import asyncio
+import json
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import select
+
+from backend import models
+from backend.api.routers import notifications as notifications_router
+from backend.config import settings
+from backend.database import get_db
+from backend.utils import notifications
+from backend.utils.access import Caller, require_staff
+from backend.utils.notifications import NotificationDispatcher, Outgoing
+
+from .database import session_factory
+
+BLOCKED_CHAT = "blocked"
+FLAKY_CHAT = "flaky"
+BENCHMARK_NOTIFICATIONS = 5000
+
+
+class FakeBotApi:
+    """Local stand-in for the Telegram Bot API's sendMessage."""
+
+    def __init__(self, flood_every: int = 0):
+        self.flood_every = flood_every
+        self.requests = 0
+        self.delivered = defaultdict(list)  # chat_id -> delivery times
+        self.failed = set()
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        chat_id = json.loads(request.content)["chat_id"]
+        if chat_id == BLOCKED_CHAT:
+            return httpx.Response(403, json={"ok": False, "description": "Forbidden: bot was blocked by the user"})
+        if chat_id == FLAKY_CHAT and chat_id not in self.failed:
+            self.failed.add(chat_id)
+            return httpx.Response(502, json={"ok": False, "description": "Bad Gateway"})
+        if self.flood_every and self.requests % self.flood_every == 0:
+            return httpx.Response(429, json={
+                "ok": False, "description": "Too Many Requests: retry after 0.1", "parameters": {"retry_after": 0.1},
+            })
+        self.delivered[chat_id].append(time.monotonic())
+        return httpx.Response(200, json={"ok": True, "result": {"message_id": self.requests}})
+
+
+def _dispatcher(bot: FakeBotApi) -> NotificationDispatcher:
+    dispatcher = NotificationDispatcher()
+    dispatcher._client = httpx.AsyncClient(base_url="https://bot.test/bot123", transport=httpx.MockTransport(bot.handler))
+    return dispatcher
+
+
+async def _queue(sessions, chat_ids, per_chat: int):
+    async with sessions() as db:
+        template = models.NotificationTemplate(name="order_confirmed", message="-", type="order_status", channel="telegram")
+        users = [models.User(telegram_id=chat_id, bonus_balance=Decimal("0")) for chat_id in chat_ids]
+        db.add_all([template, *users])
+        await db.flush()
+        db.add_all([
+            models.Notification(
+                user_id=user.id, template_id=template.id, title="Order", message=f"Update {n}",
+                channel="telegram", status="pending", attempts=0,
+            )
+            for n in range(per_chat)
+            for user in users
+        ])
+        await db.commit()
+
+
+async def _drain(dispatcher: NotificationDispatcher, sessions, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not await dispatcher.dispatch_batch():
+            async with sessions() as db:
+                waiting = (await db.execute(
+                    select(models.Notification.id).where(models.Notification.status == "pending")
+                )).first()
+            if waiting is None:
+                return
+            await asyncio.sleep(0.02)
+    pytest.fail("notifications still pending")
+
+
+def _max_in_window(times, window: float) -> int:
+    times = sorted(times)
+    start, most = 0, 0
+    for end, moment in enumerate(times):
+        while moment - times[start] >= window:
+            start += 1
+        most = max(most, end - start + 1)
+    return most
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    def limits(global_rate: float, chat_rate: float):
+        monkeypatch.setattr(settings, "TELEGRAM_GLOBAL_RATE", global_rate)
+        monkeypatch.setattr(settings, "TELEGRAM_CHAT_RATE", chat_rate)
+        monkeypatch.setattr(settings, "NOTIFICATION_BATCH_SIZE", 50)
+        monkeypatch.setattr(notifications, "RETRY_BASE_DELAY", 0.05)
+
+    return limits
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_respects_limits_and_retries(sqlite_engine, limits, monkeypatch):
+    limits(global_rate=100, chat_rate=10)
+    sessions = session_factory(sqlite_engine)
+    monkeypatch.setattr(notifications, "AsyncSessionLocal", sessions)
+    chats = [f"chat-{i}" for i in range(20)] + [BLOCKED_CHAT, FLAKY_CHAT]
+    await _queue(sessions, chats, per_chat=5)
+    bot = FakeBotApi(flood_every=40)
+    dispatcher = _dispatcher(bot)
+
+    await _drain(dispatcher, sessions, timeout=30)
+    await dispatcher.stop()
+
+    async with sessions() as db:
+        rows = (await db.execute(
+            select(models.User.telegram_id, models.Notification)
+            .join(models.User, models.User.id == models.Notification.user_id)
+        )).all()
+    for chat_id, notification in rows:
+        if chat_id == BLOCKED_CHAT:
+            assert notification.status == "failed"
+            assert notification.error_message == "Forbidden: bot was blocked by the user"
+            assert notification.attempts == 1  # Not retried
+        else:
+            assert notification.status == "sent"
+            assert notification.sent_at is not None
+            assert notification.error_message is None
+    assert {chat_id: len(times) for chat_id, times in bot.delivered.items()} == {
+        chat_id: 5 for chat_id in chats if chat_id != BLOCKED_CHAT
+    }
+
+    # Token buckets: burst of one per chat, bursts of `rate` globally
+    for times in bot.delivered.values():
+        assert _max_in_window(times, 1 / 10 * 0.9) == 1
+    every_request = [moment for times in bot.delivered.values() for moment in times]
+    assert _max_in_window(every_request, 0.5) <= 100 + 50 + 1
+
+
+@pytest.mark.asyncio
+async def test_busy_chats_do_not_hold_global_tokens(limits):
+    # Messages queued behind busy chats must not take global tokens while they
+    # wait, or they fire together with newer messages once their chats free up
+    limits(global_rate=200, chat_rate=20)
+    bot = FakeBotApi()
+    dispatcher = _dispatcher(bot)
+    busy = [Outgoing(n, f"busy-{n % 5}", "-", 1) for n in range(400)]
+    others = [Outgoing(1000 + n, f"chat-{n}", "-", 1) for n in range(800)]
+    await asyncio.gather(*(dispatcher.send(message) for message in busy + others))
+    await dispatcher.stop()
+
+    every_request = [moment for times in bot.delivered.values() for moment in times]
+    assert len(every_request) == 1200
+    assert _max_in_window(every_request, 3.0) <= 3 * 200 + 200
+    # Per second rather than per gap: with 1200 tasks on the loop a single
+    # delivery can be noticed a few ms late, which shortens the gap after it
+    for chat_id in (f"busy-{n}" for n in range(5)):
+        assert _max_in_window(bot.delivered[chat_id], 1.0) <= 20 + 1
+
+
+@pytest.mark.asyncio
+async def test_batch_hands_back_what_it_cannot_send_in_time(sqlite_engine, limits, monkeypatch):
+    # A batch running past STALE_SENDING_AFTER would be claimed and sent twice
+    limits(global_rate=100, chat_rate=5)
+    monkeypatch.setattr(notifications, "SEND_BUDGET", 0.7)
+    sessions = session_factory(sqlite_engine)
+    monkeypatch.setattr(notifications, "AsyncSessionLocal", sessions)
+    await _queue(sessions, ["chat"], per_chat=10)
+    bot = FakeBotApi()
+    dispatcher = _dispatcher(bot)
+
+    assert await dispatcher.dispatch_batch() == 10
+    async with sessions() as db:
+        rows = (await db.execute(select(models.Notification))).scalars().all()
+    sent = [row for row in rows if row.status == "sent"]
+    assert len(sent) == len(bot.delivered["chat"]) == 4  # At 0, 0.2, 0.4 and 0.6 s
+    for row in rows:
+        if row.status != "sent":
+            assert (row.status, row.attempts, row.error_message) == ("pending", 0, None)
+
+    await _drain(dispatcher, sessions, timeout=10)
+    await dispatcher.stop()
+    assert len(bot.delivered["chat"]) == 10
+
+
+@pytest.mark.asyncio
+async def test_only_telegram_templates_can_be_sent(sqlite_engine):
+    sessions = session_factory(sqlite_engine)
+    async with sessions() as db:
+        db.add(models.NotificationTemplate(id=1, name="promo", message="Hi", type="promotional", channel="sms"))
+        db.add(models.User(id=1, telegram_id="1", bonus_balance=Decimal("0")))
+        await db.commit()
+
+    async def session():
+        async with sessions() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(notifications_router.router, prefix="/api/v1")
+    app.dependency_overrides[get_db] = session
+    app.dependency_overrides[require_staff] = lambda: Caller(is_staff=True)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        send = await client.post("/api/v1/notifications/send/", json={"template_id": 1, "user_ids": [1]})
+        broadcast = await client.post("/api/v1/notifications/broadcasts/", json={"template_id": 1})
+    for response in (send, broadcast):
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Only telegram templates can be sent, not sms"
+    async with sessions() as db:
+        assert (await db.execute(select(models.Notification.id))).first() is None
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_dispatcher_throughput(pg_engine, limits, monkeypatch, report):
+    sessions = session_factory(pg_engine)
+    monkeypatch.setattr(notifications, "AsyncSessionLocal", sessions)
+    global_rate, chat_rate = settings.TELEGRAM_GLOBAL_RATE, settings.TELEGRAM_CHAT_RATE
+
+    # Unlimited: what the claim / send / record cycle itself costs
+    limits(global_rate=1e9, chat_rate=1e9)
+    await _queue(sessions, [str(i) for i in range(BENCHMARK_NOTIFICATIONS)], per_chat=1)
+    bot = FakeBotApi()
+    dispatcher = _dispatcher(bot)
+    started = time.perf_counter()
+    await _drain(dispatcher, sessions, timeout=600)
+    elapsed = time.perf_counter() - started
+    await dispatcher.stop()
+    report("unlimited: %d notifications in %.1f s, %.0f/s", BENCHMARK_NOTIFICATIONS, elapsed, BENCHMARK_NOTIFICATIONS / elapsed)
+
+    # Telegram's limits with occasional flood control: the rate should stay just below 30/s
+    limits(global_rate=global_rate, chat_rate=chat_rate)
+    await _queue(sessions, [f"limited-{i}" for i in range(300)], per_chat=1)
+    bot = FakeBotApi(flood_every=100)
+    dispatcher = _dispatcher(bot)
+    started = time.perf_counter()
+    await _drain(dispatcher, sessions, timeout=600)
+    elapsed = time.perf_counter() - started
+    await dispatcher.stop()
+    report("limited to %.0f/s: 300 notifications at %.1f/s", settings.TELEGRAM_GLOBAL_RATE, 300 / elapsed)
+    every_request = [moment for times in bot.delivered.values() for moment in times]
+    assert _max_in_window(every_request, 1.0) <= 2 * settings.TELEGRAM_GLOBAL_RATE
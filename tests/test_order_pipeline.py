@@ -0,0 +1,171 @@
+import asyncio
+import time
+from decimal import Decimal
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, func, select, update
+
+from backend import models, schemas
+from backend.schemas.order import OrderItemCreate
+from backend.utils import order_numbers as order_numbers_module
+from backend.utils import order_pipeline
+from backend.utils.menu_cache import menu_cache
+from backend.utils.order_numbers import OrderNumberAllocator
+
+from .database import session_factory
+
+PRODUCTS = 50
+PRICE = 250.0
+USERS = 100
+ORDERS = 2000
+CONCURRENCY = 16
+
+
+@pytest_asyncio.fixture
+async def shop(pg_engine, monkeypatch):
+    sessions = session_factory(pg_engine)
+    async with sessions() as db:
+        category = models.Category(name="Pizza")
+        db.add(category)
+        await db.flush()
+        products = [
+            models.Product(category_id=category.id, name=f"Pizza {i}", price=Decimal(str(PRICE)))
+            for i in range(PRODUCTS)
+        ]
+        users = [models.User(telegram_id=str(i), bonus_balance=Decimal("0")) for i in range(USERS)]
+        db.add_all(products + users)
+        await db.commit()
+        product_ids = [product.id for product in products]
+        user_ids = [user.id for user in users]
+
+    monkeypatch.setattr(order_numbers_module, "engine", pg_engine)
+    monkeypatch.setattr(order_pipeline, "order_numbers", OrderNumberAllocator(block_size=100))
+    menu_cache.invalidate()
+    yield sessions, user_ids, product_ids
+    menu_cache.invalidate()
+
+
+@pytest.fixture
+def statements(pg_engine):
+    executed = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(pg_engine.sync_engine, "before_cursor_execute", count)
+    yield executed
+    event.remove(pg_engine.sync_engine, "before_cursor_execute", count)
+
+
+def _checkout(user_id: int, product_ids, bonus_used: float = 0.0) -> schemas.OrderCreate:
+    total = PRICE * len(product_ids)
+    return schemas.OrderCreate(
+        user_id=user_id,
+        order_type="pickup",
+        total_amount=total,
+        bonus_used=bonus_used,
+        final_amount=total - bonus_used,
+        payment_method="cash",
+        order_items=[OrderItemCreate(product_id=product_id, quantity=1, price=PRICE) for product_id in product_ids],
+    )
+
+
+async def _place(sessions, order: schemas.OrderCreate) -> models.Order:
+    async with sessions() as db:
+        return await order_pipeline.create_order(db, order)
+
+
+def _tables(executed) -> list:
+    # "INSERT INTO orders ..." -> "INSERT orders", "SELECT pg_notify(..." -> "SELECT pg_notify"
+    kinds = []
+    for statement in executed:
+        words = statement.replace("(", " ").split()
+        if words[0] in ("INSERT", "UPDATE"):
+            kinds.append(f"{words[0]} {words[2] if words[0] == 'INSERT' else words[1]}")
+        elif words[0] == "WITH":
+            kinds.append("bonus ledger")
+        else:
+            kinds.append(" ".join(words[:2]))
+    return kinds
+
+
+PLAIN_CHECKOUT = [
+    "INSERT orders", "INSERT order_items", "INSERT order_status_history", "UPDATE users",
+    "INSERT order_rollups", "INSERT user_rollups", "SELECT pg_notify",
+]
+
+
+@pytest.mark.asyncio
+async def test_round_trips_do_not_grow_with_items(shop, statements, report):
+    sessions, user_ids, product_ids = shop
+    customer, referrer = user_ids[:2]
+    await _place(sessions, _checkout(customer, product_ids[:2]))  # Loads the menu, reserves numbers
+
+    async def count(**checkout) -> dict:
+        counts = {}
+        for items in (2, 10, PRODUCTS):
+            statements.clear()
+            await _place(sessions, _checkout(customer, product_ids[:items], **checkout))
+            counts[items] = _tables(statements)
+        return counts
+
+    plain = await count()
+    async with sessions() as db:
+        await db.execute(update(models.User).where(models.User.id == customer).values(bonus_balance=1000))
+        await db.commit()
+    with_bonuses = await count(bonus_used=100)
+    async with sessions() as db:
+        await db.execute(update(models.User).where(models.User.id == customer).values(referred_by=referrer))
+        await db.commit()
+    referred = await count(bonus_used=100)
+    report(
+        "statements per order: %d plain, %d paying with bonuses, %d referred and paying with bonuses",
+        len(plain[2]), len(with_bonuses[2]), len(referred[2]),
+    )
+
+    bonus_checkout = PLAIN_CHECKOUT[:3] + ["bonus ledger"] + PLAIN_CHECKOUT[3:]
+    referred_checkout = bonus_checkout[:5] + ["UPDATE referral_stats"] + bonus_checkout[5:]
+    for items in (2, 10, PRODUCTS):
+        assert plain[items] == PLAIN_CHECKOUT
+        assert with_bonuses[items] == bonus_checkout
+        assert referred[items] == referred_checkout
+
+    placed = 1 + 3 * 3
+    async with sessions() as db:
+        items = (await db.execute(select(func.count()).select_from(models.OrderItem))).scalar_one()
+        user = await db.get(models.User, customer)
+    assert items == 2 + 3 * (2 + 10 + PRODUCTS)
+    assert user.order_count == placed
+    assert user.bonus_balance == Decimal("1000") - 6 * 100
+    assert user.total_spent == Decimal(str(PRICE * (2 + 3 * (2 + 10 + PRODUCTS)) - 6 * 100))
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_checkout_throughput(shop, statements, report):
+    sessions, user_ids, product_ids = shop
+    await _place(sessions, _checkout(user_ids[0], product_ids[:2]))
+    statements.clear()
+
+    orders = [
+        _checkout(user_ids[i % USERS], product_ids[i % 40:i % 40 + 2 + i % 8])
+        for i in range(ORDERS)
+    ]
+    queue = iter(orders)
+
+    async def worker():
+        for order in queue:
+            await _place(sessions, order)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(CONCURRENCY)])
+    elapsed = time.perf_counter() - started
+
+    report(
+        "%d orders, %d concurrent checkouts: %.0f orders/s, %.2f statements per order",
+        ORDERS, CONCURRENCY, ORDERS / elapsed, len(statements) / ORDERS,
+    )
+    async with sessions() as db:
+        count = (await db.execute(select(func.count()).select_from(models.Order))).scalar_one()
+    assert count == ORDERS + 1
@@ -0,0 +1,151 @@
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from backend import models
+from backend.models.order import OrderStatus
+from backend.utils.bonus_rules import bonus_rules
+from backend.utils.order_status import TRANSITIONS, InvalidTransition, StatusChange, apply_changes, check_transition
+
+from .database import session_factory
+
+ALLOWED = {
+    (OrderStatus.PENDING, OrderStatus.CONFIRMED), (OrderStatus.PENDING, OrderStatus.CANCELLED),
+    (OrderStatus.CONFIRMED, OrderStatus.PREPARING), (OrderStatus.CONFIRMED, OrderStatus.CANCELLED),
+    (OrderStatus.PREPARING, OrderStatus.READY), (OrderStatus.PREPARING, OrderStatus.CANCELLED),
+    (OrderStatus.READY, OrderStatus.ON_THE_WAY), (OrderStatus.READY, OrderStatus.DELIVERED),
+    (OrderStatus.READY, OrderStatus.CANCELLED),
+    (OrderStatus.ON_THE_WAY, OrderStatus.DELIVERED), (OrderStatus.ON_THE_WAY, OrderStatus.CANCELLED),
+    (OrderStatus.DELIVERED, OrderStatus.REFUNDED), (OrderStatus.CANCELLED, OrderStatus.REFUNDED),
+}
+
+
+def test_transitions_cover_every_status():
+    assert set(TRANSITIONS) == set(OrderStatus)
+    assert {(old, new) for old, moves in TRANSITIONS.items() for new in moves} == ALLOWED
+
+
+@pytest.mark.parametrize("old", list(OrderStatus))
+@pytest.mark.parametrize("new", list(OrderStatus))
+def test_check_transition(old, new):
+    order = SimpleNamespace(order_number="T-1", status=old, order_type="delivery")
+    if (old, new) in ALLOWED:
+        check_transition(order, new)
+    else:
+        with pytest.raises(InvalidTransition, match=f"from {old.value} to {new.value}"):
+            check_transition(order, new)
+
+
+def test_only_delivery_orders_go_on_the_way():
+    order = SimpleNamespace(order_number="T-1", status=OrderStatus.READY, order_type="pickup")
+    with pytest.raises(InvalidTransition, match="not a delivery order"):
+        check_transition(order, OrderStatus.ON_THE_WAY)
+
+
+async def _create_orders(sessions):
+    async with sessions() as db:
+        db.add(models.BonusProgram(
+            id=1, name="5% back", type="order_percent", value=Decimal("5"), is_active=True,
+        ))
+        # 150 was spent on the cancelled order already
+        user = models.User(telegram_id="1", bonus_balance=Decimal("50"))
+        db.add(user)
+        await db.flush()
+        orders = {}
+        for number, (status, order_type, total, bonus_used) in {
+            "delivered": (OrderStatus.ON_THE_WAY, "delivery", 2000, 0),
+            "cancelled": (OrderStatus.PREPARING, "pickup", 1000, 150),
+            "confirmed": (OrderStatus.PENDING, "pickup", 500, 0),
+        }.items():
+            order = models.Order(
+                user_id=user.id, order_number=number, status=status, order_type=order_type,
+                total_amount=Decimal(total), bonus_used=Decimal(bonus_used), final_amount=Decimal(total - bonus_used),
+                payment_method="cash",
+            )
+            db.add(order)
+            orders[number] = order
+        await db.commit()
+    bonus_rules.invalidate()
+    return user.id, {number: order.id for number, order in orders.items()}
+
+
+async def _state(sessions):
+    async with sessions() as db:
+        statuses = dict((await db.execute(select(models.Order.order_number, models.Order.status))).all())
+        history = (await db.execute(
+            select(models.OrderStatusHistory.order_id, models.OrderStatusHistory.status, models.OrderStatusHistory.changed_by)
+            .order_by(models.OrderStatusHistory.order_id)
+        )).all()
+        transactions = (await db.execute(
+            select(models.BonusTransaction.order_id, models.BonusTransaction.transaction_type, models.BonusTransaction.amount)
+            .order_by(models.BonusTransaction.order_id)
+        )).all()
+        balance = (await db.execute(select(models.User.bonus_balance))).scalar_one()
+    return statuses, history, transactions, balance
+
+
+@pytest.mark.asyncio
+async def test_batch_is_all_or_nothing(pg_engine):
+    sessions = session_factory(pg_engine)
+    _, order_ids = await _create_orders(sessions)
+    before = await _state(sessions)
+
+    async with sessions() as db:
+        with pytest.raises(InvalidTransition, match="can't go from pending to delivered"):
+            await apply_changes(db, [
+                StatusChange(order_ids["delivered"], OrderStatus.DELIVERED),
+                StatusChange(order_ids["cancelled"], OrderStatus.CANCELLED),
+                StatusChange(order_ids["confirmed"], OrderStatus.DELIVERED),
+            ])
+        await db.rollback()
+    async with sessions() as db:
+        with pytest.raises(InvalidTransition, match="Order 999999 not found"):
+            await apply_changes(db, [StatusChange(order_ids["delivered"], OrderStatus.DELIVERED), StatusChange(999999, OrderStatus.CANCELLED)])
+        await db.rollback()
+
+    assert await _state(sessions) == before
+    assert before[1:] == ([], [], Decimal("50.00"))
+
+
+@pytest.mark.asyncio
+async def test_delivery_earns_and_cancellation_returns_bonuses(pg_engine):
+    sessions = session_factory(pg_engine)
+    _, order_ids = await _create_orders(sessions)
+
+    async with sessions() as db:
+        events = await apply_changes(db, [
+            StatusChange(order_ids["delivered"], OrderStatus.DELIVERED),
+            StatusChange(order_ids["cancelled"], OrderStatus.CANCELLED, comment="Out of dough"),
+            StatusChange(order_ids["confirmed"], OrderStatus.CONFIRMED),
+        ], changed_by=42)
+        await db.commit()
+    assert [(event.order_id, event.status) for event in events] == [
+        (order_ids["delivered"], "delivered"), (order_ids["cancelled"], "cancelled"), (order_ids["confirmed"], "confirmed"),
+    ]
+
+    statuses, history, transactions, balance = await _state(sessions)
+    assert statuses == {
+        "delivered": OrderStatus.DELIVERED, "cancelled": OrderStatus.CANCELLED, "confirmed": OrderStatus.CONFIRMED,
+    }
+    assert history == [
+        (order_ids["delivered"], OrderStatus.DELIVERED, 42),
+        (order_ids["cancelled"], OrderStatus.CANCELLED, 42),
+        (order_ids["confirmed"], OrderStatus.CONFIRMED, 42),
+    ]
+    # 5% of the delivered 2000, and the 150 spent on the cancelled order back
+    assert transactions == [
+        (order_ids["delivered"], "earned", Decimal("100.00")),
+        (order_ids["cancelled"], "returned", Decimal("150.00")),
+    ]
+    assert balance == Decimal("300.00")
+
+    # Refunding a delivered order is allowed, delivering it twice is not
+    async with sessions() as db:
+        with pytest.raises(InvalidTransition):
+            await apply_changes(db, [StatusChange(order_ids["delivered"], OrderStatus.DELIVERED)])
+        await db.rollback()
+        await apply_changes(db, [StatusChange(order_ids["delivered"], OrderStatus.REFUNDED)])
+        await db.commit()
+    assert (await _state(sessions))[0]["delivered"] == OrderStatus.REFUNDED
@@ -0,0 +1,169 @@
+import ipaddress
+import json
+import random
+import statistics
+import time
+from decimal import Decimal
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import select
+
+from backend import models
+from backend.api.routers import payments
+from backend.models.payment import PaymentMethod, PaymentStatus
+from backend.utils import payment_events as payment_events_module
+from backend.utils.payment_events import PaymentEventQueue
+from backend.utils.yookassa import YooKassaError, yookassa_client
+
+from .database import session_factory
+
+PAYMENTS = 50
+RETRIES = 4  # YooKassa repeats a notification until it gets a 200
+
+
+class FakeYooKassa:
+    """Local stand-in for the YooKassa API: GET /payments/{id} and /refunds/{id}."""
+
+    def __init__(self):
+        self.payments = {}
+        self.refunds = {}
+        self.down = False
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if self.down:
+            return httpx.Response(503)
+        kind, _, object_id = request.url.path.rpartition("/")
+        objects = self.refunds if kind.endswith("/refunds") else self.payments
+        if object_id not in objects:
+            return httpx.Response(404, json={"description": "Not found"})
+        return httpx.Response(200, json=objects[object_id])
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    fake = FakeYooKassa()
+    client = httpx.AsyncClient(base_url="https://yookassa.test/v3", transport=httpx.MockTransport(fake.handler))
+    monkeypatch.setattr(yookassa_client, "_client", client)
+    monkeypatch.setattr(yookassa_client, "_status_cache", {})
+    yield fake
+    yookassa_client._client = None
+    yookassa_client.breaker.record_success()
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch, sqlite_engine):
+    queue = PaymentEventQueue(str(tmp_path / "spool"))
+    monkeypatch.setattr(payments, "payment_events", queue)
+    monkeypatch.setattr(payment_events_module, "AsyncSessionLocal", session_factory(sqlite_engine))
+    yield queue
+    queue.writer.close()
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(payments.router, prefix="/api/v1")
+    return app
+
+
+def _notification(event: str, payment_object: dict) -> bytes:
+    return json.dumps({"type": "notification", "event": event, "object": payment_object}).encode()
+
+
+async def _create_payments(sessions, count: int):
+    async with sessions() as db:
+        user = models.User(telegram_id="1", bonus_balance=Decimal("0"))
+        db.add(user)
+        await db.flush()
+        for i in range(1, count + 1):
+            order = models.Order(
+                user_id=user.id, order_number=f"T-{i}", order_type="pickup", total_amount=Decimal("100"),
+                final_amount=Decimal("100"), payment_method="yookassa", payment_status="pending",
+            )
+            db.add(order)
+            await db.flush()
+            db.add(models.Payment(
+                order_id=order.id, user_id=user.id, payment_method=PaymentMethod.YOOKASSA,
+                payment_provider="yookassa", provider_payment_id=f"pay-{i}", amount=Decimal("100.00"),
+                status=PaymentStatus.PENDING,
+            ))
+        await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_replayed_webhooks_apply_once(sqlite_engine, queue, provider, monkeypatch):
+    monkeypatch.setattr(payment_events_module, "WEBHOOK_SENDERS", [ipaddress.ip_network("127.0.0.0/8")])
+    sessions = session_factory(sqlite_engine)
+    await _create_payments(sessions, PAYMENTS + 3)
+    for i in range(1, PAYMENTS + 1):
+        provider.payments[f"pay-{i}"] = {"id": f"pay-{i}", "status": "succeeded", "amount": {"value": "100.00"}}
+    # Forged: the provider says the payment is still pending, or doesn't know
+    # it, or it was for a different amount
+    provider.payments[f"pay-{PAYMENTS + 1}"] = {"id": f"pay-{PAYMENTS + 1}", "status": "pending", "amount": {"value": "100.00"}}
+    provider.payments[f"pay-{PAYMENTS + 2}"] = {"id": f"pay-{PAYMENTS + 2}", "status": "succeeded", "amount": {"value": "1.00"}}
+
+    bodies = [
+        _notification("payment.succeeded", {"id": f"pay-{i}", "amount": {"value": "100.00"}})
+        for i in range(1, PAYMENTS + 4)
+        for _ in range(RETRIES)
+    ]
+    random.Random(1).shuffle(bodies)
+
+    latencies = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=_app()), base_url="http://test") as client:
+        for body in bodies:
+            started = time.perf_counter()
+            response = await client.post("/api/v1/payments/yookassa/webhook/", content=body)
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200
+
+    # Acknowledged without touching the database: only the spool append
+    assert statistics.median(latencies) < 0.010
+
+    await queue.drain()
+    await queue.drain()  # Nothing left: replaying the spool again changes nothing
+
+    async with sessions() as db:
+        statuses = dict((await db.execute(select(models.Payment.provider_payment_id, models.Payment.status))).all())
+        transactions = (await db.execute(select(models.Transaction))).scalars().all()
+        paid = (await db.execute(
+            select(models.Order.order_number).where(models.Order.payment_status == "paid")
+        )).scalars().all()
+    assert [statuses[f"pay-{i}"] for i in range(1, PAYMENTS + 1)] == [PaymentStatus.SUCCEEDED] * PAYMENTS
+    assert statuses[f"pay-{PAYMENTS + 1}"] == PaymentStatus.PENDING
+    assert statuses[f"pay-{PAYMENTS + 2}"] == PaymentStatus.PENDING
+    assert statuses[f"pay-{PAYMENTS + 3}"] == PaymentStatus.PENDING
+    assert len(paid) == PAYMENTS
+    assert len(transactions) == PAYMENTS
+    assert {transaction.amount for transaction in transactions} == {Decimal("100.00")}
+
+
+@pytest.mark.asyncio
+async def test_unreachable_provider_keeps_events_spooled(sqlite_engine, queue, provider):
+    sessions = session_factory(sqlite_engine)
+    await _create_payments(sessions, 1)
+    await queue.enqueue(payment_events_module.parse_notification(
+        _notification("payment.succeeded", {"id": "pay-1", "amount": {"value": "100.00"}})
+    ))
+    provider.payments["pay-1"] = {"id": "pay-1", "status": "succeeded", "amount": {"value": "100.00"}}
+    provider.down = True
+
+    with pytest.raises(YooKassaError):
+        await queue.drain()
+
+    provider.down = False
+    assert await queue.drain() == 1
+    async with sessions() as db:
+        status = (await db.execute(select(models.Payment.status))).scalar_one()
+    assert status == PaymentStatus.SUCCEEDED
+
+
+@pytest.mark.asyncio
+async def test_webhook_rejects_unknown_senders(queue):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=_app()), base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/payments/yookassa/webhook/",
+            content=_notification("payment.succeeded", {"id": "pay-1", "amount": {"value": "100.00"}}),
+        )
+    assert response.status_code == 403
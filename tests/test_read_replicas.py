@@ -0,0 +1,124 @@
+from decimal import Decimal
+
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi import Depends, FastAPI, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from backend import database, models
+from backend.database import PRIMARY_COOKIE, ReplicaRouter, get_read_db, stick_to_primary
+
+from .database import create_database, session_factory
+
+
+async def _database(path, name: str):
+    engine = await create_database(f"sqlite+aiosqlite:///{path}")
+    async with session_factory(engine)() as db:
+        db.add(models.User(telegram_id=name, bonus_balance=Decimal("0")))
+        await db.commit()
+    return engine
+
+
+@pytest_asyncio.fixture
+async def engines(tmp_path):
+    pytest.importorskip("aiosqlite")
+    primary = await _database(tmp_path / "primary.db", "primary")
+    replica = await _database(tmp_path / "replica.db", "replica")
+    # The directory doesn't exist, so every connection attempt fails
+    unreachable = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    yield primary, replica, unreachable
+    for engine in (primary, replica, unreachable):
+        await engine.dispose()
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/source/")
+    async def source(db: AsyncSession = Depends(get_read_db)):
+        return (await db.execute(select(models.User.telegram_id))).scalar_one()
+
+    @app.post("/write/")
+    async def write(response: Response):
+        stick_to_primary(response)
+        return {}
+
+    return app
+
+
+async def _read(cookies=None) -> str:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=_app()), base_url="http://test") as client:
+        response = await client.get("/source/", cookies=cookies)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture
+def route(engines, monkeypatch):
+    primary, _, _ = engines
+
+    def route(replicas):
+        router = ReplicaRouter(replicas, retry_after=30)
+        monkeypatch.setattr(database, "AsyncSessionLocal", session_factory(primary))
+        monkeypatch.setattr(database, "replica_router", router)
+        monkeypatch.setattr(database, "replica_engines", replicas)
+        return router
+
+    return route
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_the_replica(engines, route):
+    _, replica, _ = engines
+    route([replica])
+    assert await _read() == "replica"
+
+
+@pytest.mark.asyncio
+async def test_reads_fall_back_to_the_primary(engines, route):
+    route([])
+    assert await _read() == "primary"
+
+    _, _, unreachable = engines
+    router = route([unreachable])
+    assert await _read() == "primary"
+    assert router._down_until[0] > 0
+
+
+@pytest.mark.asyncio
+async def test_unreachable_replica_is_skipped_until_retry(engines, route):
+    _, replica, unreachable = engines
+    router = route([unreachable, replica])
+    attempts = []
+    broken = router._factories[0]
+    router._factories[0] = lambda: attempts.append(1) or broken()
+
+    assert [await _read() for _ in range(4)] == ["replica"] * 4
+    assert len(attempts) == 1  # Marked down after the first failure
+
+    router._down_until[0] = 0  # retry_after has passed
+    assert [await _read() for _ in range(2)] == ["replica"] * 2
+    assert len(attempts) == 2
+
+
+@pytest.mark.asyncio
+async def test_writes_make_the_client_read_from_the_primary(engines, route):
+    _, replica, _ = engines
+    route([replica])
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=_app()), base_url="http://test") as client:
+        response = await client.post("/write/")
+    assert PRIMARY_COOKIE in response.cookies
+
+    assert await _read({PRIMARY_COOKIE: "1"}) == "primary"
+    assert await _read() == "replica"
+
+
+@pytest.mark.asyncio
+async def test_no_sticky_cookie_without_replicas(route):
+    route([])
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=_app()), base_url="http://test") as client:
+        response = await client.post("/write/")
+    assert PRIMARY_COOKIE not in response.cookies
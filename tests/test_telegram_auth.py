@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import urlencode
+
+import pytest
+from sqlalchemy import func, select
+
+from backend import models
+from backend.utils import telegram_auth
+from backend.utils.bonus_rules import bonus_rules
+from backend.utils.telegram_auth import InitDataError, UserResolver, VerifiedInitDataCache, verify_init_data
+
+from .database import session_factory
+
+BOT_TOKEN = "123456:test-bot-token"
+MAX_AGE = 3600
+
+
+def _init_data(bot_token: str = BOT_TOKEN, auth_date: int = None, **fields) -> str:
+    # Signed the way Telegram signs Mini App initData
+    fields = {
+        "auth_date": str(auth_date if auth_date is not None else int(time.time())),
+        "user": json.dumps({"id": 42, "first_name": "Ann", "username": "ann"}),
+        **fields,
+    }
+    data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def test_valid_init_data_is_accepted():
+    user = verify_init_data(_init_data(start_param="REF1", auth_date=1000), BOT_TOKEN, MAX_AGE, now=1000 + MAX_AGE)
+    assert (user.telegram_id, user.username, user.first_name, user.last_name) == ("42", "ann", "Ann", None)
+    assert (user.start_param, user.auth_date) == ("REF1", 1000)
+
+
+@pytest.mark.parametrize("init_data,error", [
+    (_init_data(bot_token="654321:other-bot"), "Invalid init data signature"),
+    (_init_data().replace("ann", "eve"), "Invalid init data signature"),
+    (_init_data() + "&start_param=REF1", "Invalid init data signature"),  # Field added after signing
+    (urlencode({"auth_date": "1", "user": "{}"}), "Init data is not signed"),
+    (_init_data(auth_date=1000), "Init data expired"),
+    (_init_data(user="not json"), "Malformed init data"),
+])
+def test_forged_or_expired_init_data_is_rejected(init_data, error):
+    with pytest.raises(InitDataError, match=error):
+        verify_init_data(init_data, BOT_TOKEN, MAX_AGE, now=1000 + MAX_AGE + 1)
+
+
+def test_empty_bot_token_rejects_everything():
+    # With an empty key anyone could compute a valid signature
+    with pytest.raises(InitDataError, match="Bot token is not configured"):
+        verify_init_data(_init_data(bot_token=""), "", MAX_AGE)
+
+
+def test_cache_entries_expire_with_the_init_data():
+    cache = VerifiedInitDataCache(size=10)
+    key = cache.key(_init_data())
+    cache.put(key, 7, expires_at=100)
+    assert cache.get(key, now=99) == 7
+    assert cache.get(key, now=100) is None
+    assert cache.get(key, now=99) is None  # Dropped on expiry
+    assert cache.get(cache.key(_init_data() + "&x=1"), now=0) is None
+
+
+def test_cache_evicts_the_least_recently_used_entry():
+    cache = VerifiedInitDataCache(size=2)
+    first, second, third = (cache.key(f"init-data-{n}") for n in range(3))
+    cache.put(first, 1, expires_at=100)
+    cache.put(second, 2, expires_at=100)
+    assert cache.get(first, now=0) == 1  # Now the most recently used
+    cache.put(third, 3, expires_at=100)
+    assert [cache.get(key, now=0) for key in (first, second, third)] == [1, None, 3]
+
+
+@pytest.fixture
+def sessions(pg_engine, monkeypatch):
+    sessions = session_factory(pg_engine)
+    monkeypatch.setattr(telegram_auth, "AsyncSessionLocal", sessions)
+    bonus_rules.invalidate()
+    return sessions
+
+
+async def _user_count(sessions) -> int:
+    async with sessions() as db:
+        return (await db.execute(select(func.count()).select_from(models.User))).scalar_one()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_first_visits_create_one_user(sessions):
+    telegram_user = verify_init_data(_init_data(), BOT_TOKEN, MAX_AGE)
+
+    # Same process: both requests wait for one batch
+    resolver = UserResolver(window=0.01, batch_size=100)
+    first, second = await asyncio.gather(resolver.resolve(telegram_user), resolver.resolve(telegram_user))
+    assert first == second
+    assert await _user_count(sessions) == 1
+    ann = first
+
+    # Two workers racing on another new user: the INSERT conflict is absorbed
+    other = verify_init_data(_init_data(user=json.dumps({"id": 43, "username": "bob"})), BOT_TOKEN, MAX_AGE)
+    first, second = await asyncio.gather(*[
+        UserResolver(window=0.01, batch_size=100).resolve(other) for _ in range(2)
+    ])
+    assert first == second != ann
+    assert await _user_count(sessions) == 2
@@ -0,0 +1,116 @@
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from backend.utils.templates import CompiledTemplate, TemplateCache, TemplateError, validate_template
+
+MESSAGE = (
+    "{first_name}, your order {order_number} is {status}. "
+    "To pay: {final_amount} RUB (delivery {delivery_cost}, bonuses {bonus_used}). "
+    "ETA {delivery_time} to {delivery_address_description}. {{Thank you}}!"
+)
+JINJA_MESSAGE = (
+    "{{ first_name }}, your order {{ order_number }} is {{ status }}. "
+    "To pay: {{ final_amount }} RUB (delivery {{ delivery_cost }}, bonuses {{ bonus_used }}). "
+    "ETA {{ delivery_time }} to {{ delivery_address_description }}. {Thank you}!"
+)
+BENCHMARK_CONTEXTS = 100_000
+
+
+def _context(i: int) -> dict:
+    return {
+        "first_name": f"Guest {i}",
+        "order_number": f"240517-{i:04d}",
+        "status": "confirmed",
+        "final_amount": 990.0 + i,
+        "delivery_cost": 150.0,
+        "bonus_used": 0.0,
+        "delivery_time": "19:30",
+        "delivery_address_description": "Lenina 1",
+    }
+
+
+def test_render_matches_str_format():
+    template = CompiledTemplate(MESSAGE)
+    contexts = [_context(i) for i in range(10)]
+    assert template.render_many(contexts) == [MESSAGE.format(**context) for context in contexts]
+
+
+def test_missing_and_none_values_render_empty():
+    template = CompiledTemplate("Hi {first_name} {last_name}, {{braces}} stay")
+    assert template.render({"first_name": "Ann", "last_name": None}) == "Hi Ann , {braces} stay"
+    assert template.render({}) == "Hi  , {braces} stay"
+
+
+@pytest.mark.parametrize("text", ["{first_name!r}", "{final_amount:.2f}", "{user.name}", "{0}", "{unclosed", "}"])
+def test_invalid_templates_are_rejected(text):
+    with pytest.raises(TemplateError):
+        CompiledTemplate(text)
+
+
+def test_placeholders_are_checked_against_the_template_type():
+    validate_template("order_status", "{first_name}", MESSAGE)
+    with pytest.raises(TemplateError, match="order_number"):
+        validate_template("promotional", "Hi {first_name}", "Order {order_number}")
+    with pytest.raises(TemplateError, match="Unknown template type"):
+        validate_template("newsletter", "Hi")
+
+
+def test_cache_recompiles_edited_templates():
+    cache = TemplateCache(size=2)
+    created = datetime(2024, 5, 17)
+    template = SimpleNamespace(id=1, title=None, message="Hi {first_name}", updated_at=created)
+    assert cache.render_many(template, [{"first_name": "Ann"}]) == [(None, "Hi Ann")]
+    assert cache.get(template) is cache.get(template)
+
+    edited = SimpleNamespace(id=1, title="{first_name}", message="Hello {first_name}", updated_at=created + timedelta(minutes=1))
+    assert cache.render_many(edited, [{"first_name": "Ann"}]) == [("Ann", "Hello Ann")]
+
+    cache.get(SimpleNamespace(id=2, title=None, message="", updated_at=created))
+    assert len(cache._entries) == 2  # The oldest entry was evicted
+
+
+def _per_render(function, count: int) -> float:
+    started = time.perf_counter()
+    function()
+    return (time.perf_counter() - started) / count
+
+
+@pytest.mark.benchmark
+def test_render_speed(report):
+    contexts = [_context(i) for i in range(BENCHMARK_CONTEXTS)]
+    cache = TemplateCache(size=16)
+    template = SimpleNamespace(id=1, title=None, message=MESSAGE, updated_at=datetime(2024, 5, 17))
+
+    def naive():
+        # What rendering looked like before: parse the text on every call
+        return [MESSAGE.format_map(defaultdict(str, context)) for context in contexts]
+
+    def compiled():
+        return cache.render_many(template, contexts)
+
+    assert [message for _, message in compiled()] == naive()
+    timings = {
+        "str.format_map": _per_render(naive, BENCHMARK_CONTEXTS),
+        "compiled": _per_render(compiled, BENCHMARK_CONTEXTS),
+    }
+
+    try:
+        import jinja2
+    except ImportError:
+        report("jinja2 is not installed, skipping it")
+    else:
+        few = contexts[:1000]
+        timings["jinja2, parsed per render"] = _per_render(
+            lambda: [jinja2.Template(JINJA_MESSAGE).render(context) for context in few], len(few)
+        )
+        jinja_template = jinja2.Template(JINJA_MESSAGE)
+        timings["jinja2, precompiled"] = _per_render(
+            lambda: [jinja_template.render(context) for context in contexts], BENCHMARK_CONTEXTS
+        )
+
+    for name, seconds in timings.items():
+        report("%-26s %8.2f us per render", name, seconds * 1e6)
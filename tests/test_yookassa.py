@@ -0,0 +1,135 @@
+import asyncio
+from collections import Counter
+
+import httpx
+import pytest
+
+from backend.config import settings
+from backend.utils.yookassa import CircuitBreaker, CircuitOpenError, YooKassaClient, YooKassaError
+
+RESET_TIMEOUT = 0.1
+
+
+class StubYooKassa:
+    """Local stand-in for GET /payments/{id} that can fail or hold requests."""
+
+    def __init__(self):
+        self.requests = Counter()  # payment id -> requests received
+        self.status = "pending"
+        self.response_code = 200
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        payment_id = request.url.path.rpartition("/")[2]
+        self.requests[payment_id] += 1
+        await self.release.wait()
+        if self.response_code != 200:
+            return httpx.Response(self.response_code, json={"description": "Stub error"})
+        return httpx.Response(200, json={"id": payment_id, "status": self.status})
+
+
+@pytest.fixture
+def stub():
+    return StubYooKassa()
+
+
+@pytest.fixture
+def client(stub, monkeypatch):
+    monkeypatch.setattr(settings, "YOOKASSA_STATUS_CACHE_TTL", 60.0)
+    client = YooKassaClient()
+    client.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=RESET_TIMEOUT)
+    client._client = httpx.AsyncClient(base_url="https://yookassa.test/v3", transport=httpx.MockTransport(stub.handler))
+    return client
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_share_one_request(client, stub):
+    stub.release.clear()
+    callers = [asyncio.create_task(client.get_payment("pay-1")) for _ in range(20)]
+    await asyncio.sleep(0.01)
+    callers[0].cancel()  # A client going away doesn't cancel the shared request
+    stub.release.set()
+    results = await asyncio.gather(*callers[1:])
+
+    assert stub.requests == {"pay-1": 1}
+    assert all(result == {"id": "pay-1", "status": "pending"} for result in results)
+    assert client._in_flight == {}
+
+
+@pytest.mark.asyncio
+async def test_status_is_cached_for_the_ttl(client, stub, monkeypatch):
+    await client.get_payment("pay-1")
+    stub.status = "succeeded"
+    assert (await client.get_payment("pay-1"))["status"] == "pending"
+    assert stub.requests["pay-1"] == 1
+
+    assert (await client.get_payment("pay-1", fresh=True))["status"] == "succeeded"
+    assert stub.requests["pay-1"] == 2
+
+    monkeypatch.setattr(settings, "YOOKASSA_STATUS_CACHE_TTL", 0.05)
+    stub.status = "canceled"
+    await client.get_payment("pay-2")
+    await asyncio.sleep(0.06)
+    await client.get_payment("pay-2")
+    assert stub.requests["pay-2"] == 2
+
+    client.forget("pay-1")
+    assert (await client.get_payment("pay-1"))["status"] == "canceled"
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_after_failures_and_closes_after_a_probe(client, stub):
+    stub.response_code = 404  # The request's fault: doesn't count
+    for _ in range(5):
+        with pytest.raises(YooKassaError, match="Stub error"):
+            await client.get_payment("pay-1")
+
+    stub.response_code = 503
+    for _ in range(3):
+        with pytest.raises(YooKassaError, match="HTTP 503"):
+            await client.get_payment("pay-1")
+    with pytest.raises(CircuitOpenError):
+        await client.get_payment("pay-1")
+    assert stub.requests["pay-1"] == 8  # The open circuit didn't call out
+
+    # A failed probe re-opens the circuit for another reset_timeout
+    await asyncio.sleep(RESET_TIMEOUT)
+    with pytest.raises(YooKassaError, match="HTTP 503"):
+        await client.get_payment("pay-1")
+    with pytest.raises(CircuitOpenError):
+        await client.get_payment("pay-1")
+
+    # While a probe is out, the other callers fail fast; its success closes
+    await asyncio.sleep(RESET_TIMEOUT)
+    stub.response_code = 200
+    stub.release.clear()
+    probe = asyncio.create_task(client.get_payment("pay-1"))
+    await asyncio.sleep(0.01)
+    with pytest.raises(CircuitOpenError):
+        await client.get_payment("pay-2")
+    stub.release.set()
+    await probe
+    assert (await client.get_payment("pay-2"))["status"] == "pending"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_does_not_keep_the_circuit_open(client, stub):
+    stub.response_code = 503
+    for _ in range(3):
+        with pytest.raises(YooKassaError):
+            await client.get_payment("pay-1", fresh=True)
+    await asyncio.sleep(RESET_TIMEOUT)
+
+    stub.response_code = 200
+    stub.release.clear()
+    probe = asyncio.create_task(client._request("GET", "/payments/pay-1"))
+    await asyncio.sleep(0.01)
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    # The next call probes right away instead of waiting another reset_timeout
+    stub.release.set()
+    assert (await client.get_payment("pay-1", fresh=True))["status"] == "pending"
+    assert client.breaker.opened_at is None